@@ -0,0 +1,46 @@
+"""
+Where the trading code keeps its per-run state.
+
+Inside the dashboard this is ``st.session_state``; the headless engine
+installs a plain StateDict instead, so autotrade/trailers/order helpers run
+the same way with or without a Streamlit script context.
+"""
+import threading
+
+import streamlit as st
+
+from log_store import new_channels
+
+
+class StateDict(dict):
+    """dict with attribute access, mirroring how st.session_state is used."""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        self[name] = value
+
+    @classmethod
+    def with_defaults(cls):
+        return cls(last_trade={}, autotrade={}, **new_channels())
+
+
+_override = None
+_lock = threading.Lock()
+
+
+def use_state(state):
+    """Install `state` process-wide (None goes back to st.session_state)."""
+    global _override
+    with _lock:
+        _override = state
+    return state
+
+
+def get_state():
+    """Active state object: the installed StateDict, or st.session_state."""
+    return _override if _override is not None else st.session_state
@@ -1,54 +1,88 @@
-import streamlit as st 
-from datetime import datetime
-from mt5_helpers import place_order_safe
-
-def run_autotrade(symbol, last_price, levels, lot_size, suggested_tp_points, point, default_tp_points, default_sl_points):
-    previous_state_key = f"prev_price_{symbol}"
-    prev_price = st.session_state.get(previous_state_key, None)
-    triggered = False
-
-    buy_level = levels["Buy1"]
-    sell_level = levels["PHH"] or levels["HH"]
-
-    # Debug log
-    st.session_state.autotrade_logs.append({
-        "time": datetime.now().strftime("%H:%M:%S"),
-        "msg": f"Check {symbol}: prev={prev_price}, last={last_price}, buy={buy_level}, sell={sell_level}",
-        "color": "yellow"
-    })
-
-    # ---------------- BUY condition ----------------
-    if buy_level is not None and prev_price is not None and prev_price <= buy_level and last_price > buy_level:
-        if st.session_state.last_trade.get(symbol) != "BUY":
-            tp_points_use = int(suggested_tp_points * 0.6) if suggested_tp_points and suggested_tp_points > 0 else int(default_tp_points or 50)
-            tp_price = last_price + tp_points_use * point
-
-            # ✅ place order WITHOUT SL
-            result = place_order_safe(symbol, lot_size, "BUY", 0, tp_price)
-            st.session_state.last_trade[symbol] = f"BUY @{last_price:.5f} TP={tp_points_use} pts"
-
-            st.session_state.execution_logs.append({
-                "time": datetime.now().strftime("%H:%M:%S"),
-                "msg": f"✅ BUY {symbol} @{last_price:.5f} TP={tp_points_use} pts",
-                "color": "blue"
-            })
-            triggered = True
-
-    # ---------------- SELL condition ----------------
-    if not triggered and sell_level is not None and prev_price is not None and prev_price >= sell_level and last_price < sell_level:
-        if st.session_state.last_trade.get(symbol) != "SELL":
-            tp_points_use = int(suggested_tp_points * 0.6) if suggested_tp_points and suggested_tp_points > 0 else int(default_tp_points or 50)
-            tp_price = last_price - tp_points_use * point
-
-            # ✅ place order WITHOUT SL
-            result = place_order_safe(symbol, lot_size, "SELL", 0, tp_price)
-            st.session_state.last_trade[symbol] = f"SELL @{last_price:.5f} TP={tp_points_use} pts"
-
-            st.session_state.execution_logs.append({
-                "time": datetime.now().strftime("%H:%M:%S"),
-                "msg": f"✅ SELL {symbol} @{last_price:.5f} TP={tp_points_use} pts",
-                "color": "red"
-            })
-
-    # Save current price for next tick
-    st.session_state[previous_state_key] = last_price
+from datetime import datetime
+import numpy as np
+from app_state import get_state
+from order_pipeline import submit_order
+
+# Share of the suggested TP distance (Buy1 -> Resistance1) used for crossing orders
+TP_RATIO = 0.6
+
+def suggest_tp_points(levels, point):
+    """Full TP distance in points (Buy1 -> Resistance1), None when it can't be computed."""
+    if levels.get("Resistance1") is None or levels.get("Buy1") is None or not point:
+        return None
+    return abs(levels["Resistance1"] - levels["Buy1"]) / point
+
+def detect_cross(prev_price, last_price, levels):
+    """'BUY' when price crosses Buy1 upward, 'SELL' when it crosses PHH (or HH) downward, else None."""
+    if prev_price is None:
+        return None
+    buy_level = levels["Buy1"]
+    sell_level = levels["PHH"] or levels["HH"]
+    if buy_level is not None and prev_price <= buy_level and last_price > buy_level:
+        return "BUY"
+    if sell_level is not None and prev_price >= sell_level and last_price < sell_level:
+        return "SELL"
+    return None
+
+def detect_cross_batch(prev_price, last_price, buy_level, sell_level):
+    """
+    detect_cross over arrays: +1 for BUY, -1 for SELL, 0 for none per element.
+    `sell_level` is PHH where it exists, else HH; NaN levels never trigger.
+    """
+    buy = (prev_price <= buy_level) & (last_price > buy_level)
+    sell = (prev_price >= sell_level) & (last_price < sell_level)
+    return np.where(buy, 1, np.where(sell, -1, 0)).astype(np.int8)
+
+def signal_key(symbol, side, levels):
+    """Idempotency key of a crossing: the same level crossed the same way is one signal."""
+    level = levels["Buy1"] if side == "BUY" else (levels["PHH"] or levels["HH"])
+    return f"cross:{symbol}:{side}:{level:.10g}"
+
+def execute_signal(symbol, side, last_price, lot_size, suggested_tp_points, point, default_tp_points, key=None):
+    """Queue the market order for a level crossing (TP at TP_RATIO of the suggested distance, no SL)."""
+    state = get_state()
+    if state.last_trade.get(symbol) == side:
+        return None
+
+    tp_points_use = int(suggested_tp_points * TP_RATIO) if suggested_tp_points and suggested_tp_points > 0 else int(default_tp_points or 50)
+    tp_price = last_price + tp_points_use * point if side == "BUY" else last_price - tp_points_use * point
+
+    # ✅ place order WITHOUT SL
+    ticket, is_new = submit_order(state, symbol, side, lot_size, 0, tp_price, key=key)
+    if not is_new:
+        return ticket
+    state.last_trade[symbol] = f"{side} @{last_price:.5f} TP={tp_points_use} pts"
+
+    state.execution_logs.append({
+        "time": datetime.now().strftime("%H:%M:%S"),
+        "msg": f"✅ {side} {symbol} @{last_price:.5f} TP={tp_points_use} pts",
+        "color": "blue" if side == "BUY" else "red",
+        "symbol": symbol
+    })
+    return ticket
+
+def run_autotrade(symbol, last_price, levels, lot_size, suggested_tp_points, point, default_tp_points, default_sl_points):
+    state = get_state()
+    previous_state_key = f"prev_price_{symbol}"
+    prev_price = state.get(previous_state_key, None)
+
+    buy_level = levels["Buy1"]
+    sell_level = levels["PHH"] or levels["HH"]
+
+    # Debug log
+    state.autotrade_logs.append({
+        "time": datetime.now().strftime("%H:%M:%S"),
+        "msg": f"Check {symbol}: prev={prev_price}, last={last_price}, buy={buy_level}, sell={sell_level}",
+        "color": "yellow",
+        "symbol": symbol,
+        "level": "debug"
+    })
+
+    # ---------------- BUY / SELL crossing ----------------
+    side = detect_cross(prev_price, last_price, levels)
+    if side is not None:
+        execute_signal(symbol, side, last_price, lot_size, suggested_tp_points, point, default_tp_points,
+                       key=signal_key(symbol, side, levels))
+
+    # Save current price for next tick
+    state[previous_state_key] = last_price
@@ -0,0 +1,481 @@
+"""
+Historical backtester for the level strategies and the trailers.
+
+Replays bars (or ticks) through the same rules that trade live:
+
+- levels: ``levels.rolling_levels`` gives every bar the levels
+  ``analyze_symbol`` would compute over the last `window` bars;
+- entries: ``autotrade.detect_cross_batch`` (the run_autotrade crossing
+  rule, TP at TP_RATIO of ``suggest_tp_points``) or the SimpleAutoTrader
+  conditions, with the order pipeline's idempotency keys and dedupe window;
+- stops: ``candle_trail_sl`` / ``atr_trail_sl``, the pure rules behind
+  CandleTrailingStop and ATRTrailingStop.
+
+Levels and signals are computed for the whole history in vectorized
+passes. Each position's exit is then found on its own when it opens: with
+fixed stops one scan for the first bar that reaches SL/TP, with a trailer a
+scan that holds SL fixed up to the first bar whose close moves it, applies
+the move and carries on; the event loop only visits signal and exit steps. Fills use the bar close as bid and
+bid + spread as ask; SL/TP are checked against the next bars' high/low
+(SL first when both are inside one bar, the open price when a bar gaps
+through). With `ticks` every tick is a step, filled at its own bid/ask, and
+levels come from the bars closed before it.
+
+    python backtest.py --symbol EURUSDm --timeframe M1 --bars 525600 --trailer candle
+"""
+import argparse
+import heapq
+import json
+import time
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from bar_store import BarStore
+from broker import mt5
+from levels import IDM_RATIO, FACTOR, rolling_levels, levels_to_dict
+from indicators import atr_series
+from autotrade import TP_RATIO, detect_cross_batch, suggest_tp_points
+from order_pipeline import DEFAULT_DEDUPE_WINDOW
+from sltp_engine import DEFAULT_MIN_STEP_POINTS
+from strategies.candle_trailer import CandleTrailingStop
+from strategies.atr_trailer import ATRTrailingStop
+
+
+STRATEGIES = ("cross", "simple")
+
+TRADES_DTYPE = np.dtype([
+    ("entry_time", "<f8"), ("exit_time", "<f8"), ("side", "i1"),
+    ("entry", "<f8"), ("exit", "<f8"), ("sl", "<f8"), ("tp", "<f8"),
+    ("reason", "U5"), ("steps", "<i8"), ("profit", "<f8"),
+])
+
+
+class BacktestResult:
+    """Trades, per-step equity curve and summary statistics of one run."""
+
+    def __init__(self, trades, times, equity, balance, bars, elapsed):
+        self.trades = trades
+        self.times = times
+        self.equity = equity
+        self.balance = balance
+        self.bars = bars
+        self.elapsed = elapsed
+
+    def drawdown(self):
+        """Distance of the equity curve below its running peak, per step."""
+        if not len(self.equity):
+            return self.equity
+        return np.maximum.accumulate(self.equity) - self.equity
+
+    def stats(self):
+        profits = self.trades["profit"]
+        wins = int((profits > 0).sum())
+        gross_profit = float(profits[profits > 0].sum())
+        gross_loss = abs(float(profits[profits < 0].sum()))
+        drawdown = self.drawdown()
+        worst = int(drawdown.argmax()) if len(drawdown) else 0
+        peak = float(np.maximum.accumulate(self.equity)[worst]) if len(drawdown) else self.balance
+        return {
+            "bars": self.bars,
+            "steps": len(self.equity),
+            "trades": len(profits),
+            "wins": wins,
+            "hit_rate": round(wins / len(profits), 4) if len(profits) else None,
+            "net_profit": round(float(profits.sum()), 2),
+            "gross_profit": round(gross_profit, 2),
+            "gross_loss": round(gross_loss, 2),
+            "profit_factor": round(gross_profit / gross_loss, 3) if gross_loss else None,
+            "avg_trade": round(float(profits.mean()), 2) if len(profits) else None,
+            "max_drawdown": round(float(drawdown.max()), 2) if len(drawdown) else 0.0,
+            "max_drawdown_pct": round(float(drawdown[worst] / peak * 100.0), 2) if len(drawdown) and peak else 0.0,
+            "final_equity": round(float(self.equity[-1]), 2) if len(self.equity) else self.balance,
+            "elapsed_ms": round(self.elapsed * 1000.0, 1),
+        }
+
+    def trades_frame(self):
+        df = pd.DataFrame(self.trades)
+        df["side"] = df["side"].map({1: "BUY", -1: "SELL"})
+        for col in ("entry_time", "exit_time"):
+            df[col] = pd.to_datetime(df[col], unit="s")
+        return df
+
+    def equity_frame(self):
+        return pd.DataFrame({"time": pd.to_datetime(self.times, unit="s"), "equity": self.equity,
+                             "drawdown": self.drawdown()})
+
+
+# -----------------------
+# Vectorized preparation
+# -----------------------
+def _steps(rates, ticks, point, spread_points):
+    """(time, open, high, low, close, spread, bar index) per step; prices are bids."""
+    if ticks is None:
+        if spread_points is not None:
+            spread = np.full(len(rates), spread_points * point)
+        elif "spread" in rates.dtype.names:
+            spread = rates["spread"].astype(float) * point
+        else:
+            spread = np.zeros(len(rates))
+        close = rates["close"].astype(float)
+        return (rates["time"].astype(float), rates["open"].astype(float), rates["high"].astype(float),
+                rates["low"].astype(float), close, spread, np.arange(len(rates)))
+    times = ticks["time_msc"] / 1000.0 if "time_msc" in ticks.dtype.names else ticks["time"].astype(float)
+    bid = ticks["bid"].astype(float)
+    spread = ticks["ask"] - bid if spread_points is None else np.full(len(bid), spread_points * point)
+    # Last bar closed before the tick (the forming bar's range isn't known yet)
+    bar = np.searchsorted(rates["time"], times, side="right") - 2
+    return times, bid, bid, bid, bid, spread, bar
+
+
+def _signals(strategy, levels, bar, close, window):
+    """(side per step: 1 BUY / -1 SELL / 0, level that triggered it)."""
+    valid = bar >= window - 1
+    at = np.where(valid, bar, 0)
+    buy1 = np.where(valid, levels["Buy1"][at], np.nan)
+    phh = np.where(valid, levels["PHH"][at], np.nan)
+    hh = np.where(valid, levels["HH"][at], np.nan)
+    if strategy == "cross":
+        sell_level = np.where(np.isnan(phh), hh, phh)
+        prev = np.concatenate([[np.nan], close[:-1]])
+        side = detect_cross_batch(prev, close, buy1, sell_level)
+        return side, np.where(side > 0, buy1, sell_level)
+    # SimpleAutoTrader: BUY at/below Buy1, else SELL at/above PHH, else at/above HH
+    buy = close <= buy1
+    sell_phh = ~buy & (close >= phh)
+    sell_hh = ~buy & ~sell_phh & (close >= hh)
+    side = np.where(buy, 1, np.where(sell_phh | sell_hh, -1, 0)).astype(np.int8)
+    return side, np.where(buy, buy1, np.where(sell_phh, phh, hh))
+
+
+def _trailing_inputs(trailer, rates, bar):
+    """Per-step arrays the trailer rule needs, taken at the last closed bar."""
+    valid = bar >= 0
+    at = np.where(valid, bar, 0)
+    if isinstance(trailer, CandleTrailingStop):
+        n = trailer.lookback_candles
+        low_min = np.full(len(rates), np.nan)
+        high_max = np.full(len(rates), np.nan)
+        if len(rates) >= n:
+            low_min[n - 1:] = sliding_window_view(rates["low"].astype(float), n).min(axis=1)
+            high_max[n - 1:] = sliding_window_view(rates["high"].astype(float), n).max(axis=1)
+        return np.where(valid, low_min[at], np.nan), np.where(valid, high_max[at], np.nan)
+    if isinstance(trailer, ATRTrailingStop):
+        atr = atr_series(rates, trailer.atr_period, trailer.atr_method) * trailer.atr_mult
+        return (np.where(valid, atr[at], np.nan),)
+    raise TypeError(f"Unsupported trailer: {trailer!r} (expected CandleTrailingStop or ATRTrailingStop)")
+
+
+def _exit_fill(direction, sl, tp, o, h, l, spread):
+    """(price, reason) if SL/TP is hit inside a step's bid range, else None."""
+    if direction > 0:  # BUY closes on the bid
+        if tp and o >= tp:
+            return o, "tp"
+        if sl and l <= sl:
+            return (o if o < sl else sl), "sl"
+        if tp and h >= tp:
+            return tp, "tp"
+        return None
+    # SELL closes on the ask
+    if tp and o + spread <= tp:
+        return o + spread, "tp"
+    if sl and h + spread >= sl:
+        return (o + spread if o + spread > sl else sl), "sl"
+    if tp and l + spread <= tp:
+        return tp, "tp"
+    return None
+
+
+def _exit_hits(direction, sl, tp, highs, lows, spreads):
+    """Steps whose range reaches SL/TP (the conditions of _exit_fill, over arrays)."""
+    hit = np.zeros(len(highs), dtype=bool)
+    if direction > 0:
+        if tp:
+            hit |= highs >= tp
+        if sl:
+            hit |= lows <= sl
+    else:
+        if tp:
+            hit |= lows + spreads <= tp
+        if sl:
+            hit |= highs + spreads >= sl
+    return hit
+
+
+def _first_exit(start, direction, sl, tp, highs, lows, spreads):
+    """First step >= start whose range reaches a fixed SL/TP (None: never), scanned in growing chunks."""
+    size = 256
+    while start < len(highs):
+        end = min(len(highs), start + size)
+        hit = _exit_hits(direction, sl, tp, highs[start:end], lows[start:end], spreads[start:end])
+        if hit.any():
+            return start + int(hit.argmax())
+        start, size = end, size * 4
+    return None
+
+
+def _candle_stops(direction, entry, sl, low_min, high_max):
+    """candle_trail_sl's final proposal per step for one position with SL held at `sl` (NaN: none)."""
+    if direction > 0:
+        be = entry if sl == 0 or sl < entry else np.nan
+        return np.where(low_min > (sl or 0), low_min, be)
+    be = entry if sl == 0 or sl > entry else np.nan
+    return np.where(high_max < (sl or 999999), high_max, be)
+
+
+def _atr_stops(direction, sl, price, atr_distance, point, step_pips):
+    """atr_trail_sl's proposal per step for one position with SL held at `sl` (NaN: none)."""
+    if direction > 0:
+        new_sl = price - atr_distance
+        return np.where(new_sl > (sl or 0) + step_pips * point, new_sl, np.nan)
+    new_sl = price + atr_distance
+    if sl == 0:
+        return new_sl
+    return np.where(new_sl < sl - step_pips * point, new_sl, np.nan)
+
+
+# -----------------------
+# Event loop
+# -----------------------
+def run_backtest(rates, strategy="cross", window=200, point=1e-5, tick_value=1.0, tick_size=None,
+                 lot=0.01, spread_points=None, default_tp_points=0, sl_points=0, trailer=None,
+                 dedupe_window=DEFAULT_DEDUPE_WINDOW, balance=10000.0, ticks=None,
+                 idm_ratio=IDM_RATIO, factor=FACTOR, tp_ratio=TP_RATIO, levels=None):
+    """
+    Backtest one symbol; returns a BacktestResult.
+    - rates: MT5 rates array, oldest first
+    - strategy: 'cross' (run_autotrade) or 'simple' (SimpleAutoTrader)
+    - window: bars per level calculation (the dashboard's number of candles)
+    - point / tick_value / tick_size: contract details (see ``symbol_costs``)
+    - spread_points: fixed spread; default is the bars' spread column / the ticks' ask
+    - default_tp_points: TP when the levels give none (cross strategy)
+    - sl_points: SL distance at entry; live orders currently go out without one
+    - trailer: CandleTrailingStop / ATRTrailingStop whose settings are replayed
+    - dedupe_window: seconds a level's idempotency key blocks a repeat order
+    - ticks: optional ticks array (time or time_msc, bid, ask) to step through
+    - idm_ratio / factor / tp_ratio: the strategy constants (live defaults)
+    - levels: rolling_levels(rates, window, idm_ratio, factor) computed
+      earlier, to share it between runs that differ in other settings only
+    Each position's exit is found with vectorized scans when it opens (see
+    the module docstring), so only signal/exit steps are visited.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown strategy: {strategy!r} (expected one of {STRATEGIES})")
+    started = time.perf_counter()
+    tick_size = tick_size or point
+    money_per_price = tick_value / tick_size * lot
+    min_step = DEFAULT_MIN_STEP_POINTS * point
+
+    if levels is None:
+        levels = rolling_levels(rates, window, idm_ratio, factor)
+    times, opens, highs, lows, closes, spreads, bar = _steps(rates, ticks, point, spread_points)
+    sides, trigger = _signals(strategy, levels, bar, closes, window)
+    trail = _trailing_inputs(trailer, rates, bar) if trailer is not None else None
+    candle = isinstance(trailer, CandleTrailingStop)
+
+    n = len(times)
+    times_l, closes_l, spreads_l = times.tolist(), closes.tolist(), spreads.tolist()
+    asks = closes + spreads
+    if trail is not None:
+        trail_ok = ~np.isnan(trail[0])
+        trigger_pips = trailer.profit_trigger_pips
+    trades = []
+    keys = {}
+    positions = []  # [side, entry, sl, tp, entry step, exit step (fixed stops only)]
+    # Account after each visited step; forward-filled and marked to market at the end
+    visited = np.zeros(n, dtype=bool)
+    cash_at = np.zeros(n)
+    longs_at = np.zeros(n)
+    shorts_at = np.zeros(n)
+    entries_at = np.zeros(n)
+    account = [float(balance), 0, 0, 0.0]  # cash, longs, shorts, sum of side * entry
+
+    def record(i):
+        visited[i] = True
+        cash_at[i], longs_at[i], shorts_at[i], entries_at[i] = account
+
+    def close_position(pos, i, price, reason):
+        direction, entry = pos[0], pos[1]
+        profit = direction * (price - entry) * money_per_price
+        account[0] += profit
+        account[1 if direction > 0 else 2] -= 1
+        account[3] -= direction * entry
+        trades.append((times_l[pos[4]], times_l[i], direction, entry, price, pos[2], pos[3], reason, i - pos[4], profit))
+
+    def open_position(i, side):
+        """New order at the step's close, unless its idempotency key is still reserved."""
+        key = (side, f"{trigger[i]:.10g}")
+        seen = keys.get(key)
+        if seen is not None and times_l[i] - seen < dedupe_window:
+            return None
+        keys[key] = times_l[i]
+        close = closes_l[i]
+        entry = close + spreads_l[i] if side > 0 else close
+        tp = 0.0
+        if strategy == "cross":
+            suggested = suggest_tp_points(levels_to_dict(levels[bar[i]]), point)
+            tp_points = int(suggested * tp_ratio) if suggested and suggested > 0 else int(default_tp_points or 50)
+            tp = close + side * tp_points * point
+        sl = entry - side * sl_points * point if sl_points else 0.0
+        pos = [side, entry, sl, tp, i, None]
+        positions.append(pos)
+        account[1 if side > 0 else 2] += 1
+        account[3] += side * entry
+        return pos
+
+    def trailing_exit(pos):
+        """
+        Exit step of `pos` with its SL trailing (None: open at the end), the
+        final SL left in pos[2]. Mirrors the per-step order: the exit check
+        with the current SL, then the trailing rule at the step's close.
+        """
+        direction, entry, tp = pos[0], pos[1], pos[3]
+        prices = closes if direction > 0 else asks
+        start, size = pos[4] + 1, 64
+        while start < n:
+            end = min(n, start + size)
+            sl = pos[2]
+            hit = _exit_hits(direction, sl, tp, highs[start:end], lows[start:end], spreads[start:end])
+            price = prices[start:end]
+            if candle:
+                new_sl = _candle_stops(direction, entry, sl, trail[0][start:end], trail[1][start:end])
+            else:
+                new_sl = _atr_stops(direction, sl, price, trail[0][start:end], point, trailer.step_pips)
+            # Both rules leave a position alone below the profit trigger, in points like theirs
+            profit = price - entry if direction > 0 else entry - price
+            moved = ((profit / point >= trigger_pips) & trail_ok[start:end]
+                     & (np.abs(new_sl - sl) >= min_step))
+            event = hit | moved
+            first = int(event.argmax())
+            if not event[first]:
+                start, size = end, size * 2
+                continue
+            if hit[first]:
+                return start + first
+            pos[2] = float(new_sl[first])
+            start, size = start + first + 1, 64
+        return None
+
+    # Jump from signal to signal; exits come from a heap
+    exits = []
+    for i in np.flatnonzero(sides).tolist():
+        while exits and exits[0][0] <= i:
+            step, _, pos = heapq.heappop(exits)
+            close_position(pos, step, *_exit_fill(pos[0], pos[2], pos[3], opens[step], highs[step],
+                                                  lows[step], spreads_l[step]))
+            record(step)
+        pos = open_position(i, int(sides[i]))
+        if pos is not None:
+            if trail is None:
+                pos[5] = _first_exit(i + 1, pos[0], pos[2], pos[3], highs, lows, spreads)
+            else:
+                pos[5] = trailing_exit(pos)
+            if pos[5] is not None:
+                heapq.heappush(exits, (pos[5], pos[4], pos))
+        record(i)
+    while exits:
+        step, _, pos = heapq.heappop(exits)
+        close_position(pos, step, *_exit_fill(pos[0], pos[2], pos[3], opens[step], highs[step],
+                                              lows[step], spreads_l[step]))
+        record(step)
+    positions = [pos for pos in positions if pos[5] is None]
+
+    # Whatever is still open is closed at the last price
+    for pos in positions:
+        close_position(pos, n - 1, closes_l[-1] if pos[0] > 0 else closes_l[-1] + spreads_l[-1], "end")
+
+    # Forward-fill the account between visited steps and mark open positions to market
+    last = np.maximum.accumulate(np.where(visited, np.arange(n), -1))
+    filled = last >= 0
+    at = np.where(filled, last, 0)
+    cash = np.where(filled, cash_at[at], float(balance))
+    longs, shorts, entries = (np.where(filled, a[at], 0.0) for a in (longs_at, shorts_at, entries_at))
+    equity = cash + (longs * closes - shorts * (closes + spreads) - entries) * money_per_price
+
+    trades.sort(key=lambda t: (t[1], t[0]))
+    return BacktestResult(np.array(trades, dtype=TRADES_DTYPE), times, equity, float(balance),
+                          len(rates), time.perf_counter() - started)
+
+
+# -----------------------
+# Data from the terminal
+# -----------------------
+def load_history(symbol, timeframe, bars=None, date_from=None, date_to=None, store=None):
+    """Rates for a date range (datetimes) or the newest `bars` bars, from the terminal or a BarStore."""
+    if store is not None:
+        if date_from is not None:
+            return store.rates(symbol, timeframe, date_from, date_to)
+        return store.tail(symbol, timeframe, int(bars))
+    if date_from is not None:
+        return mt5.copy_rates_range(symbol, timeframe, date_from, date_to or pd.Timestamp.utcnow().to_pydatetime())
+    return mt5.copy_rates_from_pos(symbol, timeframe, 0, int(bars))
+
+
+def symbol_costs(symbol, store=None):
+    """point / tick_value / tick_size keyword arguments for run_backtest."""
+    if store is not None:
+        saved = store.symbol_info(symbol)
+        if not saved:
+            raise ValueError(f"No contract details stored for {symbol!r}; sync it first")
+        return {"point": saved["point"], "tick_value": saved["trade_tick_value"],
+                "tick_size": saved.get("trade_tick_size") or saved["point"]}
+    info = mt5.symbol_info(symbol)
+    if info is None:
+        raise ValueError(f"Unknown symbol: {symbol!r}")
+    return {"point": info.point, "tick_value": info.trade_tick_value,
+            "tick_size": getattr(info, "trade_tick_size", 0) or info.point}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backtest the level strategies on MT5 history")
+    parser.add_argument("--symbol", required=True)
+    parser.add_argument("--timeframe", default="M1", choices=["M1", "M5", "M15", "H1", "H4", "D1"])
+    parser.add_argument("--bars", type=int, default=100000)
+    parser.add_argument("--window", type=int, default=200, help="candles per level calculation")
+    parser.add_argument("--strategy", default="cross", choices=STRATEGIES)
+    parser.add_argument("--trailer", default="candle", choices=["candle", "atr", "none"])
+    parser.add_argument("--lot", type=float, default=0.01)
+    parser.add_argument("--tp-points", type=int, default=0)
+    parser.add_argument("--sl-points", type=int, default=0)
+    parser.add_argument("--spread-points", type=float, default=None)
+    parser.add_argument("--trades", help="write the trade list to this CSV")
+    parser.add_argument("--equity", help="write the equity curve to this CSV")
+    parser.add_argument("--store", help="read bars from this bar store directory instead of the terminal")
+    args = parser.parse_args(argv)
+
+    timeframe = getattr(mt5, f"TIMEFRAME_{args.timeframe}")
+    if args.store:
+        store = BarStore(args.store)
+        rates = load_history(args.symbol, timeframe, args.bars, store=store)
+        if len(rates) == 0:
+            raise SystemExit(f"No stored history for {args.symbol} {args.timeframe} in {args.store}")
+        costs = symbol_costs(args.symbol, store=store)
+    else:
+        if not mt5.initialize():
+            raise SystemExit("MT5 initialization failed. Make sure the terminal is running and logged in.")
+        try:
+            rates = load_history(args.symbol, timeframe, args.bars)
+            if rates is None or len(rates) == 0:
+                raise SystemExit(f"No history for {args.symbol}")
+            costs = symbol_costs(args.symbol)
+        finally:
+            mt5.shutdown()
+
+    trailer = None
+    if args.trailer == "candle":
+        trailer = CandleTrailingStop(args.symbol, timeframe, profit_trigger_pips=20, lookback_candles=3)
+    elif args.trailer == "atr":
+        trailer = ATRTrailingStop(args.symbol, timeframe, atr_period=14, atr_mult=2.0)
+
+    result = run_backtest(rates, args.strategy, args.window, lot=args.lot, spread_points=args.spread_points,
+                          default_tp_points=args.tp_points, sl_points=args.sl_points, trailer=trailer, **costs)
+    print(json.dumps(result.stats(), indent=2))
+    if args.trades:
+        result.trades_frame().to_csv(args.trades, index=False)
+    if args.equity:
+        result.equity_frame().to_csv(args.equity, index=False)
+
+
+if __name__ == "__main__":
+    main()
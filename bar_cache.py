@@ -0,0 +1,287 @@
+"""
+Process-wide OHLC bar cache.
+
+Every Streamlit session, the strategies and the helpers read bars through
+``get_rates`` instead of calling ``copy_rates_from_pos`` themselves. Bars are
+kept per (symbol, timeframe) in fixed-size ring buffers; an entry is only
+refreshed from the terminal once its TTL (tied to the timeframe) has run
+out, and then only the newest bars are fetched. Entries are evicted LRU
+when the cache grows past its memory budget.
+
+With a bar store configured (``MT5_BAR_STORE``), a cold entry is seeded
+from the bars on disk and only the bars closed since are fetched, and
+newly closed bars are written through to series the store already holds.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from bar_store import bar_store
+from broker import mt5, timeframe_seconds
+
+
+DEFAULT_CAPACITY = 1000
+DEFAULT_MEMORY_BUDGET = 64 * 1024 * 1024  # bytes
+
+# TTL = bar length * TTL_FRACTION, clamped: M1 -> 1s, M5 -> 5s, H1 and up -> 30s
+TTL_FRACTION = 1 / 60
+MIN_TTL = 1.0
+MAX_TTL = 30.0
+
+
+def ttl_for(timeframe):
+    """Seconds a cached bar series stays fresh for this timeframe."""
+    return min(max(timeframe_seconds(timeframe) * TTL_FRACTION, MIN_TTL), MAX_TTL)
+
+
+class RingBuffer:
+    """Fixed-capacity ring of MT5 rate records, oldest first."""
+
+    def __init__(self, capacity, dtype):
+        self.data = np.zeros(int(capacity), dtype=dtype)
+        self.head = 0  # index of the oldest record
+        self.size = 0
+
+    @property
+    def capacity(self):
+        return len(self.data)
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def clear(self):
+        self.head = 0
+        self.size = 0
+
+    def _index(self, i):
+        return (self.head + i) % self.capacity
+
+    def append(self, record):
+        if self.size == self.capacity:
+            self.data[self.head] = record
+            self.head = (self.head + 1) % self.capacity
+        else:
+            self.data[self._index(self.size)] = record
+            self.size += 1
+
+    def extend(self, records):
+        """Append many records with at most two slice copies (split where the ring wraps)."""
+        records = records[-self.capacity:]
+        n = len(records)
+        if not n:
+            return
+        start = self._index(self.size)
+        first = min(n, self.capacity - start)
+        self.data[start:start + first] = records[:first]
+        self.data[:n - first] = records[first:]
+        self.head = (self.head + max(0, self.size + n - self.capacity)) % self.capacity
+        self.size = min(self.capacity, self.size + n)
+
+    def set_last(self, record):
+        self.data[self._index(self.size - 1)] = record
+
+    def last(self):
+        return self.data[self._index(self.size - 1)] if self.size else None
+
+    def tail(self, count, skip=0):
+        """Copy of `count` records ending `skip` records before the newest."""
+        stop = self.size - int(skip)
+        start = max(0, stop - int(count))
+        if stop <= 0:
+            return self.data[:0].copy()
+        begin = self._index(start)
+        n = stop - start
+        if begin + n <= self.capacity:
+            return self.data[begin:begin + n].copy()
+        return np.take(self.data, np.arange(begin, begin + n) % self.capacity)
+
+
+class _Entry:
+    __slots__ = ("ring", "depth", "fetched_at", "lock")
+
+    def __init__(self):
+        self.ring = None
+        self.depth = 0  # bars requested by the last full load
+        self.fetched_at = 0.0
+        self.lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        return self.ring.nbytes if self.ring is not None else 0
+
+
+class BarCache:
+    """(symbol, timeframe) -> ring buffer of bars, shared by the whole process."""
+
+    def __init__(self, memory_budget=DEFAULT_MEMORY_BUDGET, capacity=DEFAULT_CAPACITY, clock=None, store=None):
+        self.memory_budget = int(memory_budget)
+        self.capacity = int(capacity)
+        self.clock = clock or time.monotonic
+        self.store = store
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.evictions = 0
+        self.bars_fetched = 0
+        self.bars_from_store = 0
+        self.bars_stored = 0
+
+    # -----------------------
+    # Internals
+    # -----------------------
+    def _fetch(self, symbol, timeframe, count):
+        rates = mt5.copy_rates_from_pos(symbol, timeframe, 0, count)
+        if rates is not None:
+            self.bars_fetched += len(rates)
+        return rates
+
+    def _entry(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry()
+            self._entries.move_to_end(key)
+            return entry
+
+    def _evict(self, keep=None):
+        with self._lock:
+            used = sum(e.nbytes for e in self._entries.values())
+            for key in list(self._entries):
+                if used <= self.memory_budget:
+                    break
+                if key == keep:
+                    continue
+                used -= self._entries.pop(key).nbytes
+                self.evictions += 1
+
+    def _reload(self, entry, symbol, timeframe, need):
+        stored = self.store.tail(symbol, timeframe, need) if self.store is not None else None
+        warm = stored is not None and len(stored) >= need
+        rates = stored if warm else self._fetch(symbol, timeframe, need)
+        entry.depth = need
+        if rates is None or len(rates) == 0:
+            return
+        capacity = max(need, self.capacity)
+        if entry.ring is None or entry.ring.capacity < capacity or entry.ring.data.dtype != rates.dtype:
+            entry.ring = RingBuffer(capacity, rates.dtype)
+        entry.ring.clear()
+        entry.ring.extend(rates)
+        if warm:
+            # Stored bars are all closed ones; catch up with what closed since
+            self.bars_from_store += len(rates)
+            self._refresh(entry, symbol, timeframe, need)
+
+    def _write_through(self, entry, symbol, timeframe):
+        """Append newly closed bars to the store (only to series it already holds)."""
+        ring = entry.ring
+        if self.store is None or ring is None or ring.size < 2:
+            return
+        series = self.store.series(symbol, timeframe)
+        last = series.last_time
+        if last is None or int(ring.tail(1, skip=1)["time"][0]) <= last:
+            return
+        closed = ring.tail(ring.size - 1, skip=1)
+        try:
+            self.bars_stored += series.append(closed[closed["time"] > last])
+        except OSError:
+            pass
+
+    def _refresh(self, entry, symbol, timeframe, need):
+        """Fetch only bars newer than the cached ones (widening the request if some were missed)."""
+        ring = entry.ring
+        last_time = int(ring.last()["time"])
+        need = max(need, entry.depth)
+        count = 2
+        while True:
+            rates = self._fetch(symbol, timeframe, count)
+            if rates is None or len(rates) == 0:
+                return
+            if int(rates["time"][0]) <= last_time:
+                break
+            if count >= need:
+                # Gap longer than anything we serve: start over from this snapshot
+                ring.clear()
+                ring.extend(rates)
+                return
+            count = min(count * 4, need)
+        for bar in rates[rates["time"] >= last_time]:
+            if int(bar["time"]) == last_time:
+                ring.set_last(bar)
+            else:
+                ring.append(bar)
+                last_time = int(bar["time"])
+
+    # -----------------------
+    # Public API
+    # -----------------------
+    def get_rates(self, symbol, timeframe, start_pos, count):
+        """Same contract as mt5.copy_rates_from_pos, served from the cache when fresh."""
+        if count <= 0:
+            return None
+        need = int(start_pos) + int(count)
+        key = (symbol, int(timeframe))
+        entry = self._entry(key)
+        with entry.lock:
+            now = self.clock()
+            ring = entry.ring
+            if ring is None or ring.size == 0 or (ring.size < need and need > entry.depth):
+                # Nothing cached yet, or a deeper history than we ever loaded
+                self.misses += 1
+                self._reload(entry, symbol, timeframe, need)
+                self._write_through(entry, symbol, timeframe)
+                entry.fetched_at = now
+                grew = True
+            elif entry.fetched_at <= now - ttl_for(timeframe):
+                self.refreshes += 1
+                self._refresh(entry, symbol, timeframe, need)
+                self._write_through(entry, symbol, timeframe)
+                entry.fetched_at = now
+                grew = False
+            else:
+                self.hits += 1
+                grew = False
+            ring = entry.ring
+            rates = ring.tail(count, skip=start_pos) if ring is not None and ring.size else None
+        if grew:
+            self._evict(keep=key)
+        return rates if rates is not None and len(rates) else None
+
+    def invalidate(self, symbol=None, timeframe=None):
+        """Drop cached series (all, one symbol, or one (symbol, timeframe))."""
+        with self._lock:
+            for key in list(self._entries):
+                if (symbol is None or key[0] == symbol) and (timeframe is None or key[1] == int(timeframe)):
+                    del self._entries[key]
+
+    def stats(self):
+        """Hit/miss counters and memory use."""
+        with self._lock:
+            entries = len(self._entries)
+            used = sum(e.nbytes for e in self._entries.values())
+        lookups = self.hits + self.misses + self.refreshes
+        return {
+            "entries": entries,
+            "bytes": used,
+            "memory_budget": self.memory_budget,
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "evictions": self.evictions,
+            "bars_fetched": self.bars_fetched,
+            "bars_from_store": self.bars_from_store,
+            "bars_stored": self.bars_stored,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+bar_cache = BarCache(store=bar_store)
+
+
+def get_rates(symbol, timeframe, start_pos, count):
+    """Read-through replacement for mt5.copy_rates_from_pos using the shared cache."""
+    return bar_cache.get_rates(symbol, timeframe, start_pos, count)
@@ -0,0 +1,399 @@
+"""
+On-disk columnar bar store.
+
+One directory per (symbol, timeframe) under the store root, holding one raw
+little-endian file per rates field (time.bin, open.bin, high.bin, ...) and
+a meta.json with the bar count, plus the symbol's contract details saved
+at sync time (so costs can be worked out offline):
+
+    <root>/EURUSDm/symbol.json
+    <root>/EURUSDm/M1/time.bin  open.bin  high.bin  low.bin  close.bin ...  meta.json
+
+- only closed bars are stored, so the columns are append-only: a sync asks
+  the terminal for bars after the last stored time (``copy_rates_range``,
+  in chunks) and appends all but the forming one;
+- reads are ``np.memmap`` views of the column files: ``columns`` returns
+  them without copying, ``rates`` / ``tail`` build an MT5-style rates array;
+- when an append does not start right after the last stored bar, the hole
+  is remembered and the next sync asks the terminal to backfill it;
+  ``gaps`` finds every hole in a series and ``backfill`` tries to fill
+  them (holes the terminal has no bars for are remembered as checked).
+
+With ``MT5_BAR_STORE`` set to a directory the shared bar cache warm-starts
+from the store and writes newly closed bars through to it, and
+backtest.py / sweep.py can read years of history with ``--store`` without
+touching the terminal:
+
+    python bar_store.py --symbols EURUSDm XAUUSDm --timeframes M1 H1 --days 365
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from broker import mt5, timeframe_seconds
+
+
+STORE_DIR = os.environ.get("MT5_BAR_STORE", "")  # empty: no store
+DEFAULT_HISTORY_DAYS = 365
+CHUNK_BARS = 50000        # bars per copy_rates_range request
+SERVER_AHEAD = 86400      # server clocks run ahead of UTC; ask a day past now
+MAX_BACKFILLS = 50        # holes checked per backfill call
+
+RATES_FIELDS = (
+    ("time", "<i8"), ("open", "<f8"), ("high", "<f8"), ("low", "<f8"), ("close", "<f8"),
+    ("tick_volume", "<u8"), ("spread", "<i4"), ("real_volume", "<u8"),
+)
+RATES_DTYPE = np.dtype(list(RATES_FIELDS))
+INFO_FIELDS = ("point", "digits", "trade_tick_value", "trade_tick_size", "trade_contract_size")
+
+
+def timeframe_name(timeframe):
+    for name in ("M1", "M5", "M15", "M30", "H1", "H4", "D1", "W1"):
+        if getattr(mt5, f"TIMEFRAME_{name}", None) == int(timeframe):
+            return name
+    return str(int(timeframe))
+
+
+def _utc(ts):
+    return datetime.fromtimestamp(int(ts), tz=timezone.utc)
+
+
+class BarSeries:
+    """Closed bars of one (symbol, timeframe): append-only columns read through memmaps."""
+
+    def __init__(self, path, timeframe):
+        self.path = path
+        self.timeframe = int(timeframe)
+        self.step = timeframe_seconds(timeframe)
+        self.lock = threading.RLock()
+        self._maps = None
+        self.meta = self._read_meta()
+
+    # -----------------------
+    # Files
+    # -----------------------
+    def _column_path(self, field):
+        return os.path.join(self.path, f"{field}.bin")
+
+    def _read_meta(self):
+        try:
+            with open(os.path.join(self.path, "meta.json"), encoding="utf-8") as fh:
+                meta = json.load(fh)
+        except (OSError, ValueError):
+            meta = {}
+        meta.setdefault("count", 0)
+        meta.setdefault("timeframe", self.timeframe)
+        meta.setdefault("pending_gaps", [])
+        meta.setdefault("checked_gaps", [])
+        return meta
+
+    def _write_meta(self):
+        _write_json(os.path.join(self.path, "meta.json"), self.meta)
+
+    def reload(self):
+        """Pick up bars another process appended."""
+        with self.lock:
+            self.meta = self._read_meta()
+            self._maps = None
+
+    def __len__(self):
+        return self.meta["count"]
+
+    # -----------------------
+    # Reads
+    # -----------------------
+    def _columns(self):
+        n = len(self)
+        if self._maps is None or len(self._maps["time"]) != n:
+            self._maps = {
+                field: np.memmap(self._column_path(field), dtype=dtype, mode="r", shape=(n,))
+                if n else np.zeros(0, dtype=dtype)
+                for field, dtype in RATES_FIELDS
+            }
+        return self._maps
+
+    @property
+    def first_time(self):
+        return int(self._columns()["time"][0]) if len(self) else None
+
+    @property
+    def last_time(self):
+        return int(self._columns()["time"][-1]) if len(self) else None
+
+    def index_range(self, date_from=None, date_to=None):
+        """[start, stop) of the bars with date_from <= time <= date_to (epoch seconds or datetimes)."""
+        times = self._columns()["time"]
+        start = 0 if date_from is None else int(np.searchsorted(times, _seconds(date_from), side="left"))
+        stop = len(times) if date_to is None else int(np.searchsorted(times, _seconds(date_to), side="right"))
+        return start, max(start, stop)
+
+    def columns(self, date_from=None, date_to=None, fields=None):
+        """{field: read-only memmap slice} for a time range; nothing is copied."""
+        with self.lock:
+            start, stop = self.index_range(date_from, date_to)
+            maps = self._columns()
+            return {f: maps[f][start:stop] for f in (fields or maps)}
+
+    def rates(self, date_from=None, date_to=None):
+        """MT5-style rates array for a time range (one copy out of the memmaps)."""
+        return self._to_rates(self.columns(date_from, date_to))
+
+    def tail(self, count):
+        """Newest `count` stored bars as a rates array."""
+        with self.lock:
+            n = len(self)
+            maps = self._columns()
+            return self._to_rates({f: m[max(0, n - int(count)):] for f, m in maps.items()})
+
+    @staticmethod
+    def _to_rates(columns):
+        out = np.zeros(len(columns["time"]), dtype=RATES_DTYPE)
+        for field, values in columns.items():
+            out[field] = values
+        return out
+
+    # -----------------------
+    # Writes
+    # -----------------------
+    def _write_columns(self, rates, at):
+        """Write `rates` into the column files starting at bar `at` (anything after is cut)."""
+        os.makedirs(self.path, exist_ok=True)
+        for field, dtype in RATES_FIELDS:
+            values = np.ascontiguousarray(rates[field], dtype=dtype) if field in rates.dtype.names \
+                else np.zeros(len(rates), dtype=dtype)
+            path = self._column_path(field)
+            with open(path, "r+b" if os.path.exists(path) else "w+b") as fh:
+                fh.seek(at * np.dtype(dtype).itemsize)
+                fh.write(values.tobytes())
+                fh.truncate()
+        self._maps = None
+
+    def append(self, rates):
+        """
+        Append closed bars newer than the last stored one; returns how many.
+        A jump of more than one bar from the stored end is kept as a pending gap.
+        """
+        if rates is None or len(rates) == 0:
+            return 0
+        with self.lock:
+            self.reload()
+            last = self.last_time
+            if last is not None:
+                rates = rates[rates["time"] > last]
+                if len(rates) == 0:
+                    return 0
+                first = int(rates["time"][0])
+                if first - last > self.step:
+                    self.meta["pending_gaps"].append([last, first])
+            self._write_columns(rates, len(self))
+            self.meta["count"] = len(self) + len(rates)
+            self._write_meta()
+            return len(rates)
+
+    def insert(self, rates):
+        """Merge bars from anywhere in the series (backfill); returns how many were new."""
+        if rates is None or len(rates) == 0:
+            return 0
+        with self.lock:
+            self.reload()
+            times = self._columns()["time"]
+            new = rates[~np.isin(rates["time"], times)]
+            if len(new) == 0:
+                return 0
+            # Rewrite from the first inserted bar on
+            at = int(np.searchsorted(times, new["time"].min()))
+            merged = np.concatenate([self._to_rates({f: m[at:] for f, m in self._columns().items()}),
+                                     new.astype(RATES_DTYPE)])
+            merged.sort(order="time")
+            self._write_columns(merged, at)
+            self.meta["count"] = at + len(merged)
+            self._write_meta()
+            return len(new)
+
+    # -----------------------
+    # Gaps
+    # -----------------------
+    def gaps(self, min_bars=1):
+        """[(last time before, first time after)] for every hole of at least `min_bars` missing bars."""
+        times = self._columns()["time"]
+        if len(times) < 2:
+            return []
+        jumps = np.flatnonzero(np.diff(times) > self.step * min_bars)
+        return [(int(times[i]), int(times[i + 1])) for i in jumps]
+
+
+def _seconds(value):
+    return int(value.timestamp()) if hasattr(value, "timestamp") else int(value)
+
+
+def _write_json(path, data):
+    """Write via a temp file + rename so readers never see half a file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(data, fh)
+    os.replace(tmp, path)
+
+
+class BarStore:
+    """Root directory of BarSeries, synced from the terminal."""
+
+    def __init__(self, root):
+        self.root = root
+        self._series = {}
+        self._lock = threading.Lock()
+        self.bars_synced = 0
+        self.bars_backfilled = 0
+        self.syncs = 0
+
+    def series(self, symbol, timeframe):
+        key = (symbol, int(timeframe))
+        series = self._series.get(key)
+        if series is None:
+            with self._lock:
+                series = self._series.get(key)
+                if series is None:
+                    path = os.path.join(self.root, symbol, timeframe_name(timeframe))
+                    series = self._series[key] = BarSeries(path, timeframe)
+        return series
+
+    # -----------------------
+    # Reads
+    # -----------------------
+    def columns(self, symbol, timeframe, date_from=None, date_to=None, fields=None):
+        return self.series(symbol, timeframe).columns(date_from, date_to, fields)
+
+    def rates(self, symbol, timeframe, date_from=None, date_to=None):
+        return self.series(symbol, timeframe).rates(date_from, date_to)
+
+    def tail(self, symbol, timeframe, count):
+        return self.series(symbol, timeframe).tail(count)
+
+    def symbol_info(self, symbol):
+        """Contract details saved at the last sync ({} if never synced)."""
+        try:
+            with open(os.path.join(self.root, symbol, "symbol.json"), encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return {}
+
+    # -----------------------
+    # Terminal sync
+    # -----------------------
+    def _fetch_range(self, symbol, timeframe, start, end):
+        """copy_rates_range over [start, end] in CHUNK_BARS pieces (epoch seconds)."""
+        step = timeframe_seconds(timeframe)
+        parts = []
+        while start <= end:
+            stop = min(end, start + CHUNK_BARS * step)
+            rates = mt5.copy_rates_range(symbol, timeframe, _utc(start), _utc(stop))
+            if rates is not None and len(rates):
+                parts.append(rates)
+                start = int(rates["time"][-1]) + 1
+            else:
+                start = stop + 1
+        if not parts:
+            return None
+        return np.concatenate(parts) if len(parts) > 1 else parts[0]
+
+    def sync(self, symbol, timeframe, history_days=DEFAULT_HISTORY_DAYS, backfill=True):
+        """
+        Append every bar closed since the last stored one (the last
+        `history_days` for a new series) and backfill pending gaps.
+        Returns {"appended": n, "backfilled": n, "bars": total}.
+        """
+        series = self.series(symbol, timeframe)
+        series.reload()
+        now = int(time.time())
+        start = series.last_time + 1 if len(series) else now - int(history_days * 86400)
+        rates = self._fetch_range(symbol, timeframe, start, now + SERVER_AHEAD)
+        appended = 0
+        if rates is not None and len(rates) > 1:
+            appended = series.append(rates[:-1])  # newest bar is still forming
+        backfilled = self.backfill(symbol, timeframe, pending_only=True) if backfill else 0
+
+        info = mt5.symbol_info(symbol)
+        if info is not None:
+            saved = {f: getattr(info, f, None) for f in INFO_FIELDS}
+            saved["synced_at"] = now
+            _write_json(os.path.join(self.root, symbol, "symbol.json"), saved)
+        self.syncs += 1
+        self.bars_synced += appended
+        return {"appended": appended, "backfilled": backfilled, "bars": len(series)}
+
+    def backfill(self, symbol, timeframe, pending_only=False, min_bars=1, limit=MAX_BACKFILLS):
+        """
+        Ask the terminal for the bars inside holes of the series: the pending
+        ones left by appends, or (pending_only=False) every hole not checked
+        before. Returns how many bars were inserted.
+        """
+        series = self.series(symbol, timeframe)
+        with series.lock:
+            series.reload()
+            checked = {tuple(g) for g in series.meta["checked_gaps"]}
+            holes = [tuple(g) for g in series.meta["pending_gaps"]]
+            if not pending_only:
+                holes += [g for g in series.gaps(min_bars) if g not in checked and g not in holes]
+            inserted = 0
+            for before, after in holes[:limit]:
+                rates = self._fetch_range(symbol, timeframe, before + 1, after - 1)
+                found = series.insert(rates) if rates is not None else 0
+                inserted += found
+                if not found:
+                    checked.add((before, after))
+            done = set(holes[:limit])
+            series.meta["pending_gaps"] = [g for g in series.meta["pending_gaps"] if tuple(g) not in done]
+            series.meta["checked_gaps"] = sorted(list(g) for g in checked)
+            series._write_meta()
+        self.bars_backfilled += inserted
+        return inserted
+
+    def stats(self):
+        return {
+            "root": self.root,
+            "series": len(self._series),
+            "bars": sum(len(s) for s in self._series.values()),
+            "syncs": self.syncs,
+            "bars_synced": self.bars_synced,
+            "bars_backfilled": self.bars_backfilled,
+        }
+
+
+bar_store = BarStore(STORE_DIR) if STORE_DIR else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sync the local bar store from the MT5 terminal")
+    parser.add_argument("--symbols", nargs="+", required=True)
+    parser.add_argument("--timeframes", nargs="+", default=["M1"], choices=["M1", "M5", "M15", "H1", "H4", "D1"])
+    parser.add_argument("--days", type=float, default=DEFAULT_HISTORY_DAYS, help="history for new series")
+    parser.add_argument("--store", default=STORE_DIR or "bars")
+    parser.add_argument("--backfill-all", action="store_true", help="also try every hole, not just new ones")
+    args = parser.parse_args(argv)
+
+    if not mt5.initialize():
+        raise SystemExit("MT5 initialization failed. Make sure the terminal is running and logged in.")
+    store = BarStore(args.store)
+    try:
+        for symbol in args.symbols:
+            for name in args.timeframes:
+                timeframe = getattr(mt5, f"TIMEFRAME_{name}")
+                started = time.perf_counter()
+                result = store.sync(symbol, timeframe, args.days)
+                if args.backfill_all:
+                    result["backfilled"] += store.backfill(symbol, timeframe)
+                series = store.series(symbol, timeframe)
+                print(f"{symbol} {name}: +{result['appended']} bars, {result['backfilled']} backfilled, "
+                      f"{result['bars']} stored ({_utc(series.first_time) if len(series) else '-'} .. "
+                      f"{_utc(series.last_time) if len(series) else '-'}) in {time.perf_counter() - started:.2f}s")
+    finally:
+        mt5.shutdown()
+
+
+if __name__ == "__main__":
+    main()
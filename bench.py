@@ -0,0 +1,411 @@
+"""
+Benchmarks for the hot paths, with regression checks against a baseline.
+
+Runs without a terminal: on the simulated backend (default) or on ticks
+recorded with tick_recorder.py (``--replay DIR``). Each benchmark is timed
+in `repeat` samples of `number` calls (number is calibrated so a sample
+takes long enough to measure), and the per-call median is what gets
+compared.
+
+- every run is stored as bench_results/<timestamp>.json (timings plus
+  commit, Python/NumPy versions and the data set used);
+- ``--save-baseline`` makes the run the baseline; otherwise the run is
+  compared with the baseline and the exit code is 1 when a benchmark got
+  slower than ``--threshold`` (per-benchmark overrides in THRESHOLDS or
+  with ``--threshold-for name=ratio``).
+
+    python bench.py --save-baseline
+    python bench.py --threshold 0.25 --filter trailer
+    python bench.py --replay ticks --list
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+import broker
+
+
+RESULTS_DIR = "bench_results"
+BASELINE_NAME = "baseline.json"
+DEFAULT_THRESHOLD = 0.25   # allowed slowdown of the median (0.25 = 25%)
+CANDLE_COUNTS = (100, 500, 2000)
+ATR_BARS = 2000
+BENCH_SYMBOLS = 12
+BENCH_POSITIONS = 5000
+
+# Noisier benchmarks get more room
+THRESHOLDS = {
+    "dashboard_refresh": 0.5,
+    "get_positions_df": 0.4,
+}
+
+BENCHMARKS = {}  # name -> factory(ctx) returning the callable to time
+
+
+def benchmark(name):
+    """Register `factory(ctx) -> fn` under `name`."""
+    def register(factory):
+        BENCHMARKS[name] = factory
+        return factory
+    return register
+
+
+# -----------------------
+# Data set
+# -----------------------
+class BenchContext:
+    """Backend and the symbols/timeframe the benchmarks run on."""
+
+    def __init__(self, backend, symbols, timeframe, description):
+        self.backend = backend
+        self.symbols = list(symbols)
+        self.timeframe = timeframe
+        self.description = description
+        # The symbol with the most positions (the one the trailers work hardest on)
+        counts = {}
+        for pos in backend.positions_get() or ():
+            counts[pos.symbol] = counts.get(pos.symbol, 0) + 1
+        self.symbol = max(self.symbols, key=lambda s: counts.get(s, 0))
+        self.description["symbol"] = self.symbol
+
+
+def sim_context(n_symbols=BENCH_SYMBOLS, n_positions=BENCH_POSITIONS, history_bars=max(CANDLE_COUNTS) * 2):
+    from sim_broker import SimulatedMT5
+
+    backend = SimulatedMT5(n_symbols=n_symbols, n_positions=n_positions, history_bars=history_bars, seed=7)
+    broker.set_backend(backend)
+    symbols = [s.name for s in backend.symbols_get()]
+    return BenchContext(backend, symbols, backend.TIMEFRAME_M1,
+                        {"data": "sim", "symbols": n_symbols, "positions": n_positions, "history_bars": history_bars})
+
+
+def replay_context(directory, n_positions=BENCH_POSITIONS, history_bars=max(CANDLE_COUNTS) * 2):
+    """Recorded ticks at max speed; positions are opened at market, alternating sides."""
+    from replay_broker import MAX_SPEED, ReplayMT5
+
+    backend = ReplayMT5(directory, speed=MAX_SPEED, history_bars=history_bars)
+    broker.set_backend(backend)
+    symbols = list(backend._ticks)
+    for i in range(n_positions):
+        backend.step()
+        backend.order_send({"action": backend.TRADE_ACTION_DEAL, "symbol": symbols[i % len(symbols)],
+                            "type": i % 2, "volume": 0.01, "comment": "bench"})
+    return BenchContext(backend, symbols, backend.TIMEFRAME_M1,
+                        {"data": "replay", "dir": directory, "positions": n_positions, "history_bars": history_bars})
+
+
+# -----------------------
+# Benchmarks
+# -----------------------
+def _register_analyze(count):
+    # Cold: a fresh rolling state per call, so the window load and the levels are timed
+    # (bars come from the warm bar cache, no broker fetch)
+    @benchmark(f"analyze_symbol.cold[{count}]")
+    def _analyze_cold(ctx):
+        from rolling_levels import RollingLevelState
+
+        def analyze():
+            return RollingLevelState(ctx.symbol, ctx.timeframe, count).update().levels()
+        analyze()
+        return analyze
+
+    @benchmark(f"levels_from_rates[{count}]")
+    def _levels(ctx):
+        from levels import levels_from_rates
+        rates = ctx.backend.copy_rates_from_pos(ctx.symbol, ctx.timeframe, 0, count)
+        return lambda: levels_from_rates(rates)
+
+    # Warm: what a refresh costs when no new bar arrived (the rolling state is reused)
+    @benchmark(f"analyze_symbol.warm[{count}]")
+    def _analyze_warm(ctx):
+        from mt5_helpers import analyze_symbol
+        return lambda: analyze_symbol(ctx.symbol, ctx.timeframe, count)
+
+
+for _count in CANDLE_COUNTS:
+    _register_analyze(_count)
+
+
+def _register_atr(method):
+    @benchmark(f"atr_streaming[{method}]")
+    def _streaming(ctx):
+        from indicators import StreamingATR
+        rates = ctx.backend.copy_rates_from_pos(ctx.symbol, ctx.timeframe, 0, ATR_BARS)
+        return lambda: StreamingATR(14, method).seed(rates).value()
+
+    @benchmark(f"atr_series[{method}]")
+    def _series(ctx):
+        from indicators import atr_series
+        rates = ctx.backend.copy_rates_from_pos(ctx.symbol, ctx.timeframe, 0, ATR_BARS)
+        return lambda: atr_series(rates, 14, method)
+
+
+for _method in ("simple", "wilder"):
+    _register_atr(_method)
+
+
+@benchmark("calculate_atr")
+def _calculate_atr(ctx):
+    from mt5_helpers import calculate_atr
+    return lambda: calculate_atr(ctx.symbol, ctx.timeframe, 14)
+
+
+@benchmark("multi_timeframe_levels")
+def _multi_timeframe(ctx):
+    from resample import mtf_timeframes, multi_timeframe_levels
+    timeframes = mtf_timeframes(("M1", "M5", "M15", "H1"))
+    return lambda: multi_timeframe_levels([ctx.symbol], timeframes, CANDLE_COUNTS[0])
+
+
+@benchmark("candle_trailer.run")
+def _candle_trailer(ctx):
+    from sltp_engine import SLTPEngine
+    from strategies.candle_trailer import CandleTrailingStop
+    trailer = CandleTrailingStop(ctx.symbol, ctx.timeframe, profit_trigger_pips=1, lookback_candles=3)
+    # Proposals only: sending would change the positions between samples
+    return lambda: trailer.run(SLTPEngine())
+
+
+@benchmark("atr_trailer.run")
+def _atr_trailer(ctx):
+    from sltp_engine import SLTPEngine
+    from strategies.atr_trailer import ATRTrailingStop
+    trailer = ATRTrailingStop(ctx.symbol, ctx.timeframe, atr_period=14, atr_mult=2.0)
+    return lambda: trailer.run(SLTPEngine())
+
+
+@benchmark("scheduler.run_pass")
+def _scheduler_pass(ctx):
+    from app_state import StateDict
+    from scheduler import StrategyScheduler
+    # Trailers only: crossing orders would add positions between samples (stops settle after one pass)
+    scheduler = StrategyScheduler(ctx.symbols, ["candle_trailer", "atr_trailer"], ctx.timeframe,
+                                  budget_ms=1e6, state=StateDict.with_defaults())
+    return scheduler.run_pass
+
+
+@benchmark("position_book.candle_trail")
+def _position_book(ctx):
+    from position_book import PositionBook, candle_trail_stops
+    from positions import positions_snapshot, refresh_positions
+    refresh_positions()
+
+    def evaluate():
+        book = PositionBook(positions_snapshot()).load_quotes()
+        low_min = book.per_symbol({s: book.bid[i] - 100 * book.point[i] for i, s in enumerate(book.symbols)})
+        high_max = book.per_symbol({s: book.ask[i] + 100 * book.point[i] for i, s in enumerate(book.symbols)})
+        return candle_trail_stops(book, 0, low_min, high_max)
+    return evaluate
+
+
+@benchmark("get_positions_df")
+def _positions_df(ctx):
+    from mt5_helpers import get_positions_df
+    from positions import invalidate_positions
+
+    def refresh():
+        invalidate_positions()
+        return get_positions_df()
+    return refresh
+
+
+@benchmark("get_positions_for_symbol")
+def _positions_for_symbol(ctx):
+    from mt5_helpers import get_positions_for_symbol
+    from positions import refresh_positions
+    refresh_positions()
+    return lambda: get_positions_for_symbol(ctx.symbol)
+
+
+@benchmark("plot_candlestick.build")
+def _plot_build(ctx):
+    from charts import _columns, _line_values, build_figure, decimate_ohlc
+    from levels import levels_from_rates
+    rates = ctx.backend.copy_rates_from_pos(ctx.symbol, ctx.timeframe, 0, 500)
+    lines = _line_values(levels_from_rates(rates), float(rates["close"][-1]))
+    return lambda: build_figure(ctx.symbol, decimate_ohlc(_columns(rates)), lines, f"{ctx.symbol} — M1")
+
+
+@benchmark("dashboard_refresh")
+def _dashboard(ctx):
+    from streamlit.testing.v1 import AppTest
+    app = AppTest.from_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), "streamlit_mt5_dashboard.py"),
+                            default_timeout=120)
+    app.run()  # first run builds the caches; the timed ones are steady-state refreshes
+    if app.exception:
+        raise RuntimeError(f"dashboard raised: {app.exception[0].value}")
+    return app.run
+
+
+# -----------------------
+# Timing
+# -----------------------
+def measure(fn, repeat=7, min_time=0.5, warmup=1):
+    """Per-call timings (ms) of `fn` over `repeat` samples; number per sample calibrated to ~min_time total."""
+    for _ in range(warmup):
+        fn()
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed * repeat >= min_time or number >= 100000:
+            break
+        number *= 10 if elapsed * repeat * 10 < min_time else 2
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - started) / number * 1000.0)
+    return {
+        "median_ms": round(statistics.median(samples), 6),
+        "min_ms": round(min(samples), 6),
+        "mean_ms": round(statistics.fmean(samples), 6),
+        "stdev_ms": round(statistics.stdev(samples), 6) if len(samples) > 1 else 0.0,
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+def run_benchmarks(ctx, names, repeat=7, min_time=0.5, echo=print):
+    results = {}
+    for name in names:
+        try:
+            fn = BENCHMARKS[name](ctx)
+            results[name] = measure(fn, repeat, min_time)
+            echo(f"{name:<28} {results[name]['median_ms']:>12.4f} ms  (x{results[name]['number']})")
+        except Exception as exc:
+            results[name] = {"error": f"{type(exc).__name__}: {exc}"}
+            echo(f"{name:<28} ERROR {results[name]['error']}")
+    return results
+
+
+# -----------------------
+# Storage / comparison
+# -----------------------
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def save_run(results, ctx, directory=RESULTS_DIR, baseline=False):
+    """Write the run (and the baseline, if asked); returns the run's path."""
+    os.makedirs(directory, exist_ok=True)
+    run = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": f"{platform.system()} {platform.machine()} ({os.cpu_count()} cpus)",
+        "data": ctx.description,
+        "results": results,
+    }
+    path = os.path.join(directory, f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    for target in [path] + ([os.path.join(directory, BASELINE_NAME)] if baseline else []):
+        with open(target, "w", encoding="utf-8") as fh:
+            json.dump(run, fh, indent=2)
+    return path
+
+
+def load_run(path):
+    try:
+        with open(path, encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD, overrides=None):
+    """Rows of (name, baseline ms, current ms, ratio, allowed ratio, status); status is 'regressed' past the threshold."""
+    limits = dict(THRESHOLDS, **(overrides or {}))
+    old = (baseline or {}).get("results", {})
+    rows = []
+    for name, current in results.items():
+        allowed = 1.0 + limits.get(name, threshold)
+        before = old.get(name, {})
+        if "error" in current:
+            rows.append((name, before.get("median_ms"), None, None, allowed, "error"))
+            continue
+        if "median_ms" not in before:
+            rows.append((name, None, current["median_ms"], None, allowed, "new"))
+            continue
+        ratio = current["median_ms"] / before["median_ms"] if before["median_ms"] else float("inf")
+        status = "regressed" if ratio > allowed else ("faster" if ratio < 1.0 / allowed else "ok")
+        rows.append((name, before["median_ms"], current["median_ms"], ratio, allowed, status))
+    return rows
+
+
+def format_rows(rows):
+    lines = [f"{'benchmark':<28} {'baseline ms':>12} {'current ms':>12} {'ratio':>7} {'limit':>6}  status"]
+    for name, before, current, ratio, allowed, status in rows:
+        fmt = lambda v: f"{v:12.4f}" if v is not None else f"{'-':>12}"
+        lines.append(f"{name:<28} {fmt(before)} {fmt(current)} "
+                     f"{(f'{ratio:7.2f}' if ratio is not None else '      -')} {allowed:6.2f}  {status}")
+    return "\n".join(lines)
+
+
+def _override(text):
+    name, _, value = text.partition("=")
+    if not value:
+        raise argparse.ArgumentTypeError(f"expected name=ratio, got {text!r}")
+    return name.strip(), float(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the hot paths and check for regressions")
+    parser.add_argument("--replay", metavar="DIR", help="recorded ticks (tick_recorder.py) instead of the simulator")
+    parser.add_argument("--positions", type=int, default=BENCH_POSITIONS)
+    parser.add_argument("--filter", action="append", default=[], help="only benchmarks containing this text")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds per benchmark (all samples)")
+    parser.add_argument("--results-dir", default=RESULTS_DIR)
+    parser.add_argument("--baseline", help=f"baseline run to compare with (default: <results-dir>/{BASELINE_NAME})")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="allowed slowdown, 0.25 = 25%%")
+    parser.add_argument("--threshold-for", type=_override, action="append", default=[], metavar="NAME=RATIO")
+    parser.add_argument("--list", action="store_true")
+    args = parser.parse_args(argv)
+
+    names = [n for n in BENCHMARKS if not args.filter or any(f in n for f in args.filter)]
+    if args.list:
+        print("\n".join(names))
+        return 0
+
+    ctx = replay_context(args.replay, args.positions) if args.replay else sim_context(n_positions=args.positions)
+    results = run_benchmarks(ctx, names, args.repeat, args.min_time)
+    path = save_run(results, ctx, args.results_dir, baseline=args.save_baseline)
+    print(f"\nSaved {path}")
+    if args.save_baseline:
+        print("Stored as the baseline")
+        return 0
+
+    baseline_path = args.baseline or os.path.join(args.results_dir, BASELINE_NAME)
+    baseline = load_run(baseline_path)
+    if baseline is None:
+        print(f"No baseline at {baseline_path}; run with --save-baseline to create one")
+        return 0
+    rows = compare(results, baseline, args.threshold, dict(args.threshold_for))
+    print(f"\nAgainst {baseline_path} ({baseline.get('commit')}, {baseline.get('created')}):")
+    print(format_rows(rows))
+    regressed = [r[0] for r in rows if r[5] in ("regressed", "error")]
+    if regressed:
+        print(f"\nRegressed: {', '.join(regressed)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""
+Broker backend selection.
+
+Every module talks to the terminal through the ``mt5`` proxy exported here
+instead of importing ``MetaTrader5`` directly, so the same code can run
+against the real terminal or the in-process simulator (``sim_broker``).
+
+Backend is chosen with the ``MT5_BACKEND`` environment variable:
+  - ``mt5`` (default): the official MetaTrader5 package (Windows only)
+  - ``sim``: simulated terminal, see ``sim_broker.SimulatedMT5.from_env``
+  - ``replay``: recorded ticks played back, see ``replay_broker.ReplayMT5.from_env``
+"""
+import os
+import threading
+
+from instrumentation import TIMED_CALLS, metrics, timed_call
+
+
+# Calls the project relies on; any backend has to provide these together
+# with the usual MT5 constants (TIMEFRAME_*, TRADE_ACTION_*, ORDER_*, ...).
+BROKER_CALLS = (
+    "initialize",
+    "shutdown",
+    "copy_rates_from_pos",
+    "symbol_info",
+    "symbol_info_tick",
+    "positions_get",
+    "order_send",
+    "account_info",
+    "symbols_get",
+)
+
+# MT5 timeframe constant -> bar length in seconds (values are fixed by the MT5 API)
+TIMEFRAME_SECONDS = {
+    1: 60, 2: 120, 3: 180, 4: 240, 5: 300, 6: 360, 10: 600, 12: 720,
+    15: 900, 20: 1200, 30: 1800,
+    16385: 3600, 16386: 7200, 16387: 10800, 16388: 14400,
+    16390: 21600, 16392: 28800, 16396: 43200,
+    16408: 86400, 32769: 604800,
+}
+
+_backend = None
+_lock = threading.Lock()
+_timed = {}  # (backend id, call name) -> timing wrapper
+
+
+def timeframe_seconds(timeframe):
+    """Length of one bar of an MT5 timeframe in seconds."""
+    try:
+        return TIMEFRAME_SECONDS[int(timeframe)]
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(f"Unsupported timeframe: {timeframe!r}")
+
+
+def load_backend(name=None):
+    """Create a backend by name ('mt5', 'sim' or 'replay')."""
+    name = (name or os.environ.get("MT5_BACKEND", "mt5")).strip().lower()
+    if name == "mt5":
+        import MetaTrader5 as backend
+        return backend
+    if name == "sim":
+        from sim_broker import SimulatedMT5
+        return SimulatedMT5.from_env()
+    if name == "replay":
+        from replay_broker import ReplayMT5
+        return ReplayMT5.from_env()
+    raise ValueError(f"Unknown broker backend: {name!r} (expected 'mt5', 'sim' or 'replay')")
+
+
+def get_backend():
+    """Return the active backend, loading it on first use."""
+    global _backend
+    if _backend is None:
+        with _lock:
+            if _backend is None:
+                _backend = load_backend()
+    return _backend
+
+
+def set_backend(backend):
+    """Swap the active backend (a backend object or a name for load_backend)."""
+    global _backend
+    if isinstance(backend, str):
+        backend = load_backend(backend)
+    missing = [c for c in BROKER_CALLS if not callable(getattr(backend, c, None))]
+    if missing:
+        raise TypeError(f"Broker backend is missing calls: {', '.join(missing)}")
+    with _lock:
+        _backend = backend
+        _timed.clear()
+    return backend
+
+
+class _BrokerProxy:
+    """
+    Forwards attribute access to whatever backend is active right now;
+    with instrumentation on, terminal calls come back wrapped in timers.
+    """
+
+    def __getattr__(self, name):
+        backend = get_backend()
+        if metrics.enabled and name in TIMED_CALLS:
+            key = (id(backend), name)
+            wrapper = _timed.get(key)
+            if wrapper is None:
+                wrapper = _timed[key] = timed_call(name, getattr(backend, name))
+            return wrapper
+        return getattr(backend, name)
+
+    def __repr__(self):
+        return f"<broker proxy -> {get_backend()!r}>"
+
+
+mt5 = _BrokerProxy()
@@ -1,16 +1,222 @@
-import plotly.graph_objects as go
-import streamlit as st
-
-def plot_candlestick(symbol, df, levels, last_price, timeframe_choice, key):
-    fig = go.Figure(data=[go.Candlestick(
-        x=df["time"], open=df["open"], high=df["high"], low=df["low"], close=df["close"], name=symbol
-    )])
-    for lvl_name in ["Buy1","Buy2","Buy3"]:
-        fig.add_hline(y=levels[lvl_name], line=dict(color="green", dash="dash"), annotation_text=lvl_name, annotation_position="top left")
-    for lvl_name in ["Resistance1","Resistance2","Resistance3"]:
-        fig.add_hline(y=levels[lvl_name], line=dict(color="orange", dash="dot"), annotation_text=lvl_name, annotation_position="top right")
-    if levels["Sell1"] is not None:
-        fig.add_hline(y=levels["Sell1"], line=dict(color="red", dash="dash"), annotation_text="Sell1", annotation_position="bottom left")
-    fig.add_hline(y=last_price, line=dict(color="blue", width=2), annotation_text="Last Price", annotation_position="bottom right")
-    fig.update_layout(title=f"{symbol} — {timeframe_choice}", xaxis_rangeslider_visible=False, height=520)
-    st.plotly_chart(fig, use_container_width=True, key=key)
+"""
+Candlestick charts with a per-(symbol, timeframe) figure cache.
+
+A figure is built once per closed bar: closed candles go in one trace
+(older history OHLC-decimated down to MAX_BARS), the forming candle in a
+second trace, and each level line is a fixed shape + annotation slot.
+Between bar closes only the forming candle and the lines that moved are
+patched. ``ChartCache.update`` says whether a build or patch ran, so a
+refresh that finds nothing moved sends nothing; the figure only goes out
+from ``render``. Build/patch/emit timings and the payload size of every
+emit are kept in ``chart_cache.stats()``.
+"""
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+import streamlit as st
+
+from instrumentation import metrics
+
+
+# Candles drawn per chart; longer histories keep the newest KEEP_FULL bars
+# as they are and merge the older ones into OHLC buckets
+MAX_BARS = 400
+KEEP_FULL = 200
+
+# (level key, color, dash, width, annotation position); "Last" is the last price
+LINES = (
+    ("Buy1", "green", "dash", None, "top left"),
+    ("Buy2", "green", "dash", None, "top left"),
+    ("Buy3", "green", "dash", None, "top left"),
+    ("Resistance1", "orange", "dot", None, "top right"),
+    ("Resistance2", "orange", "dot", None, "top right"),
+    ("Resistance3", "orange", "dot", None, "top right"),
+    ("Sell1", "red", "dash", None, "bottom left"),
+    ("Last", "blue", None, 2, "bottom right"),
+)
+
+
+def _columns(df):
+    """time (datetime64) / open / high / low / close arrays from a rates array or DataFrame."""
+    if isinstance(df, pd.DataFrame):
+        cols = {f: df[f].to_numpy() for f in ("open", "high", "low", "close")}
+        cols["time"] = pd.to_datetime(df["time"]).to_numpy()
+    else:
+        cols = {f: np.asarray(df[f], dtype=float) for f in ("open", "high", "low", "close")}
+        cols["time"] = np.asarray(df["time"], dtype="int64").astype("datetime64[s]")
+    return cols
+
+
+def decimate_ohlc(cols, max_bars=MAX_BARS, keep_full=KEEP_FULL):
+    """Merge the oldest bars into OHLC buckets so at most `max_bars` candles remain."""
+    n = len(cols["time"])
+    if n <= max_bars:
+        return cols
+    keep_full = min(keep_full, max_bars - 1)
+    old = n - keep_full
+    step = -(-old // (max_bars - keep_full))  # ceil
+    starts = np.arange(0, old, step)
+    ends = np.minimum(starts + step, old) - 1
+    merged = {
+        "time": cols["time"][starts],
+        "open": cols["open"][starts],
+        "high": np.maximum.reduceat(cols["high"][:old], starts),
+        "low": np.minimum.reduceat(cols["low"][:old], starts),
+        "close": cols["close"][ends],
+    }
+    return {f: np.concatenate([merged[f], cols[f][old:]]) for f in merged}
+
+
+def _line_values(levels, last_price):
+    return tuple(
+        last_price if name == "Last" else levels.get(name)
+        for name, *_ in LINES
+    )
+
+
+def _anchor(position):
+    vertical, horizontal = position.split()
+    return (0 if horizontal == "left" else 1), horizontal, ("bottom" if vertical == "top" else "top")
+
+
+def build_figure(symbol, cols, line_values, title):
+    closed = {f: v[:-1] for f, v in cols.items()}
+    forming = {f: v[-1:] for f, v in cols.items()}
+    fig = go.Figure(data=[
+        go.Candlestick(x=closed["time"], open=closed["open"], high=closed["high"], low=closed["low"],
+                       close=closed["close"], name=symbol, showlegend=False),
+        go.Candlestick(x=forming["time"], open=forming["open"], high=forming["high"], low=forming["low"],
+                       close=forming["close"], name=symbol, showlegend=False),
+    ])
+    for (name, color, dash, width, position), value in zip(LINES, line_values):
+        x, xanchor, yanchor = _anchor(position)
+        visible = value is not None
+        y = value if visible else 0.0
+        fig.add_shape(type="line", xref="paper", x0=0, x1=1, yref="y", y0=y, y1=y, visible=visible,
+                      line=dict(color=color, dash=dash, width=width))
+        fig.add_annotation(xref="paper", x=x, xanchor=xanchor, yref="y", y=y, yanchor=yanchor, visible=visible,
+                           text="Last Price" if name == "Last" else name, showarrow=False)
+    fig.update_layout(title=title, xaxis_rangeslider_visible=False, height=520)
+    return fig
+
+
+class _ChartEntry:
+    __slots__ = ("fig", "closed_key", "forming", "lines", "lock")
+
+    def __init__(self):
+        self.fig = None
+        self.closed_key = None
+        self.forming = None
+        self.lines = None
+        self.lock = threading.Lock()
+
+
+class ChartCache:
+    """(symbol, timeframe) -> cached figure, rebuilt once per closed bar."""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.patches = 0
+        self.reuses = 0
+        self.build_ms = 0.0
+        self.patch_ms = 0.0
+        self.emit_ms = 0.0
+        self.emits = 0
+        self.emit_payload_bytes = 0  # size of the last emitted figure
+        self.emitted_payload_bytes = 0  # all emits together
+
+    def _entry(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _ChartEntry()
+            return entry
+
+    def _patch(self, entry, cols, forming, lines):
+        fig = entry.fig
+        if forming != entry.forming:
+            fig.data[1].update(x=cols["time"][-1:], open=[forming[0]], high=[forming[1]],
+                               low=[forming[2]], close=[forming[3]])
+        for i, (old, new) in enumerate(zip(entry.lines, lines)):
+            if old != new:
+                visible = new is not None
+                y = new if visible else 0.0
+                fig.layout.shapes[i].update(y0=y, y1=y, visible=visible)
+                fig.layout.annotations[i].update(y=y, visible=visible)
+
+    def _update(self, entry, symbol, cols, levels, last_price, timeframe_choice):
+        closed_key = (len(cols["time"]), cols["time"][-2] if len(cols["time"]) > 1 else None)
+        forming = tuple(float(cols[f][-1]) for f in ("open", "high", "low", "close"))
+        lines = _line_values(levels, last_price)
+        title = f"{symbol} — {timeframe_choice}"
+
+        started = time.perf_counter()
+        changed = True
+        if entry.fig is None or entry.closed_key != closed_key or entry.fig.layout.title.text != title:
+            entry.fig = build_figure(symbol, decimate_ohlc(cols), lines, title)
+            self.builds += 1
+            self.build_ms += (time.perf_counter() - started) * 1000.0
+            metrics.observe("chart_seconds", time.perf_counter() - started, {"phase": "build"})
+        elif entry.forming != forming or entry.lines != lines:
+            self._patch(entry, cols, forming, lines)
+            self.patches += 1
+            self.patch_ms += (time.perf_counter() - started) * 1000.0
+            metrics.observe("chart_seconds", time.perf_counter() - started, {"phase": "patch"})
+        else:
+            self.reuses += 1
+            changed = False
+        entry.closed_key, entry.forming, entry.lines = closed_key, forming, lines
+        return changed
+
+    def update(self, symbol, df, levels, last_price, timeframe_choice):
+        """Build/patch the cached figure only as far as needed; True when either ran."""
+        cols = _columns(df)
+        if len(cols["time"]) == 0:
+            return False
+        entry = self._entry((symbol, timeframe_choice))
+        with entry.lock:
+            return self._update(entry, symbol, cols, levels, last_price, timeframe_choice)
+
+    def render(self, symbol, df, levels, last_price, timeframe_choice, key):
+        """Update the cached figure and draw it; every run that shows the chart has to send it."""
+        cols = _columns(df)
+        if len(cols["time"]) == 0:
+            return
+        entry = self._entry((symbol, timeframe_choice))
+        with entry.lock:
+            self._update(entry, symbol, cols, levels, last_price, timeframe_choice)
+
+            started = time.perf_counter()
+            st.plotly_chart(entry.fig, use_container_width=True, key=key)
+            self.emit_ms += (time.perf_counter() - started) * 1000.0
+            metrics.observe("chart_seconds", time.perf_counter() - started, {"phase": "emit"})
+            self.emits += 1
+            # The figure JSON as it goes to the browser
+            self.emit_payload_bytes = len(pio.to_json(entry.fig, validate=False))
+            self.emitted_payload_bytes += self.emit_payload_bytes
+
+    def stats(self):
+        return {
+            "charts": len(self._entries),
+            "builds": self.builds,
+            "patches": self.patches,
+            "reuses": self.reuses,
+            "avg_build_ms": round(self.build_ms / self.builds, 2) if self.builds else None,
+            "avg_patch_ms": round(self.patch_ms / self.patches, 2) if self.patches else None,
+            "avg_emit_ms": round(self.emit_ms / self.emits, 2) if self.emits else None,
+            "last_emit_payload_bytes": self.emit_payload_bytes,
+            "emitted_payload_bytes": self.emitted_payload_bytes,
+        }
+
+
+chart_cache = ChartCache()
+
+
+def plot_candlestick(symbol, df, levels, last_price, timeframe_choice, key):
+    chart_cache.render(symbol, df, levels, last_price, timeframe_choice, key)
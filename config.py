@@ -1,54 +1,94 @@
-import streamlit as st
-import pytz
-
-tz = pytz.timezone("Asia/Karachi")
-
-def setup_page():
-    st.set_page_config(page_title="Bloomberg Terminal V2", layout="wide")
-    st.title("Bloomberg Terminal V2")
-
-    # Quote with custom spacing
-    st.markdown("""
-    <div style='margin-top: -15px; margin-bottom: 25px; color: gray; font-style: italic; font-size: 16px;'><h4>
-        “Trade with discipline, not with emotions.”</h4>
-    </div>
-""", unsafe_allow_html=True)
-def sidebar_controls():
-    with st.sidebar:
-        st.header("App Controls")
-        refresh_seconds = st.number_input("Auto-refresh interval (seconds)", min_value=2, max_value=60, value=6)
-        lot_size = st.number_input("Default Lot Size", min_value=0.01, step=0.01, value=0.01)
-        default_sl_points = st.number_input("Default SL (points, 0 = no SL)", min_value=0, value=0, step=1)
-        default_tp_points = st.number_input("Default TP (points, 0 = auto from levels)", min_value=0, value=0, step=1)
-        #st.markdown("---")
-       # st.write("Symbols are loaded from your MT5 terminal (Market Watch).")
-        #st.write("Test with demo account. Auto-trade will place live orders when enabled.")
-    return refresh_seconds, lot_size, default_sl_points, default_tp_points
-
-def top_controls(all_symbols):
-    import MetaTrader5 as mt5
-    col1, col2 = st.columns([2, 1])
-    with col1:
-        timeframe_map = {
-            "1 Minute": mt5.TIMEFRAME_M1,
-            "5 Minutes": mt5.TIMEFRAME_M5,
-            "15 Minutes": mt5.TIMEFRAME_M15,
-            "1 Hour": mt5.TIMEFRAME_H1,
-            "4 Hours": mt5.TIMEFRAME_H4,
-            "1 Day": mt5.TIMEFRAME_D1
-        }
-        timeframe_choice = st.selectbox("Timeframe", list(timeframe_map.keys()), index=0)
-        timeframe = timeframe_map[timeframe_choice]
-
-        num_candles = st.slider("Number of candles to fetch",min_value=20, max_value=800, value=200)
-        selected_symbols = st.multiselect(
-            "Select symbols to analyze (choose from MT5 Market Watch)",
-            options=all_symbols,
-            #default=[s for s in ["XAUUSDm","GBPJPYm","GBPUSDm", "USDJPYm","EURUSDm"] if s in all_symbols]
-            default=[s for s in ["BTCUSDm"] if s in all_symbols]
-        )
-    with col2:
-        positions_all = mt5.positions_get()
-        total_open = len(positions_all) if positions_all is not None else 0
-        st.metric("Open Positions (total)", total_open)
-    return timeframe, timeframe_choice, num_candles, selected_symbols
+import streamlit as st
+import pytz
+
+tz = pytz.timezone("Asia/Karachi")
+
+# Selector label -> MT5 timeframe name
+TIMEFRAME_LABELS = {
+    "1 Minute": "M1",
+    "5 Minutes": "M5",
+    "15 Minutes": "M15",
+    "1 Hour": "H1",
+    "4 Hours": "H4",
+    "1 Day": "D1",
+}
+
+def setup_page():
+    st.set_page_config(page_title="Bloomberg Terminal V2", layout="wide")
+    st.title("Bloomberg Terminal V2")
+
+    # Quote with custom spacing
+    st.markdown("""
+    <div style='margin-top: -15px; margin-bottom: 25px; color: gray; font-style: italic; font-size: 16px;'><h4>
+        “Trade with discipline, not with emotions.”</h4>
+    </div>
+""", unsafe_allow_html=True)
+def sidebar_controls():
+    with st.sidebar:
+        st.header("App Controls")
+        refresh_seconds = st.number_input("Auto-refresh interval (seconds)", min_value=2, max_value=60, value=6)
+        lot_size = st.number_input("Default Lot Size", min_value=0.01, step=0.01, value=0.01)
+        default_sl_points = st.number_input("Default SL (points, 0 = no SL)", min_value=0, value=0, step=1)
+        default_tp_points = st.number_input("Default TP (points, 0 = auto from levels)", min_value=0, value=0, step=1)
+        #st.markdown("---")
+       # st.write("Symbols are loaded from your MT5 terminal (Market Watch).")
+        #st.write("Test with demo account. Auto-trade will place live orders when enabled.")
+    return refresh_seconds, lot_size, default_sl_points, default_tp_points
+
+def top_controls(all_symbols):
+    from broker import mt5
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        timeframe_map = {
+            "1 Minute": mt5.TIMEFRAME_M1,
+            "5 Minutes": mt5.TIMEFRAME_M5,
+            "15 Minutes": mt5.TIMEFRAME_M15,
+            "1 Hour": mt5.TIMEFRAME_H1,
+            "4 Hours": mt5.TIMEFRAME_H4,
+            "1 Day": mt5.TIMEFRAME_D1
+        }
+        timeframe_choice = st.selectbox("Timeframe", list(timeframe_map.keys()), index=0)
+        timeframe = timeframe_map[timeframe_choice]
+
+        num_candles = st.slider("Number of candles to fetch",min_value=20, max_value=800, value=200)
+        selected_symbols = st.multiselect(
+            "Select symbols to analyze (choose from MT5 Market Watch)",
+            options=all_symbols,
+            #default=[s for s in ["XAUUSDm","GBPJPYm","GBPUSDm", "USDJPYm","EURUSDm"] if s in all_symbols]
+            default=[s for s in ["BTCUSDm"] if s in all_symbols]
+        )
+    with col2:
+        from positions import positions_snapshot
+        total_open = len(positions_snapshot())
+        st.metric("Open Positions (total)", total_open)
+    return timeframe, timeframe_choice, num_candles, selected_symbols
+
+def multi_timeframe_controls(timeframe_choice):
+    """
+    Optional multi-timeframe mode: levels of several timeframes resampled
+    from one base-timeframe fetch. Returns (timeframes, autotrade timeframe
+    name); timeframes is empty when the mode is off.
+    """
+    from broker import mt5
+    enabled = st.checkbox("Multi-timeframe levels", value=False,
+                          help="Fetch the smallest selected timeframe once and build the others from it.")
+    if not enabled:
+        return [], TIMEFRAME_LABELS[timeframe_choice]
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        labels = st.multiselect("Level timeframes", list(TIMEFRAME_LABELS), default=list(TIMEFRAME_LABELS))
+    with col2:
+        autotrade_choice = st.selectbox("Auto-trade on levels of",
+                                        [timeframe_choice] + [l for l in labels if l != timeframe_choice])
+    timeframes = [getattr(mt5, f"TIMEFRAME_{TIMEFRAME_LABELS[label]}") for label in labels]
+    return timeframes, TIMEFRAME_LABELS[autotrade_choice]
+
+
+def strategy_controls():
+    """Sidebar picker for the scheduler: (strategy names, time budget per strategy in ms)."""
+    from scheduler import DEFAULT_BUDGET_MS, DEFAULT_STRATEGIES, load_strategies
+    with st.sidebar.expander("Strategies", expanded=False):
+        names = st.multiselect("Active strategies", sorted(load_strategies()), default=list(DEFAULT_STRATEGIES))
+        budget_ms = st.number_input("Time budget per strategy (ms per refresh)", min_value=1.0,
+                                    value=DEFAULT_BUDGET_MS, step=5.0)
+    return names, budget_ms
@@ -0,0 +1,359 @@
+"""
+Multi-account coordinator.
+
+The MT5 Python API binds a process to one terminal and one account, so
+every configured account gets its own worker process running a
+TradingEngine (data fetch, levels, autotrade, trailers) against its own
+terminal. Each worker publishes its engine snapshot to
+``<state dir>/<account>.json``; the coordinator restarts workers that die
+(with a backoff), and merges their snapshots into one ``accounts.json``
+with every position, combined balance/equity/profit, the logs of all
+accounts and a health row per worker (alive, restarts, staleness,
+cycles/s, ticks/s, broker calls/s, orders). The dashboard started with
+MT5_ACCOUNTS_STATE pointing at that file shows the consolidated view.
+
+Accounts file (JSON list); everything but name and symbols is optional:
+
+    [{"name": "live-1", "symbols": ["EURUSDm", "XAUUSDm"], "timeframe": "M1",
+      "interval": 2, "lot": 0.01, "tick_loop": false, "strategies": ["level_cross", "atr_trailer"],
+      "terminal": {"path": "C:/MT5-1/terminal64.exe", "login": 123, "password": "...", "server": "..."},
+      "env": {"MT5_BACKEND": "mt5"}}]
+
+    python coordinator.py --accounts accounts.json
+    python coordinator.py --sim 3 --symbols EURUSDm XAUUSDm     # three simulated terminals
+    MT5_ACCOUNTS_STATE=accounts/accounts.json streamlit run streamlit_mt5_dashboard.py
+
+Workers log to ``<MT5_LOG_DIR>/<account>/``; the bar store is single-writer,
+so a worker only uses one when its ``env`` sets MT5_BAR_STORE.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import time
+
+
+DEFAULT_STATE_DIR = os.environ.get("MT5_ACCOUNTS_DIR", "accounts")
+AGGREGATE_FILE = "accounts.json"
+LOG_KEEP = 200  # newest merged entries per log channel
+RESTART_BACKOFF = (1.0, 2.0, 5.0, 10.0, 30.0)  # seconds before the n-th consecutive restart
+STOP_TIMEOUT = 10.0
+
+log = logging.getLogger("coordinator")
+
+
+# -----------------------
+# Accounts
+# -----------------------
+def load_accounts(path):
+    """Read and check the accounts file."""
+    with open(path, encoding="utf-8") as fh:
+        accounts = json.load(fh)
+    if not isinstance(accounts, list) or not accounts:
+        raise ValueError(f"{path}: expected a non-empty list of accounts")
+    names = set()
+    for account in accounts:
+        if not account.get("name") or not account.get("symbols"):
+            raise ValueError(f"{path}: every account needs a name and symbols")
+        if account["name"] in names:
+            raise ValueError(f"{path}: duplicate account name {account['name']!r}")
+        names.add(account["name"])
+    return accounts
+
+
+def sim_accounts(count, symbols, **options):
+    """`count` accounts on independent simulated terminals (different seeds)."""
+    return [
+        dict(options, name=f"sim-{i + 1}", symbols=list(symbols),
+             env={"MT5_BACKEND": "sim", "MT5_SIM_SEED": str(7 + i),
+                  "MT5_SIM_SYMBOLS": os.environ.get("MT5_SIM_SYMBOLS", "20"),
+                  "MT5_SIM_POSITIONS": os.environ.get("MT5_SIM_POSITIONS", "50")})
+        for i in range(count)
+    ]
+
+
+def worker_env(account):
+    """Environment of an account's worker: its own log dir, no shared bar store."""
+    env = {k: str(v) for k, v in (account.get("env") or {}).items()}
+    if "MT5_BAR_STORE" not in env:
+        env["MT5_BAR_STORE"] = ""
+    if "MT5_LOG_DIR" not in env:
+        base = os.environ.get("MT5_LOG_DIR", "logs")
+        env["MT5_LOG_DIR"] = os.path.join(base, account["name"]) if base else ""
+    env.setdefault("MT5_METRICS_PORT", "")
+    return env
+
+
+def read_json(path):
+    """A published snapshot, or None (the engine's read_state without importing the engine)."""
+    try:
+        with open(path, encoding="utf-8") as fh:
+            return json.load(fh)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _write_json(path, data):
+    """Write via a temp file + rename so the dashboard never sees half a file."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(data, fh, default=str, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def run_worker(account, state_path):
+    """Process entry point: one TradingEngine for one account."""
+    # Before the first project import: backend, log dir and bar store are read at import time
+    os.environ.update(worker_env(account))
+    signal.signal(signal.SIGTERM, _interrupt)
+    logging.basicConfig(level=logging.INFO,
+                        format=f"%(asctime)s [{account['name']}] %(name)s %(levelname)s %(message)s")
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+    from engine import TradingEngine
+    TradingEngine(
+        account["symbols"], account.get("timeframe", "M1"), account.get("candles", 200),
+        account.get("lot", 0.01), account.get("sl_points", 0), account.get("tp_points", 0),
+        account.get("interval", 2.0), state_path, account.get("autotrade", True),
+        account.get("trailer", True), account.get("tick_loop", False), account.get("terminal"),
+        account.get("strategies"),
+    ).run_forever()
+
+
+# -----------------------
+# Workers
+# -----------------------
+class Worker:
+    """One account's process plus what the coordinator knows about it."""
+
+    def __init__(self, account, state_path):
+        self.account = account
+        self.name = account["name"]
+        self.state_path = state_path
+        self.process = None
+        self.started_at = None
+        self.restarts = 0
+        self.failures = 0  # consecutive deaths without a fresh snapshot
+        self.next_start = 0.0
+        self.exit_code = None
+        self.stopping = False
+        self._last = None  # (updated, cycle, ticks, broker calls) of the previous poll
+        self.rates = {}
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def start(self, context):
+        self.process = context.Process(target=run_worker, args=(self.account, self.state_path),
+                                       name=f"mt5-{self.name}", daemon=False)
+        self.process.start()
+        self.started_at = time.time()
+        self.exit_code = None
+        log.info("worker %s started (pid %s)", self.name, self.process.pid)
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        self.stopping = True
+        if self.process is None:
+            return
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout)
+            if self.process.is_alive():
+                self.process.kill()
+                self.process.join()
+        self.exit_code = self.process.exitcode
+
+    def update_rates(self, snapshot):
+        """Throughput since the previous snapshot (cycles, ticks and broker calls per second)."""
+        calls = sum(row["count"] for row in (snapshot.get("metrics") or {}).get("histograms", ())
+                    if row["name"] == "broker_call_seconds")
+        ticks = (snapshot.get("ticks") or {}).get("ticks", 0)
+        current = (snapshot["updated"], snapshot["cycle"], ticks, calls)
+        previous, self._last = self._last, current
+        if previous is None or current[0] <= previous[0]:
+            return
+        if current[1] < previous[1]:
+            # Restarted worker: counters started over
+            self.rates = {}
+            return
+        elapsed = current[0] - previous[0]
+        self.rates = {
+            "cycles_per_sec": round((current[1] - previous[1]) / elapsed, 3),
+            "ticks_per_sec": round((current[2] - previous[2]) / elapsed, 1),
+            "broker_calls_per_sec": round((current[3] - previous[3]) / elapsed, 1),
+        }
+
+
+class Coordinator:
+    """Starts one worker per account, keeps them running and aggregates their state."""
+
+    def __init__(self, accounts, state_dir=DEFAULT_STATE_DIR, interval=2.0):
+        self.state_dir = state_dir
+        self.interval = float(interval)
+        self.path = os.path.join(state_dir, AGGREGATE_FILE)
+        self.workers = [Worker(a, os.path.join(state_dir, f"{a['name']}.json")) for a in accounts]
+        # spawn everywhere: a fresh interpreter per terminal, nothing inherited from this process
+        self.context = multiprocessing.get_context("spawn")
+        self.started = None
+
+    def start(self):
+        os.makedirs(self.state_dir, exist_ok=True)
+        self.started = time.time()
+        for worker in self.workers:
+            worker.start(self.context)
+
+    def stop(self):
+        for worker in self.workers:
+            worker.stop()
+        log.info("coordinator stopped")
+
+    def supervise(self, now=None):
+        """Restart dead workers, RESTART_BACKOFF apart while they keep dying."""
+        now = time.time() if now is None else now
+        for worker in self.workers:
+            if worker.stopping or worker.alive:
+                continue
+            if worker.process is not None and worker.exit_code is None:
+                worker.exit_code = worker.process.exitcode
+                delay = RESTART_BACKOFF[min(worker.failures, len(RESTART_BACKOFF) - 1)]
+                worker.failures += 1
+                worker.next_start = now + delay
+                log.warning("worker %s exited with %s, restarting in %.0fs", worker.name, worker.exit_code, delay)
+            if now >= worker.next_start:
+                worker.restarts += 1
+                worker.start(self.context)
+
+    # -----------------------
+    # Aggregation
+    # -----------------------
+    def health(self, worker, snapshot, now):
+        age = now - snapshot["updated"] if snapshot else None
+        interval = float(worker.account.get("interval", 2.0))
+        if worker.alive:
+            if snapshot is None or snapshot["updated"] < worker.started_at:
+                status = "starting"
+            elif age > 3 * interval + 5:
+                status = "stale"
+            else:
+                status = "running"
+        else:
+            status = "stopped" if worker.stopping else "restarting"
+        orders = (snapshot or {}).get("orders") or {}
+        return {
+            "account": worker.name,
+            "status": status,
+            "pid": worker.process.pid if worker.process is not None else None,
+            "restarts": worker.restarts,
+            "exit_code": worker.exit_code,
+            "uptime_s": round(now - worker.started_at, 1) if worker.alive else None,
+            "age_s": round(age, 1) if age is not None else None,
+            "cycle": snapshot["cycle"] if snapshot else None,
+            "cycle_ms": snapshot["cycle_ms"] if snapshot else None,
+            **{k: worker.rates.get(k) for k in ("cycles_per_sec", "ticks_per_sec", "broker_calls_per_sec")},
+            "orders_done": orders.get("done"),
+            "orders_failed": orders.get("failed"),
+            "orders_pending": orders.get("pending"),
+            "symbols": len(worker.account["symbols"]),
+        }
+
+    def aggregate(self, now=None):
+        """One consolidated snapshot of every worker's latest state."""
+        now = time.time() if now is None else now
+        health, positions, accounts = [], [], []
+        logs = {}
+        for worker in self.workers:
+            snapshot = read_json(worker.state_path)
+            if snapshot is not None and worker.started_at and snapshot["updated"] >= worker.started_at:
+                # A snapshot from the current process: the worker is healthy again
+                worker.failures = 0
+            if snapshot is not None:
+                worker.update_rates(snapshot)
+            health.append(self.health(worker, snapshot, now))
+            if snapshot is None:
+                continue
+            for row in snapshot["positions"]:
+                positions.append(dict(row, account=worker.name))
+            if snapshot.get("account"):
+                accounts.append(dict(snapshot["account"], account=worker.name))
+            for channel, entries in snapshot["logs"].items():
+                logs.setdefault(channel, []).extend(
+                    dict(entry, account=worker.name, msg=f"[{worker.name}] {entry.get('msg', '')}")
+                    for entry in entries
+                )
+        for channel, entries in logs.items():
+            entries.sort(key=lambda entry: entry.get("ts", 0))
+            logs[channel] = entries[-LOG_KEEP:]
+        totals = {key: round(sum(a.get(key) or 0.0 for a in accounts), 2)
+                  for key in ("balance", "equity", "profit", "margin", "margin_free")}
+        totals["positions"] = len(positions)
+        totals["accounts"] = len(accounts)
+        return {
+            "updated": now,
+            "pid": os.getpid(),
+            "started": self.started,
+            "interval": self.interval,
+            "workers": health,
+            "accounts": accounts,
+            "totals": totals,
+            "positions": positions,
+            "logs": logs,
+        }
+
+    def poll(self):
+        """Supervise once and publish the aggregate; returns it."""
+        self.supervise()
+        snapshot = self.aggregate()
+        _write_json(self.path, snapshot)
+        return snapshot
+
+    def run_forever(self, duration=None):
+        self.start()
+        log.info("coordinator: %d workers -> %s", len(self.workers), self.path)
+        deadline = time.monotonic() + duration if duration else None
+        try:
+            while deadline is None or time.monotonic() < deadline:
+                started = time.monotonic()
+                try:
+                    self.poll()
+                except Exception:
+                    log.exception("coordinator poll failed")
+                time.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+            self.poll()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run one trading engine per MT5 account and aggregate them")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--accounts", help="JSON file with the accounts (see module docstring)")
+    source.add_argument("--sim", type=int, metavar="N", help="N simulated terminals instead of real accounts")
+    parser.add_argument("--symbols", nargs="+", default=["EURUSDm", "XAUUSDm"], help="symbols for --sim")
+    parser.add_argument("--timeframe", default="M1", choices=["M1", "M5", "M15", "H1", "H4", "D1"])
+    parser.add_argument("--tick-loop", action="store_true", help="--sim workers check crossings on every tick")
+    parser.add_argument("--state-dir", default=DEFAULT_STATE_DIR)
+    parser.add_argument("--interval", type=float, default=2.0, help="seconds between aggregations")
+    parser.add_argument("--duration", type=float, help="stop after this many seconds")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    # Stop the workers on a plain kill too
+    signal.signal(signal.SIGTERM, _interrupt)
+    if args.accounts:
+        accounts = load_accounts(args.accounts)
+    else:
+        accounts = sim_accounts(args.sim, args.symbols, timeframe=args.timeframe, tick_loop=args.tick_loop)
+    Coordinator(accounts, args.state_dir, args.interval).run_forever(args.duration)
+
+
+if __name__ == "__main__":
+    main()
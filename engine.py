@@ -0,0 +1,245 @@
+"""
+Headless trading engine.
+
+Owns the MT5 connection and runs the level / autotrade / trailer logic on
+its own schedule, independent of Streamlit reruns and of how many browser
+tabs are open. After every cycle it publishes its state (levels, recent
+bars, positions, logs, account) as a JSON snapshot that is swapped in
+atomically; the dashboard started with MT5_ENGINE_STATE pointing at that
+file becomes a read-only viewer and never touches the terminal.
+
+    python engine.py --symbols BTCUSDm EURUSDm --timeframe M1 --interval 2
+    MT5_ENGINE_STATE=engine_state.json streamlit run streamlit_mt5_dashboard.py
+"""
+import argparse
+import json
+import logging
+import os
+import time
+
+from broker import mt5
+from app_state import StateDict, use_state
+from log_store import CHANNELS as LOG_CHANNELS
+from levels import last_close
+from mt5_helpers import get_positions_df, pip_and_point
+from autotrade import suggest_tp_points, execute_signal, signal_key
+from order_pipeline import apply_order_results, pipeline
+from tick_loop import TickLoop
+from symbol_catalog import catalog
+from instrumentation import metrics, serve_from_env
+from scheduler import DEFAULT_BUDGET_MS, StrategyScheduler, load_strategies
+
+
+DEFAULT_STATE_PATH = os.environ.get("MT5_ENGINE_STATE", "engine_state.json")
+LOG_KEEP = 200  # newest entries per log channel published to the viewer
+BAR_FIELDS = ("time", "open", "high", "low", "close")
+
+log = logging.getLogger("engine")
+
+
+def _json_default(value):
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+def publish_state(snapshot, path):
+    """Write the snapshot next to `path` and swap it in atomically."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(snapshot, fh, default=_json_default, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def read_state(path):
+    """Latest published snapshot, or None if the engine hasn't written one yet."""
+    try:
+        with open(path, encoding="utf-8") as fh:
+            return json.load(fh)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def timeframe_from_name(name):
+    """'M1', 'H4', ... -> MT5 timeframe constant."""
+    return getattr(mt5, f"TIMEFRAME_{name.upper()}")
+
+
+class TradingEngine:
+    def __init__(self, symbols, timeframe_name="M1", num_candles=200, lot_size=0.01,
+                 default_sl_points=0, default_tp_points=0, interval=2.0,
+                 state_path=DEFAULT_STATE_PATH, autotrade=True, trailer=True, tick_loop=False,
+                 terminal=None, strategies=None, budget_ms=DEFAULT_BUDGET_MS):
+        """
+        - symbols: symbols to analyze and trade
+        - timeframe_name: 'M1', 'M5', 'M15', 'H1', 'H4' or 'D1'
+        - interval: seconds between cycles
+        - state_path: where the snapshot for the dashboard is published
+        - autotrade / trailer: enable level crossings / candle trailing stop
+        - tick_loop: detect crossings on every tick (asyncio TickLoop) instead of once per cycle
+        - terminal: mt5.initialize keyword arguments (path, login, password, server, ...)
+        - strategies: registered strategy names (default: level_cross unless the tick
+          loop trades, candle_trailer), run by a StrategyScheduler with `budget_ms` each
+        """
+        self.symbols = list(symbols)
+        self.timeframe_name = timeframe_name
+        self.timeframe = timeframe_from_name(timeframe_name)
+        self.num_candles = int(num_candles)
+        self.lot_size = lot_size
+        self.default_sl_points = default_sl_points
+        self.default_tp_points = default_tp_points
+        self.interval = float(interval)
+        self.state_path = state_path
+        self.autotrade = autotrade
+        self.trailer = trailer
+        self.terminal = dict(terminal or {})
+        self.state = use_state(StateDict.with_defaults())
+        if strategies is None:
+            strategies = ([] if not autotrade or tick_loop else ["level_cross"]) + (["candle_trailer"] if trailer else [])
+        self.scheduler = StrategyScheduler(
+            self.symbols, strategies, self.timeframe, self.num_candles, lot_size,
+            default_sl_points, default_tp_points, budget_ms,
+            symbol_filter=lambda s: self.state.autotrade.get(s, True), state=self.state,
+        )
+        # Stops proposed by all trailers in a cycle, sent once per ticket at the end
+        self.sltp = self.scheduler.sltp
+        self.cycles = 0
+        self.last_cycle_ms = 0.0
+        # Latest levels and (suggested TP points, point) per symbol, read by the tick loop
+        self.levels = {}
+        self.tp_info = {}
+        self.tick_loop = TickLoop(self.symbols, self.levels.get, self.on_tick_signal) if tick_loop else None
+
+    def on_tick_signal(self, symbol, side, price, tick):
+        """Order path for crossings found by the tick loop (runs on a worker thread)."""
+        if not self.autotrade or not self.state.autotrade.get(symbol, True) or symbol not in self.tp_info:
+            return
+        suggested_tp_points, point = self.tp_info[symbol]
+        levels = self.levels[symbol]
+        self.state.autotrade_logs.append({
+            "time": time.strftime("%H:%M:%S"),
+            "msg": f"Tick cross {symbol}: {side} @ {price}",
+            "color": "yellow",
+            "symbol": symbol
+        })
+        execute_signal(symbol, side, price, self.lot_size, suggested_tp_points, point, self.default_tp_points,
+                       key=signal_key(symbol, side, levels))
+
+    def cycle(self):
+        """One pass: order results -> scheduler pass (positions, levels, strategies, SL/TP flush) -> publish."""
+        started = time.perf_counter()
+        apply_order_results(self.state)
+        ctx = self.scheduler.run_pass()
+        levels_by_symbol, rates_by_symbol = ctx.levels_by_symbol, ctx.rates_by_symbol
+
+        # Levels for the tick loop's crossing checks
+        for symbol, levels in levels_by_symbol.items():
+            point, _ = pip_and_point(symbol)
+            if point is None:
+                continue
+            self.levels[symbol] = levels
+            self.tp_info[symbol] = (suggest_tp_points(levels, point), point)
+
+        self.cycles += 1
+        self.last_cycle_ms = (time.perf_counter() - started) * 1000.0
+        metrics.observe("stage_seconds", self.last_cycle_ms / 1000.0, {"stage": "cycle"})
+        with metrics.span("publish"):
+            publish_state(self.snapshot(levels_by_symbol, rates_by_symbol), self.state_path)
+
+    def snapshot(self, levels_by_symbol, rates_by_symbol):
+        symbols = {}
+        for symbol in self.symbols:
+            rates = rates_by_symbol.get(symbol)
+            symbols[symbol] = {
+                "levels": levels_by_symbol.get(symbol),
+                "last_close": last_close(rates) if rates is not None else None,
+                "bars": {f: rates[f].tolist() for f in BAR_FIELDS} if rates is not None else None,
+                "last_trade": self.state.last_trade.get(symbol),
+            }
+        positions = get_positions_df()
+        account = mt5.account_info()
+        return {
+            "updated": time.time(),
+            "pid": os.getpid(),
+            "cycle": self.cycles,
+            "cycle_ms": round(self.last_cycle_ms, 2),
+            "interval": self.interval,
+            "timeframe": self.timeframe_name,
+            "symbols": symbols,
+            "positions": positions.to_dict("records"),
+            "account": account._asdict() if account else None,
+            "logs": {channel: self.state[channel][-LOG_KEEP:] for channel in LOG_CHANNELS},
+            "ticks": self.tick_loop.metrics.snapshot() if self.tick_loop else None,
+            "orders": pipeline.stats(),
+            "sltp": self.sltp.stats(),
+            "strategies": self.scheduler.stats(),
+            "metrics": metrics.snapshot(),
+        }
+
+    def run_forever(self):
+        """Run cycles every `interval` seconds until interrupted."""
+        if not mt5.initialize(**self.terminal):
+            raise SystemExit("MT5 initialization failed. Make sure the terminal is running and logged in.")
+        log.info("engine started: %d symbols, %s, every %.1fs -> %s",
+                 len(self.symbols), self.timeframe_name, self.interval, self.state_path)
+        catalog.start_refresher()
+        server = serve_from_env()
+        if server is not None:
+            log.info("metrics on %s:%s/metrics", *server.server_address[:2])
+        if self.tick_loop is not None:
+            self.tick_loop.start_in_thread()
+        try:
+            while True:
+                started = time.monotonic()
+                try:
+                    self.cycle()
+                except Exception:
+                    log.exception("engine cycle failed")
+                time.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+        except KeyboardInterrupt:
+            log.info("engine stopped after %d cycles", self.cycles)
+        finally:
+            if self.tick_loop is not None:
+                self.tick_loop.stop()
+            catalog.stop_refresher()
+            mt5.shutdown()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless MT5 trading engine")
+    parser.add_argument("--symbols", nargs="+", required=True)
+    parser.add_argument("--timeframe", default="M1", choices=["M1", "M5", "M15", "H1", "H4", "D1"])
+    parser.add_argument("--candles", type=int, default=200)
+    parser.add_argument("--lot", type=float, default=0.01)
+    parser.add_argument("--sl-points", type=int, default=0)
+    parser.add_argument("--tp-points", type=int, default=0)
+    parser.add_argument("--interval", type=float, default=2.0)
+    parser.add_argument("--state-path", default=DEFAULT_STATE_PATH)
+    parser.add_argument("--no-autotrade", action="store_true")
+    parser.add_argument("--no-trailer", action="store_true")
+    parser.add_argument("--tick-loop", action="store_true", help="detect level crossings on every tick")
+    parser.add_argument("--strategies", nargs="+", choices=sorted(load_strategies()),
+                        help="strategies to run (default: level_cross and candle_trailer)")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS,
+                        help="wall-time budget per strategy and cycle")
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on this port")
+    parser.add_argument("--no-metrics", action="store_true", help="turn the instrumentation off")
+    args = parser.parse_args(argv)
+    if args.no_metrics:
+        metrics.set_enabled(False)
+    if args.metrics_port:
+        os.environ["MT5_METRICS_PORT"] = str(args.metrics_port)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    # Streamlit helpers used by the shared code complain about the missing script context
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+    TradingEngine(
+        args.symbols, args.timeframe, args.candles, args.lot, args.sl_points, args.tp_points,
+        args.interval, args.state_path, not args.no_autotrade, not args.no_trailer, args.tick_loop,
+        strategies=args.strategies, budget_ms=args.budget_ms,
+    ).run_forever()
+
+
+if __name__ == "__main__":
+    main()
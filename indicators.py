@@ -0,0 +1,172 @@
+"""
+Streaming indicators.
+
+StreamingATR keeps the Average True Range up to date in O(1) per bar
+instead of rebuilding a DataFrame + rolling mean on every call. The last
+bar is treated as still forming: feeding a bar with the same time again
+replaces it, a newer time closes it.
+
+One instance per (symbol, timeframe, period, method) is shared by the whole
+process through ``atr_for``, which pulls new bars from the bar cache.
+"""
+import threading
+from collections import deque
+
+import numpy as np
+
+from bar_cache import get_rates
+
+
+class StreamingATR:
+    """ATR with simple (rolling mean) or Wilder smoothing, updated bar by bar."""
+
+    def __init__(self, period=14, method="simple"):
+        if method not in ("simple", "wilder"):
+            raise ValueError(f"Unknown ATR method: {method!r} (expected 'simple' or 'wilder')")
+        self.period = int(period)
+        self.method = method
+        self.reset()
+
+    def reset(self):
+        """Forget every bar (the instance stays shared; callers hold its lock)."""
+        self.last_time = None
+        self._bar = None          # forming bar (high, low, close)
+        self._prev_close = None   # close of the bar before the forming one
+        # simple: TRs of the last period-1 closed bars and their sum
+        self._closed = deque(maxlen=max(self.period - 1, 1))
+        self._closed_sum = 0.0
+        # wilder: smoothed ATR through the last closed bar
+        self._wilder = None
+        self._seed_trs = []
+        self.bars_seen = 0
+
+    def _true_range(self, high, low, prev_close):
+        if prev_close is None:
+            return high - low
+        return max(high - low, abs(high - prev_close), abs(low - prev_close))
+
+    def _close_bar(self):
+        high, low, close = self._bar
+        tr = self._true_range(high, low, self._prev_close)
+        if self.method == "simple":
+            if len(self._closed) == self._closed.maxlen:
+                self._closed_sum -= self._closed[0]
+            self._closed.append(tr)
+            self._closed_sum += tr
+        elif self._wilder is None:
+            self._seed_trs.append(tr)
+            if len(self._seed_trs) == self.period:
+                self._wilder = sum(self._seed_trs) / self.period
+                self._seed_trs = []
+        else:
+            self._wilder = (self._wilder * (self.period - 1) + tr) / self.period
+        self._prev_close = close
+
+    def update(self, time, high, low, close):
+        """Feed one bar; a bar with the last seen time replaces the forming bar."""
+        time = int(time)
+        if self.last_time is not None and time < self.last_time:
+            return self
+        if self.last_time is not None and time > self.last_time:
+            self._close_bar()
+        if self.last_time is None or time > self.last_time:
+            self.bars_seen += 1
+        self.last_time = time
+        self._bar = (float(high), float(low), float(close))
+        return self
+
+    def seed(self, rates):
+        """Feed a rates array (oldest first); bars older than the last seen one are skipped."""
+        if rates is None:
+            return self
+        for bar in rates:
+            self.update(bar["time"], bar["high"], bar["low"], bar["close"])
+        return self
+
+    def value(self):
+        """Current ATR including the forming bar, or None until `period` bars were seen."""
+        if self._bar is None:
+            return None
+        tr = self._true_range(self._bar[0], self._bar[1], self._prev_close)
+        if self.method == "simple":
+            if self.period == 1:
+                return tr
+            if len(self._closed) < self.period - 1:
+                return None
+            return (self._closed_sum + tr) / self.period
+        if self._wilder is None:
+            if len(self._seed_trs) < self.period - 1:
+                return None
+            return (sum(self._seed_trs) + tr) / self.period
+        return (self._wilder * (self.period - 1) + tr) / self.period
+
+
+def atr_series(rates, period=14, method="simple"):
+    """
+    ATR after every bar of a history (NaN until `period` bars), equal to
+    StreamingATR.value() with that bar as the forming one; vectorized for
+    'simple', one pass over floats for 'wilder'.
+    """
+    if method not in ("simple", "wilder"):
+        raise ValueError(f"Unknown ATR method: {method!r} (expected 'simple' or 'wilder')")
+    high = np.asarray(rates["high"], dtype=float)
+    low = np.asarray(rates["low"], dtype=float)
+    close = np.asarray(rates["close"], dtype=float)
+    n = len(high)
+    out = np.full(n, np.nan)
+    if n < period:
+        return out
+    prev_close = np.concatenate([[np.nan], close[:-1]])
+    tr = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+    if method == "simple":
+        csum = np.concatenate([[0.0], np.cumsum(tr)])
+        out[period - 1:] = (csum[period:] - csum[:-period]) / period
+        return out
+    value = float(tr[:period].mean())
+    out[period - 1] = value
+    values = tr.tolist()
+    for i in range(period, n):
+        value = (value * (period - 1) + values[i]) / period
+        out[i] = value
+    return out
+
+
+# Wilder smoothing depends on the whole history; seed it with this many periods
+WILDER_SEED_PERIODS = 10
+
+_atrs = {}
+_atrs_lock = threading.Lock()
+
+
+def get_atr(symbol, timeframe, period=14, method="simple"):
+    """Process-wide (StreamingATR, lock) for (symbol, timeframe, period, method)."""
+    key = (symbol, int(timeframe), int(period), method)
+    entry = _atrs.get(key)
+    if entry is None:
+        with _atrs_lock:
+            entry = _atrs.setdefault(key, (StreamingATR(period, method), threading.Lock()))
+    return entry
+
+
+def atr_for(symbol, timeframe, period=14, method="simple"):
+    """Up-to-date ATR value for a symbol, reading only new bars from the bar cache."""
+    atr, lock = get_atr(symbol, timeframe, period, method)
+    with lock:
+        if atr.last_time is None:
+            depth = period + 1 if method == "simple" else period * WILDER_SEED_PERIODS
+            atr.seed(get_rates(symbol, timeframe, 0, depth))
+            return atr.value()
+        count = 2
+        while True:
+            rates = get_rates(symbol, timeframe, 0, count)
+            if rates is None or len(rates) == 0 or int(rates["time"][0]) <= atr.last_time:
+                break
+            if count > period:
+                # Missed more bars than the ATR window: restart from history
+                atr.reset()
+                depth = period + 1 if method == "simple" else period * WILDER_SEED_PERIODS
+                rates = get_rates(symbol, timeframe, 0, depth)
+                break
+            count *= 4
+        atr.seed(rates)
+        return atr.value()
@@ -0,0 +1,312 @@
+"""
+Hot-path instrumentation.
+
+Process-wide latency histograms and counters, kept by the ``metrics``
+registry:
+
+- every broker call made through ``broker.mt5`` is timed per call and per
+  symbol (``broker_call_seconds``), failures are counted
+  (``broker_errors_total``), and every ``order_send`` is counted as an
+  order or a modify with its retcode;
+- refresh / engine stages are timed with ``metrics.span(stage)``
+  (``stage_seconds``), chart build / patch / emit with ``chart_seconds``;
+- ``metrics.snapshot()`` feeds the dashboard's diagnostics panel and
+  ``metrics.prometheus_text()`` the ``/metrics`` endpoint started with
+  ``metrics.serve(port)`` (``MT5_METRICS_PORT``; localhost only unless
+  ``MT5_METRICS_HOST`` says otherwise, the counters name symbols and
+  retcodes of a trading account).
+
+``MT5_METRICS=0`` (or ``metrics.set_enabled(False)``) turns it off: the
+broker proxy hands out the backend's functions unwrapped and spans become
+a shared no-op, so what is left is one attribute check per call.
+"""
+import bisect
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+log = logging.getLogger("instrumentation")
+
+DEFAULT_HOST = "127.0.0.1"
+
+# Upper bounds in seconds (Prometheus "le" buckets); +Inf is implied
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "broker_call_seconds": "Latency of terminal calls",
+    "broker_errors_total": "Terminal calls that raised or returned None/False",
+    "orders_total": "order_send deals by retcode",
+    "modifies_total": "order_send SL/TP modifications by retcode",
+    "stage_seconds": "Latency of refresh / engine cycle stages",
+    "chart_seconds": "Chart figure build / patch / emit time",
+}
+
+
+class Histogram:
+    """Fixed-bucket latency histogram (seconds)."""
+
+    __slots__ = ("counts", "count", "sum", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        """Estimate from the buckets (linear inside the bucket), in seconds."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                low = BUCKETS[i - 1] if i > 0 else 0.0
+                high = BUCKETS[i] if i < len(BUCKETS) else self.max
+                return min(low + (high - low) * (rank - seen) / n, self.max)
+            seen += n
+        return self.max
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class _Span:
+    __slots__ = ("registry", "name", "labels", "started")
+
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.name, time.perf_counter() - self.started, self.labels)
+        return False
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+class Metrics:
+    """Histograms and counters keyed by (name, labels)."""
+
+    def __init__(self, enabled=True):
+        self.enabled = bool(enabled)
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self.started = time.time()
+
+    def set_enabled(self, enabled):
+        self.enabled = bool(enabled)
+
+    # -----------------------
+    # Recording
+    # -----------------------
+    def observe(self, name, seconds, labels=None):
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram()
+            hist.observe(seconds)
+
+    def inc(self, name, value=1, labels=None):
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def span(self, stage, name="stage_seconds", **labels):
+        """`with metrics.span("analyze"):` times the block into `name`{stage=...}."""
+        if not self.enabled:
+            return _NO_SPAN
+        labels["stage"] = stage
+        return _Span(self, name, labels)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+        self.started = time.time()
+
+    # -----------------------
+    # Reading
+    # -----------------------
+    def snapshot(self):
+        """{"histograms": [row, ...], "counters": [row, ...]}, slowest total time first."""
+        with self._lock:
+            histograms = list(self._histograms.items())
+            counters = list(self._counters.items())
+        rows = []
+        for (name, labels), hist in histograms:
+            q = {p: hist.quantile(p / 100.0) for p in (50, 95, 99)}
+            rows.append({
+                "name": name, **dict(labels),
+                "count": hist.count,
+                "total_ms": round(hist.sum * 1000.0, 2),
+                "mean_ms": round(hist.sum / hist.count * 1000.0, 3) if hist.count else None,
+                **{f"p{p}_ms": round(v * 1000.0, 3) if v is not None else None for p, v in q.items()},
+                "max_ms": round(hist.max * 1000.0, 3),
+            })
+        rows.sort(key=lambda r: r["total_ms"], reverse=True)
+        counts = [{"name": name, **dict(labels), "value": value} for (name, labels), value in counters]
+        counts.sort(key=lambda r: (r["name"], -r["value"]))
+        return {"enabled": self.enabled, "since": self.started, "histograms": rows, "counters": counts}
+
+    def prometheus_text(self, prefix="mt5_"):
+        """Everything in the Prometheus text exposition format."""
+        with self._lock:
+            histograms = sorted((k, (list(h.counts), h.count, h.sum)) for k, h in self._histograms.items())
+            counters = sorted(self._counters.items())
+        lines = []
+        typed = set()
+
+        def header(name, kind):
+            if name not in typed:
+                typed.add(name)
+                if name in HELP:
+                    lines.append(f"# HELP {prefix}{name} {HELP[name]}")
+                lines.append(f"# TYPE {prefix}{name} {kind}")
+
+        for (name, labels), (counts, count, total) in histograms:
+            header(name, "histogram")
+            running = 0
+            for bound, n in zip(BUCKETS + (float("inf"),), counts):
+                running += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{prefix}{name}_bucket{_format_labels(labels + (('le', le),))} {running}")
+            lines.append(f"{prefix}{name}_sum{_format_labels(labels)} {total!r}")
+            lines.append(f"{prefix}{name}_count{_format_labels(labels)} {count}")
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{prefix}{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    # -----------------------
+    # Export endpoint
+    # -----------------------
+    def serve(self, port, host=DEFAULT_HOST):
+        """Serve /metrics on a daemon thread (idempotent); returns the server."""
+        if self._server is not None:
+            return self._server
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = registry.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        with self._lock:
+            if self._server is None:
+                self._server = ThreadingHTTPServer((host, int(port)), Handler)
+                self._server.daemon_threads = True
+                threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+        return self._server
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for k, v in labels)
+    return "{" + ",".join(escaped) + "}"
+
+
+metrics = Metrics(enabled=os.environ.get("MT5_METRICS", "1") != "0")
+
+
+def serve_from_env():
+    """Start the /metrics endpoint if MT5_METRICS_PORT is set (safe to call on every rerun)."""
+    port = os.environ.get("MT5_METRICS_PORT")
+    if port and metrics.enabled:
+        host = os.environ.get("MT5_METRICS_HOST") or DEFAULT_HOST
+        try:
+            return metrics.serve(int(port), host)
+        except OSError as exc:
+            log.warning("metrics endpoint not started on %s:%s: %s", host, port, exc)
+            return None
+    return None
+
+
+# -----------------------
+# Broker call timing
+# -----------------------
+# Calls whose first argument is the symbol
+SYMBOL_CALLS = ("copy_rates_from_pos", "copy_rates_from", "copy_rates_range", "copy_ticks_range",
+                "copy_ticks_from", "symbol_info", "symbol_info_tick", "symbol_select")
+TIMED_CALLS = SYMBOL_CALLS + ("positions_get", "order_send", "account_info", "symbols_get",
+                              "initialize", "shutdown", "orders_get", "history_deals_get")
+TRADE_ACTION_SLTP = 6
+
+
+def timed_call(name, fn):
+    """Wrap one backend function: latency per call/symbol, errors, order/modify counters."""
+    symbol_arg = name in SYMBOL_CALLS
+
+    def call(*args, **kwargs):
+        if not metrics.enabled:
+            return fn(*args, **kwargs)
+        if symbol_arg:
+            symbol = args[0] if args else kwargs.get("symbol", "")
+        elif name == "order_send":
+            symbol = (args[0] if args else kwargs.get("request", {})).get("symbol", "")
+        else:
+            symbol = kwargs.get("symbol") or ""
+        labels = {"call": name, "symbol": symbol}
+        started = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            metrics.observe("broker_call_seconds", time.perf_counter() - started, labels)
+            metrics.inc("broker_errors_total", labels={"call": name})
+            raise
+        metrics.observe("broker_call_seconds", time.perf_counter() - started, labels)
+        if result is None or result is False:
+            metrics.inc("broker_errors_total", labels={"call": name})
+        elif name == "order_send":
+            request = args[0] if args else kwargs.get("request", {})
+            kind = "modifies_total" if request.get("action") == TRADE_ACTION_SLTP else "orders_total"
+            metrics.inc(kind, labels={"symbol": symbol, "retcode": getattr(result, "retcode", "")})
+        return result
+
+    call.__name__ = name
+    call.__wrapped__ = fn
+    return call
@@ -0,0 +1,193 @@
+"""
+Vectorized level engine.
+
+Works directly on the structured arrays returned by ``copy_rates_from_pos``
+(no DataFrame, no datetime conversion) and computes the levels of many
+symbols in one call. The top-2 highs and bottom-2 lows come from an O(n)
+``np.partition`` instead of full sorts; the level arithmetic then runs once
+over the whole batch.
+"""
+import numpy as np
+import pandas as pd
+
+
+# Strategy constants: idm = (HH - LL) * IDM_RATIO, levels step by FACTOR * idm
+IDM_RATIO = 0.7
+FACTOR = 1.4
+
+LEVEL_FIELDS = (
+    "HH", "LL", "HL",
+    "PHH", "PLL", "RLL",
+    "Buy1", "Buy2", "Buy3",
+    "Resistance1", "Resistance2", "Resistance3",
+    "Sell1", "Sell2", "Sell3",
+    "SellBreakout",
+)
+
+LEVELS_DTYPE = np.dtype(
+    [("symbol", "U32"), ("bars", "<i4"), ("last_time", "<i8"), ("last_close", "<f8")]
+    + [(name, "<f8") for name in LEVEL_FIELDS]
+)
+
+
+def extremes(high, low):
+    """Return (HH, PHH, LL, PLL, HL) with O(n) partial selection; PHH/PLL are NaN for 1 bar."""
+    n = len(high)
+    if n == 0:
+        return (np.nan,) * 5
+    if n == 1:
+        return float(high[0]), np.nan, float(low[0]), np.nan, float(low[0])
+    top = np.partition(high, (n - 2, n - 1))
+    bottom = np.partition(low, (0, 1, n - 1))
+    return float(top[n - 1]), float(top[n - 2]), float(bottom[0]), float(bottom[1]), float(bottom[n - 1])
+
+
+def fill_levels(out, idm_ratio=IDM_RATIO, factor=FACTOR):
+    """Derive every level column of a LEVELS_DTYPE array from its HH/PHH/LL/PLL/RLL columns."""
+    HH, LL, PHH, PLL, RLL = out["HH"], out["LL"], out["PHH"], out["PLL"], out["RLL"]
+
+    # --- Range calculations ---
+    step = factor * ((HH - LL) * idm_ratio)
+
+    # --- Buy / Resistance levels ---
+    out["Buy1"] = HH - step
+    out["Buy2"] = out["Buy1"] - step
+    out["Buy3"] = out["Buy2"] - step
+    out["Resistance1"] = HH + step
+    out["Resistance2"] = out["Resistance1"] + step
+    out["Resistance3"] = out["Resistance2"] + step
+
+    # --- Sell levels (NaN when PLL is missing, like the old None) ---
+    dif_sell = PLL - RLL
+    out["Sell1"] = HH + dif_sell
+    out["Sell2"] = out["Sell1"] + dif_sell
+    out["Sell3"] = out["Sell2"] + dif_sell
+
+    # --- Custom Sell Breakout Level, falls back to Resistance1 ---
+    breakout = PHH + (PLL - RLL) + (HH - PHH)
+    out["SellBreakout"] = np.where(np.isnan(breakout), out["Resistance1"], breakout)
+    return out
+
+
+def extremes_rows(high, low):
+    """extremes for windows of equal length stacked as the rows of 2-D high/low arrays (one partition each)."""
+    n = high.shape[1]
+    if n == 1:
+        missing = np.full(len(high), np.nan)
+        return high[:, 0], missing, low[:, 0], missing, low[:, 0]
+    top = np.partition(high, (n - 2, n - 1), axis=1)
+    bottom = np.partition(low, (0, 1, n - 1), axis=1)
+    return top[:, n - 1], top[:, n - 2], bottom[:, 0], bottom[:, 1], bottom[:, n - 1]
+
+
+def compute_levels_batch(rates_by_symbol, idm_ratio=IDM_RATIO, factor=FACTOR):
+    """
+    Compute levels for many symbols at once.
+
+    rates_by_symbol: {symbol: rates} or iterable of (symbol, rates), where rates
+    is the MT5 structured array (fields high/low/close/time are read in place).
+    Returns a LEVELS_DTYPE array with one row per symbol that had data.
+    Series of the same length (the usual case: one window for every symbol)
+    are stacked and their extremes selected in one ``np.partition`` per group.
+    """
+    items = rates_by_symbol.items() if hasattr(rates_by_symbol, "items") else rates_by_symbol
+    items = [(s, r) for s, r in items if r is not None and len(r) > 0]
+    out = np.zeros(len(items), dtype=LEVELS_DTYPE)
+    groups = {}
+    for i, (symbol, rates) in enumerate(items):
+        groups.setdefault(len(rates), []).append(i)
+    out["symbol"] = [symbol for symbol, _ in items]
+    out["bars"] = [len(rates) for _, rates in items]
+    out["last_time"] = [rates["time"][-1] for _, rates in items]
+    out["last_close"] = [rates["close"][-1] for _, rates in items]
+    for rows in groups.values():
+        high = np.stack([items[i][1]["high"] for i in rows]).astype(float, copy=False)
+        low = np.stack([items[i][1]["low"] for i in rows]).astype(float, copy=False)
+        out["HH"][rows], out["PHH"][rows], out["LL"][rows], out["PLL"][rows], out["HL"][rows] = extremes_rows(high, low)
+    # Recent Lowest Low is the lowest low
+    out["RLL"] = out["LL"]
+    return fill_levels(out, idm_ratio, factor)
+
+
+def _rolling_top_two(values, window, largest=True):
+    """
+    Best and second best value (largest or smallest) of every full window,
+    duplicates counting twice like ``np.partition``. Windows are split into
+    disjoint power-of-two blocks (200 = 128 + 64 + 8) whose (best, second)
+    pairs are built by doubling, so everything is contiguous array math.
+    """
+    better, worse = (np.maximum, np.minimum) if largest else (np.minimum, np.maximum)
+    sentinel = -np.inf if largest else np.inf
+
+    def merge(a, b):
+        return better(a[0], b[0]), better(worse(a[0], b[0]), better(a[1], b[1]))
+
+    blocks = [(values, np.full(len(values), sentinel))]
+    while 2 ** len(blocks) <= window:
+        span = 2 ** (len(blocks) - 1)
+        best, second = blocks[-1]
+        blocks.append(merge((best[:-span], second[:-span]), (best[span:], second[span:])))
+
+    count = len(values) - window + 1
+    result, offset = None, 0
+    for k in range(len(blocks) - 1, -1, -1):
+        if window & (1 << k):
+            best, second = blocks[k]
+            block = (best[offset:offset + count], second[offset:offset + count])
+            result = block if result is None else merge(result, block)
+            offset += 1 << k
+    return result
+
+
+def rolling_levels(rates, window, idm_ratio=IDM_RATIO, factor=FACTOR):
+    """
+    Levels after every bar of a long history: row i holds the levels of
+    bars i-window+1 .. i, i.e. what ``levels_from_rates`` returns for that
+    slice. Rows before the first full window have bars < window and NaN
+    levels. All windows are evaluated together in O(n log window) array
+    operations, so years of M1 bars take a fraction of a second.
+    """
+    n = len(rates)
+    out = np.zeros(n, dtype=LEVELS_DTYPE)
+    out["bars"] = np.minimum(np.arange(1, n + 1), window)
+    out["last_time"] = rates["time"]
+    out["last_close"] = rates["close"]
+    for name in ("HH", "PHH", "LL", "PLL", "HL"):
+        out[name] = np.nan
+    if window < 2 or n < window:
+        return fill_levels(out, idm_ratio, factor)
+    high = np.asarray(rates["high"], dtype=float)
+    low = np.asarray(rates["low"], dtype=float)
+    full = slice(window - 1, None)
+    out["HH"][full], out["PHH"][full] = _rolling_top_two(high, window)
+    out["LL"][full], out["PLL"][full] = _rolling_top_two(low, window, largest=False)
+    out["HL"][full] = _rolling_top_two(low, window)[0]
+    out["RLL"] = out["LL"]
+    return fill_levels(out, idm_ratio, factor)
+
+
+def levels_to_dict(row):
+    """Convert one LEVELS_DTYPE row to the levels dict used by the UI/strategies (NaN -> None)."""
+    levels = {}
+    for name in LEVEL_FIELDS:
+        value = float(row[name])
+        levels[name] = None if np.isnan(value) else value
+    return levels
+
+
+def levels_from_rates(rates, idm_ratio=IDM_RATIO, factor=FACTOR):
+    """Levels dict for a single rates array, or None if there are no bars."""
+    batch = compute_levels_batch([("", rates)], idm_ratio, factor)
+    return levels_to_dict(batch[0]) if len(batch) else None
+
+
+def last_close(data):
+    """Close of the last bar for either a rates array or a DataFrame."""
+    return float(np.asarray(data["close"])[-1])
+
+
+def rates_to_frame(rates):
+    """DataFrame with datetime `time` column, only built when a chart needs it."""
+    df = pd.DataFrame(rates)
+    df["time"] = pd.to_datetime(df["time"], unit="s")
+    return df
@@ -0,0 +1,268 @@
+"""
+Bounded log channels with append-only persistence.
+
+execution_logs / autotrade_logs / trade_logs used to be plain lists in the
+session state that grew for as long as the dashboard stayed open. Each is
+now a LogChannel: a fixed-capacity ring buffer that still supports
+``append`` / ``extend`` / ``[-50:]`` like the old lists, plus ``query`` for
+reading a window by symbol, time range and level.
+
+Entries are stamped with ``ts`` (epoch seconds) and ``level``; those at
+or above the writer's level are batched by a background thread into an
+append-only JSONL file (``MT5_LOG_DIR``, default ``logs/``) that rotates by
+size. On startup the channels are refilled from the tail of that file, so
+the terminals show history across restarts.
+"""
+import atexit
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+
+CHANNELS = ("execution_logs", "autotrade_logs", "trade_logs")
+LEVELS = ("debug", "info", "warning", "error")
+DEFAULT_CAPACITY = 500
+
+LOG_DIR = os.environ.get("MT5_LOG_DIR", "logs")  # empty: no persistence
+LOG_FILE = "trading.jsonl"
+MAX_BYTES = 10 * 1024 * 1024
+BACKUPS = 5
+RESTORE_BYTES = 1024 * 1024  # tail of the log read back on startup
+
+
+def _level_index(level):
+    return LEVELS.index(level) if level in LEVELS else 1
+
+
+class LogChannel:
+    """Fixed-capacity ring of log entries (dicts), oldest first."""
+
+    def __init__(self, name, capacity=DEFAULT_CAPACITY, writer=None):
+        self.name = name
+        self.writer = writer
+        self._entries = deque(maxlen=int(capacity))
+        self._lock = threading.Lock()
+        self.total = 0
+
+    @property
+    def capacity(self):
+        return self._entries.maxlen
+
+    def append(self, entry, level=None):
+        entry = dict(entry)
+        entry.setdefault("ts", time.time())
+        entry.setdefault("level", level or "info")
+        with self._lock:
+            self._entries.append(entry)
+            self.total += 1
+        if self.writer is not None:
+            self.writer.write(self.name, entry)
+
+    def extend(self, entries):
+        for entry in entries:
+            self.append(entry)
+
+    def load(self, entries):
+        """Put entries back without persisting them again (startup restore)."""
+        with self._lock:
+            self._entries.extend(entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __bool__(self):
+        return len(self._entries) > 0
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._entries))
+
+    def __getitem__(self, index):
+        with self._lock:
+            if isinstance(index, slice) and index.start is not None and index.start < 0 \
+                    and index.stop is None and index.step is None:
+                # Tail window ([-n:]): copy only those entries
+                n = min(-index.start, len(self._entries))
+                tail = list(itertools.islice(reversed(self._entries), n))
+                tail.reverse()
+                return tail
+            if isinstance(index, int):
+                return self._entries[index]
+            return list(self._entries)[index]
+
+    def query(self, symbol=None, since=None, until=None, level=None, limit=None):
+        """
+        Entries matching all given filters, oldest first.
+        - symbol: entry["symbol"] equals this
+        - since / until: ts range (epoch seconds, inclusive)
+        - level: minimum level ('debug' < 'info' < 'warning' < 'error')
+        - limit: newest `limit` matches only
+        """
+        min_level = _level_index(level) if level else 0
+        out = []
+        with self._lock:
+            for entry in reversed(self._entries):
+                ts = entry.get("ts", 0)
+                if since is not None and ts < since:
+                    break
+                if until is not None and ts > until:
+                    continue
+                if symbol is not None and entry.get("symbol") != symbol:
+                    continue
+                if min_level and _level_index(entry.get("level")) < min_level:
+                    continue
+                out.append(entry)
+                if limit is not None and len(out) >= limit:
+                    break
+        out.reverse()
+        return out
+
+
+class JsonlWriter:
+    """Background, batched, append-only JSONL writer with size-based rotation."""
+
+    def __init__(self, directory, filename=LOG_FILE, max_bytes=MAX_BYTES, backups=BACKUPS,
+                 level="info", flush_interval=1.0):
+        self.path = os.path.join(directory, filename)
+        self.max_bytes = int(max_bytes)
+        self.backups = int(backups)
+        self.level = level
+        self.flush_interval = float(flush_interval)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.written = 0
+        self.errors = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, channel, entry):
+        if _level_index(entry.get("level")) < _level_index(self.level):
+            return
+        self._queue.put((channel, entry))
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                    self._thread.start()
+
+    def _rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def _write_batch(self, batch):
+        lines = "".join(
+            json.dumps(dict(entry, channel=channel), ensure_ascii=False, default=str) + "\n"
+            for channel, entry in batch
+        )
+        if os.path.exists(self.path) and os.path.getsize(self.path) + len(lines) > self.max_bytes:
+            self._rotate()
+        with open(self.path, "a", encoding="utf-8") as fh:
+            fh.write(lines)
+        self.written += len(batch)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            try:
+                self._write_batch(batch)
+            except OSError:
+                self.errors += 1
+            for _ in batch:
+                self._queue.task_done()
+
+    def flush(self, timeout=5.0):
+        """Wait until everything queued so far is on disk; False on timeout."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.02)
+        return True
+
+    def tail(self, channel, count):
+        """Last `count` persisted entries of one channel, oldest first."""
+        try:
+            with open(self.path, "rb") as fh:
+                fh.seek(0, os.SEEK_END)
+                size = fh.tell()
+                fh.seek(max(0, size - RESTORE_BYTES))
+                chunk = fh.read().decode("utf-8", errors="replace")
+        except OSError:
+            return []
+        lines = chunk.splitlines()
+        if size > RESTORE_BYTES:
+            lines = lines[1:]  # first line is probably cut
+        out = []
+        for line in reversed(lines):
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.pop("channel", None) == channel:
+                out.append(entry)
+                if len(out) >= count:
+                    break
+        out.reverse()
+        return out
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """Process-wide JsonlWriter (None when MT5_LOG_DIR is empty)."""
+    global _writer
+    if not LOG_DIR:
+        return None
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = JsonlWriter(LOG_DIR)
+                atexit.register(_writer.flush)
+    return _writer
+
+
+def new_channels(capacity=DEFAULT_CAPACITY, restore=True):
+    """{channel name: LogChannel} for one session/engine state."""
+    writer = get_writer()
+    channels = {}
+    for name in CHANNELS:
+        channel = LogChannel(name, capacity, writer)
+        if restore and writer is not None:
+            channel.load(writer.tail(name, capacity))
+        channels[name] = channel
+    return channels
+
+
+def init_log_channels(state, capacity=DEFAULT_CAPACITY):
+    """Make sure `state` holds a LogChannel per channel (old plain lists are carried over)."""
+    missing = [name for name in CHANNELS if not isinstance(state.get(name), LogChannel)]
+    if not missing:
+        return
+    channels = new_channels(capacity)
+    for name in missing:
+        old = state.get(name)
+        if old:
+            channels[name].load(old)
+        state[name] = channels[name]
@@ -0,0 +1,287 @@
+"""
+Queued order execution.
+
+Signals and manual buttons submit orders here instead of calling
+``order_send`` while the page renders. One worker thread per process sends
+them in order:
+
+- idempotency: a submit with a key already seen within `dedupe_window`
+  returns the original ticket, so two browser tabs (or a rerun) reacting to
+  the same level crossing can't open two positions;
+- retries: REQUOTE / PRICE_CHANGED / PRICE_OFF are retried up to
+  `max_retries` times with a fresh price;
+- timings: every ticket records enqueue -> first send -> result.
+
+Results are handed back through ``apply_order_results(state)``, which the
+dashboard and the engine call once per refresh/cycle to move finished
+tickets' log lines into their own state. An owner that stops draining
+(a closed browser session) has its uncollected tickets dropped after
+`owner_ttl` seconds.
+"""
+import itertools
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+
+from broker import mt5
+from mt5_helpers import send_market_order
+
+
+RETRY_RETCODES = (
+    10004,  # TRADE_RETCODE_REQUOTE
+    10020,  # TRADE_RETCODE_PRICE_CHANGED
+    10021,  # TRADE_RETCODE_PRICE_OFF
+)
+
+DEFAULT_DEDUPE_WINDOW = 60.0  # seconds a signal key blocks a second order
+KEEP_FINISHED = 200           # finished tickets kept per owner until collected
+OWNER_TTL = 600.0             # seconds without a drain before an owner's tickets are dropped
+
+
+class OrderTicket:
+    """One submitted order and what happened to it."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, key, owner, symbol, side, lot, sl_points=0, tp_price=None, comment=None):
+        self.id = next(self._ids)
+        self.key = key
+        self.owner = owner
+        self.symbol = symbol
+        self.side = side
+        self.lot = lot
+        self.sl_points = sl_points
+        self.tp_price = tp_price
+        self.comment = comment
+        self.status = "queued"  # queued -> sending -> done | failed
+        self.attempts = 0
+        self.price = None
+        self.result = None
+        self.error = None
+        self.logs = []          # trade_logs entries produced by the worker
+        self.enqueued_at = time.perf_counter()
+        self.sent_at = None
+        self.done_at = None
+        self._done = threading.Event()
+
+    @property
+    def retcode(self):
+        return getattr(self.result, "retcode", None)
+
+    def wait(self, timeout=None):
+        """Block until the worker finished this ticket; returns True if it did."""
+        return self._done.wait(timeout)
+
+    def timings_ms(self):
+        """(queue wait, send -> result) in milliseconds, None while unknown."""
+        queued = (self.sent_at - self.enqueued_at) * 1000.0 if self.sent_at else None
+        sending = (self.done_at - self.sent_at) * 1000.0 if self.done_at and self.sent_at else None
+        return queued, sending
+
+    def summary(self):
+        queued, sending = self.timings_ms()
+        return {
+            "id": self.id,
+            "symbol": self.symbol,
+            "side": self.side,
+            "status": self.status,
+            "retcode": self.retcode,
+            "attempts": self.attempts,
+            "price": self.price,
+            "order": getattr(self.result, "order", None),
+            "queue_ms": round(queued, 2) if queued is not None else None,
+            "send_ms": round(sending, 2) if sending is not None else None,
+        }
+
+
+class OrderPipeline:
+    def __init__(self, max_retries=3, retry_delay=0.05, deviation=20, dedupe_window=DEFAULT_DEDUPE_WINDOW,
+                 owner_ttl=OWNER_TTL):
+        """
+        - max_retries: extra attempts after a requote / price change / off quotes
+        - retry_delay: pause before a retry (seconds)
+        - deviation: allowed slippage in points
+        - dedupe_window: seconds an idempotency key stays reserved
+        - owner_ttl: seconds an owner may go without draining before its finished tickets are dropped
+        """
+        self.max_retries = int(max_retries)
+        self.retry_delay = float(retry_delay)
+        self.deviation = int(deviation)
+        self.dedupe_window = float(dedupe_window)
+        self.owner_ttl = float(owner_ttl)
+        self._queue = queue.Queue()
+        self._keys = {}            # key -> (ticket, reserved_at)
+        self._finished = {}        # owner -> deque of finished tickets
+        self._drained_at = {}      # owner -> last drain (or first finished ticket)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.submitted = 0
+        self.duplicates = 0
+        self.retries = 0
+        self.done = 0
+        self.failed = 0
+        self.abandoned = 0
+        self._timings = deque(maxlen=500)
+
+    # -----------------------
+    # Submitting
+    # -----------------------
+    def submit(self, symbol, side, lot, sl_points=0, tp_price=None, key=None, owner=None, comment=None):
+        """
+        Queue a market order; returns (ticket, is_new) right away.
+        With a `key` seen in the last `dedupe_window` seconds the earlier
+        ticket is returned with is_new=False and nothing is sent.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if key is not None:
+                seen = self._keys.get(key)
+                if seen is not None and now - seen[1] < self.dedupe_window:
+                    self.duplicates += 1
+                    return seen[0], False
+            ticket = OrderTicket(key or uuid.uuid4().hex, owner, symbol, side, lot, sl_points, tp_price, comment)
+            self._keys[ticket.key] = (ticket, now)
+            self._expire_keys(now)
+            self.submitted += 1
+        self._ensure_worker()
+        self._queue.put(ticket)
+        return ticket, True
+
+    def _expire_keys(self, now):
+        if len(self._keys) < 1000:
+            return
+        for key, (_, reserved_at) in list(self._keys.items()):
+            if now - reserved_at >= self.dedupe_window:
+                del self._keys[key]
+
+    # -----------------------
+    # Worker
+    # -----------------------
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._work, name="order-pipeline", daemon=True)
+                self._thread.start()
+
+    def _work(self):
+        while True:
+            ticket = self._queue.get()
+            try:
+                self._execute(ticket)
+            except Exception as exc:
+                ticket.status = "failed"
+                ticket.error = str(exc)
+                ticket.logs.append({"symbol": ticket.symbol, "msg": f"❌ {ticket.side} {ticket.symbol} failed — {exc}", "level": "error"})
+            finally:
+                ticket.done_at = time.perf_counter()
+                self._finish(ticket)
+
+    def _execute(self, ticket):
+        ticket.status = "sending"
+        ticket.sent_at = time.perf_counter()
+        tp_txt = f" | TP={ticket.tp_price:.5f}" if ticket.tp_price else ""
+        while True:
+            ticket.attempts += 1
+            result, price, error = send_market_order(
+                ticket.symbol, ticket.lot, ticket.side, ticket.sl_points, ticket.tp_price,
+                deviation=self.deviation, comment=ticket.comment,
+            )
+            if error:
+                ticket.status = "failed"
+                ticket.error = error
+                ticket.logs.append({"symbol": ticket.symbol, "msg": f"❌ {ticket.side} {ticket.symbol} failed — {error}", "level": "error"})
+                return
+            ticket.result = result
+            ticket.price = price
+            if ticket.attempts == 1:
+                ticket.logs.append({"symbol": ticket.symbol, "msg": f"⏳ Sending {ticket.side} {ticket.symbol} @ {price:.5f}{tp_txt}"})
+            if result and result.retcode in RETRY_RETCODES and ticket.attempts <= self.max_retries:
+                self.retries += 1
+                ticket.logs.append({"symbol": ticket.symbol, "msg": f"↻ Retry {ticket.side} {ticket.symbol} (RetCode={result.retcode})", "level": "warning"})
+                time.sleep(self.retry_delay)
+                continue
+            break
+        if result and result.retcode == mt5.TRADE_RETCODE_DONE:
+            ticket.status = "done"
+            ticket.logs.append({"symbol": ticket.symbol, "msg": f"✅ Executed {ticket.side} {ticket.symbol} @ {price:.5f} | Ticket={result.order}"})
+        else:
+            ticket.status = "failed"
+            ticket.logs.append({"symbol": ticket.symbol, "msg": f"❌ Failed {ticket.side} {ticket.symbol} @ {price:.5f} | RetCode={getattr(result, 'retcode', 'N/A')}", "level": "error"})
+
+    def _finish(self, ticket):
+        with self._lock:
+            if ticket.status == "done":
+                self.done += 1
+            else:
+                self.failed += 1
+            self._timings.append(ticket.timings_ms())
+            now = time.monotonic()
+            self._expire_owners(now)
+            self._drained_at.setdefault(ticket.owner, now)
+            self._finished.setdefault(ticket.owner, deque(maxlen=KEEP_FINISHED)).append(ticket)
+        ticket._done.set()
+
+    def _expire_owners(self, now):
+        for owner, drained_at in list(self._drained_at.items()):
+            if now - drained_at >= self.owner_ttl:
+                del self._drained_at[owner]
+                self.abandoned += len(self._finished.pop(owner, ()))
+
+    # -----------------------
+    # Results / stats
+    # -----------------------
+    def drain(self, owner):
+        """Finished tickets submitted by `owner` since the last drain."""
+        with self._lock:
+            finished = self._finished.pop(owner, None)
+            self._drained_at[owner] = time.monotonic()
+        return list(finished) if finished else []
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        with self._lock:
+            timings = list(self._timings)
+        queued = sorted(t[0] for t in timings if t[0] is not None)
+        sending = sorted(t[1] for t in timings if t[1] is not None)
+
+        def pct(values, q):
+            return round(values[min(len(values) - 1, int(q * len(values)))], 2) if values else None
+
+        return {
+            "pending": self.pending(),
+            "submitted": self.submitted,
+            "duplicates": self.duplicates,
+            "retries": self.retries,
+            "done": self.done,
+            "failed": self.failed,
+            "abandoned": self.abandoned,
+            "queue_ms_p50": pct(queued, 0.5),
+            "queue_ms_p99": pct(queued, 0.99),
+            "send_ms_p50": pct(sending, 0.5),
+            "send_ms_p99": pct(sending, 0.99),
+        }
+
+
+pipeline = OrderPipeline()
+
+
+def owner_id(state):
+    """Stable id for one session/engine state, used to route results back."""
+    return state.setdefault("order_owner", uuid.uuid4().hex)
+
+
+def submit_order(state, symbol, side, lot, sl_points=0, tp_price=None, key=None, comment=None):
+    """pipeline.submit on behalf of `state` (its results come back via apply_order_results)."""
+    return pipeline.submit(symbol, side, lot, sl_points, tp_price, key=key, owner=owner_id(state), comment=comment)
+
+
+def apply_order_results(state):
+    """Move finished tickets' log lines into `state.trade_logs`; returns the tickets."""
+    tickets = pipeline.drain(owner_id(state))
+    for ticket in tickets:
+        state.trade_logs.extend(ticket.logs)
+    return tickets
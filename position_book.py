@@ -0,0 +1,153 @@
+"""
+Array-backed position book and vectorized trailing-stop rules.
+
+The trailers used to walk position namedtuples one symbol at a time and
+work out profit and candidate stops per position. A PositionBook holds
+the open positions as NumPy columns (ticket, symbol id, side, open, sl,
+tp, volume) next to per-symbol bid / ask / point vectors, and
+``candle_trail_stops`` / ``atr_trail_stops`` evaluate the same rules as
+``candle_trail_sl`` / ``atr_trail_sl`` for every position of every symbol
+in one pass of array operations. They return the stop changes as a
+STOP_CHANGES_DTYPE array; ``propose_changes`` hands those to an
+SLTPEngine, which filters, rate-limits and sends them as before.
+"""
+import numpy as np
+
+from broker import mt5
+from symbol_catalog import catalog
+
+
+STOP_CHANGES_DTYPE = np.dtype([
+    ("row", "<i8"),        # position row in the book
+    ("ticket", "<i8"),
+    ("symbol_id", "<i4"),
+    ("kind", "U5"),        # "be" or "trail"
+    ("sl", "<f8"),
+])
+
+# Stand-in for "no SL" on a SELL, as in candle_trail_sl's `sl or 999999`
+NO_SELL_SL = 999999
+
+
+class PositionBook:
+    """Open positions as columns, with per-symbol quote vectors (indexed by symbol id)."""
+
+    def __init__(self, snapshot, symbols=None):
+        """
+        - snapshot: positions.PositionSnapshot (its columns are reused, no per-position Python work)
+        - symbols: only keep these symbols' positions (None: all)
+        """
+        self.snapshot = snapshot
+        columns = snapshot.columns
+        if not len(snapshot):
+            rows = np.zeros(0, dtype=np.int64)
+        elif symbols is None:
+            rows = np.arange(len(snapshot))
+        else:
+            rows = np.flatnonzero(np.isin(columns["symbol"], list(symbols)))
+        self.rows = rows
+
+        def column(name, dtype):
+            return columns[name][rows].astype(dtype) if len(rows) else np.zeros(0, dtype=dtype)
+
+        self.ticket = column("ticket", np.int64)
+        self.buy = column("type", np.int64) == mt5.POSITION_TYPE_BUY
+        self.price_open = column("price_open", float)
+        self.sl = column("sl", float)
+        self.tp = column("tp", float)
+        self.volume = column("volume", float)
+        names = columns["symbol"][rows] if len(rows) else np.zeros(0, dtype="U1")
+        self.symbols, self.symbol_id = np.unique(names, return_inverse=True)
+        self.symbol_id = self.symbol_id.astype(np.int32)
+        n = len(self.symbols)
+        self.bid = np.full(n, np.nan)
+        self.ask = np.full(n, np.nan)
+        self.point = np.full(n, np.nan)
+
+    def __len__(self):
+        return len(self.ticket)
+
+    def load_quotes(self, tick=None, point=None):
+        """Fill bid/ask/point per symbol; `tick(symbol)` and `point(symbol)` default to the terminal / catalog."""
+        tick = tick or mt5.symbol_info_tick
+        point = point or catalog.point
+        for i, symbol in enumerate(self.symbols):
+            quote = tick(symbol)
+            if quote is not None:
+                self.bid[i], self.ask[i] = quote.bid, quote.ask
+            self.point[i] = point(symbol) or np.nan
+        return self
+
+    def per_symbol(self, values):
+        """{symbol: value} -> vector over the book's symbols (NaN where missing)."""
+        found = (values.get(symbol) for symbol in self.symbols)
+        return np.array([np.nan if value is None else value for value in found], dtype=float)
+
+    def price(self):
+        """Closing price of every position: bid for a BUY, ask for a SELL."""
+        return np.where(self.buy, self.bid[self.symbol_id], self.ask[self.symbol_id])
+
+    def profit_points(self):
+        price = self.price()
+        return np.where(self.buy, price - self.price_open, self.price_open - price) / self.point[self.symbol_id]
+
+    def position(self, row):
+        """Position tuple behind book row `row` (what SLTPEngine and the logs want)."""
+        return self.snapshot.positions[self.rows[row]]
+
+    def changes(self, mask, kind, sl):
+        """STOP_CHANGES_DTYPE rows for the positions selected by `mask`."""
+        idx = np.flatnonzero(mask)
+        out = np.empty(len(idx), dtype=STOP_CHANGES_DTYPE)
+        out["row"] = idx
+        out["ticket"] = self.ticket[idx]
+        out["symbol_id"] = self.symbol_id[idx]
+        out["kind"] = kind[idx] if isinstance(kind, np.ndarray) else kind
+        out["sl"] = sl[idx]
+        return out
+
+
+def candle_trail_stops(book, profit_trigger_pips, low_min, high_max):
+    """
+    candle_trail_sl for the whole book. `low_min` / `high_max` are per-symbol
+    vectors (lowest low / highest high of the lookback candles, NaN when a
+    symbol has no bars). Returns the final stop per position after
+    coalescing: the trailing level when it applies, else break-even.
+    """
+    sid = book.symbol_id
+    low, high = low_min[sid], high_max[sid]
+    price_open, sl, buy = book.price_open, book.sl, book.buy
+    with np.errstate(invalid="ignore"):
+        triggered = (book.profit_points() >= profit_trigger_pips) & ~np.isnan(np.where(buy, low, high))
+        no_sl = sl == 0
+        be = triggered & (no_sl | np.where(buy, sl < price_open, sl > price_open))
+        trail = triggered & np.where(buy, low > sl, high < np.where(no_sl, NO_SELL_SL, sl))
+    new_sl = np.where(trail, np.where(buy, low, high), price_open)
+    kind = np.where(trail, "trail", "be")
+    return book.changes(be | trail, kind, new_sl)
+
+
+def atr_trail_stops(book, atr_distance, profit_trigger_pips, step_pips):
+    """
+    atr_trail_sl for the whole book. `atr_distance` is the per-symbol
+    ATR * multiplier vector (NaN: no ATR, no change).
+    """
+    sid = book.symbol_id
+    distance, point = atr_distance[sid], book.point[sid]
+    price, sl, buy = book.price(), book.sl, book.buy
+    with np.errstate(invalid="ignore"):
+        triggered = book.profit_points() >= profit_trigger_pips
+        new_sl = np.where(buy, price - distance, price + distance)
+        moved = np.where(buy, new_sl > sl + step_pips * point, (sl == 0) | (new_sl < sl - step_pips * point))
+        mask = triggered & moved & ~np.isnan(new_sl)
+    return book.changes(mask, "trail", new_sl)
+
+
+def propose_changes(sltp, book, changes, log=None):
+    """Queue stop changes on an SLTPEngine; `log(position, change, price)` builds each log entry."""
+    price = book.price()
+    for change in changes:
+        position = book.position(change["row"])
+        sltp.propose(position, float(change["sl"]), position.tp,
+                     log=log(position, change, float(price[change["row"]])) if log else None)
+    return len(changes)
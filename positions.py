@@ -0,0 +1,123 @@
+"""
+Process-wide snapshot of open positions.
+
+One ``mt5.positions_get()`` per refresh/engine cycle serves every consumer:
+the position counter, the per-symbol and global tables and the trailers.
+The snapshot keeps the positions in columnar form (one NumPy array per
+field) with a symbol -> rows and a ticket -> row index, so per-symbol
+lookups don't rescan or rebuild anything.
+
+Successful SL/TP modifications are patched into the snapshot; opening or
+closing a position marks it stale so the next read fetches again.
+"""
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from broker import mt5
+
+
+# Consumers reading without an explicit refresh accept a snapshot this old
+MAX_AGE = 2.0  # seconds
+
+
+class PositionSnapshot:
+    """Open positions at one point in time, columnar and indexed."""
+
+    def __init__(self, positions, taken_at=None):
+        self.positions = list(positions or ())
+        self.taken_at = time.monotonic() if taken_at is None else taken_at
+        self.fields = self.positions[0]._fields if self.positions else ()
+        self.columns = {
+            f: np.array([getattr(p, f) for p in self.positions]) for f in self.fields
+        }
+        self._by_symbol = {}
+        self._by_ticket = {}
+        for row, p in enumerate(self.positions):
+            self._by_symbol.setdefault(p.symbol, []).append(row)
+            self._by_ticket[int(p.ticket)] = row
+        self._by_symbol = {s: np.array(rows, dtype=np.int64) for s, rows in self._by_symbol.items()}
+        self._frame = None
+
+    def __len__(self):
+        return len(self.positions)
+
+    def age(self):
+        return time.monotonic() - self.taken_at
+
+    def symbols(self):
+        return list(self._by_symbol)
+
+    def rows(self, symbol=None):
+        """Row indices of one symbol's positions (all rows when symbol is None)."""
+        if symbol is None:
+            return np.arange(len(self.positions))
+        return self._by_symbol.get(symbol, np.zeros(0, dtype=np.int64))
+
+    def for_symbol(self, symbol):
+        """Position tuples for one symbol, like mt5.positions_get(symbol=...)."""
+        return tuple(self.positions[i] for i in self.rows(symbol))
+
+    def get(self, ticket):
+        """Position tuple for a ticket, or None."""
+        row = self._by_ticket.get(int(ticket))
+        return self.positions[row] if row is not None else None
+
+    def to_frame(self, symbol=None):
+        """DataFrame of all positions (or one symbol's), built from the columns."""
+        if not self.positions:
+            return pd.DataFrame()
+        if self._frame is None:
+            self._frame = pd.DataFrame(self.columns, columns=list(self.fields))
+        if symbol is None:
+            return self._frame
+        return self._frame.iloc[self.rows(symbol)]
+
+    def apply_sltp(self, ticket, sl, tp):
+        """Record a successful SL/TP modification without re-querying the terminal."""
+        row = self._by_ticket.get(int(ticket))
+        if row is None:
+            return
+        self.positions[row] = self.positions[row]._replace(sl=sl, tp=tp)
+        self.columns["sl"][row] = sl
+        self.columns["tp"][row] = tp
+        self._frame = None
+
+
+_snapshot = None
+_stale = True
+_lock = threading.Lock()
+
+
+def refresh_positions():
+    """Fetch all positions once and install them as the current snapshot."""
+    global _snapshot, _stale
+    snapshot = PositionSnapshot(mt5.positions_get())
+    with _lock:
+        _snapshot = snapshot
+        _stale = False
+    return snapshot
+
+
+def positions_snapshot(max_age=MAX_AGE):
+    """Current snapshot; fetched again only if missing, stale or older than `max_age`."""
+    snapshot = _snapshot
+    if snapshot is None or _stale or snapshot.age() > max_age:
+        return refresh_positions()
+    return snapshot
+
+
+def invalidate_positions():
+    """Positions were opened/closed: the next read fetches a fresh snapshot."""
+    global _stale
+    with _lock:
+        _stale = True
+
+
+def record_sltp(ticket, sl, tp):
+    """Patch a successful SL/TP change into the current snapshot."""
+    with _lock:
+        if _snapshot is not None:
+            _snapshot.apply_sltp(ticket, sl, tp)
@@ -0,0 +1,292 @@
+"""
+Replay backend: recorded ticks played back through the MT5 API.
+
+Ticks written by tick_recorder.py are fed to the rest of the project
+through the same calls the strategies use (``symbol_info_tick``,
+``copy_rates_from_pos``, ``positions_get``, ``order_send``, ...), so a
+production day can be replayed to debug what the strategies saw, or pushed
+through as fast as possible to measure crossing detection and trailing
+throughput on real tick bursts.
+
+Everything but the prices comes from the simulator: ``ReplayMT5`` is a
+``SimulatedMT5`` whose symbols are the recorded ones and whose mid price,
+bid/ask and forming bars follow the recorded ticks instead of a random
+walk. Orders and positions are simulated against the replayed quotes.
+
+- speed 1 (or N): the replay clock runs at N times wall time from the
+  first recorded tick (or `start`);
+- speed "max": the clock moves one recorded tick (of any symbol) forward
+  on every ``symbol_info_tick`` call, so nothing waits on wall time;
+- bar history before the replayed ticks comes from the bar store when one
+  covers the period (``MT5_BAR_STORE``), otherwise from the simulator's
+  synthetic history;
+- ``copy_ticks_range`` / ``copy_ticks_from`` return recorded ticks up to
+  the replay clock, never later ones.
+
+    MT5_BACKEND=replay MT5_REPLAY_DIR=ticks MT5_REPLAY_SPEED=10 python engine.py --symbols EURUSDm --tick-loop
+    python replay_broker.py --dir ticks --symbols EURUSDm     # crossings at max speed
+"""
+import os
+import threading
+import time
+
+import numpy as np
+
+from broker import timeframe_seconds
+from sim_broker import RATES_DTYPE, SimulatedMT5, Tick, _SymbolState, _seed_for, _to_timestamp
+from tick_recorder import read_symbol_info, read_ticks, recorded_symbols
+
+
+MAX_SPEED = "max"
+
+
+def parse_speed(value):
+    """1, 10, '10x' -> float; 'max' / 0 -> MAX_SPEED."""
+    text = str(value).strip().lower()
+    if text in ("max", "0", "inf"):
+        return MAX_SPEED
+    return float(text[:-1] if text.endswith("x") else text)
+
+
+class ReplayMT5(SimulatedMT5):
+    """SimulatedMT5 driven by recorded ticks instead of a random walk."""
+
+    def __init__(self, directory, speed=1.0, start=None, symbols=None, store=None, history_bars=2000,
+                 latency=0.0, balance=10000.0):
+        """
+        - directory: tick_recorder output directory
+        - speed: replay speed multiplier, or "max"
+        - start: replay start (datetime or epoch seconds; default: first recorded tick)
+        - symbols: subset of the recorded symbols (default: all)
+        - store: BarStore for the history before the replayed ticks (optional)
+        """
+        self.directory = directory
+        self.speed = parse_speed(speed)
+        self.store = store
+        names = list(symbols) if symbols else recorded_symbols(directory)
+        # Plain ndarray views of the memmaps (still no copy, without memmap's per-slice overhead)
+        self._ticks = {name: read_ticks(directory, name).view(np.ndarray) for name in names}
+        self._ticks = {name: ticks for name, ticks in self._ticks.items() if len(ticks)}
+        if not self._ticks:
+            raise ValueError(f"No recorded ticks in {directory!r}")
+        # Contiguous copies of the tick times: searching the strided memmap field copies it every time
+        self._times = {name: np.ascontiguousarray(ticks["time_msc"]) for name, ticks in self._ticks.items()}
+
+        first = min(int(t["time_msc"][0]) for t in self._ticks.values()) / 1000.0
+        self.start_time = first if start is None else float(_to_timestamp(start))
+        self.end_time = max(int(t["time_msc"][-1]) for t in self._ticks.values()) / 1000.0
+        self._clock_lock = threading.Lock()
+        self._wall_start = time.monotonic()
+        self._now = self.start_time
+        # Merged timeline for max speed: every recorded tick time after the start, in order
+        times = np.concatenate(list(self._times.values()))
+        times.sort()
+        self._timeline = times[times > int(round(self.start_time * 1000))]
+        self._step = 0
+
+        super().__init__(n_symbols=0, n_positions=0, history_bars=history_bars, latency=latency,
+                         balance=balance, clock=self._clock)
+        self._cursor = {}
+        self._last_tick = {}
+        for name, ticks in self._ticks.items():
+            info = read_symbol_info(directory, name)
+            at = max(0, int(np.searchsorted(self._times[name], int(round(self.start_time * 1000)), side="right")) - 1)
+            tick = ticks[at]
+            point = float(info.get("point") or 10.0 ** -int(info.get("digits") or 5))
+            digits = int(info.get("digits") if info.get("digits") is not None else round(-np.log10(point)))
+            st = _SymbolState(name, (float(tick["bid"]) + float(tick["ask"])) / 2.0, digits,
+                              float(info.get("trade_tick_value") or 1.0), 0.0, _seed_for("replay", name),
+                              self.start_time)
+            st.spread_points = int(round((float(tick["ask"]) - float(tick["bid"])) / point))
+            self._symbols[name] = st
+            self._cursor[name] = at + 1
+            self._last_tick[name] = tick
+
+    @classmethod
+    def from_env(cls):
+        """Build a replay from MT5_REPLAY_* environment variables."""
+        env = os.environ.get
+        directory = env("MT5_REPLAY_DIR")
+        if not directory:
+            raise ValueError("MT5_REPLAY_DIR is not set (directory written by tick_recorder.py)")
+        symbols = [s for s in env("MT5_REPLAY_SYMBOLS", "").split(",") if s.strip()]
+        start = env("MT5_REPLAY_START")
+        from bar_store import bar_store
+        return cls(directory, speed=env("MT5_REPLAY_SPEED", "1"), start=float(start) if start else None,
+                   symbols=[s.strip() for s in symbols] or None, store=bar_store,
+                   history_bars=int(env("MT5_SIM_HISTORY", 2000)),
+                   latency=float(env("MT5_SIM_LATENCY_MS", 0)) / 1000.0)
+
+    # -----------------------
+    # Clock
+    # -----------------------
+    def _clock(self):
+        if self.speed == MAX_SPEED:
+            return self._now
+        return min(self.start_time + (time.monotonic() - self._wall_start) * self.speed, self.end_time)
+
+    def step(self, count=1):
+        """Max speed: move the clock `count` recorded ticks forward; returns False once exhausted."""
+        with self._clock_lock:
+            if self._step >= len(self._timeline):
+                return False
+            self._step = min(self._step + int(count), len(self._timeline))
+            self._now = int(self._timeline[self._step - 1]) / 1000.0
+            return True
+
+    @property
+    def finished(self):
+        if self.speed == MAX_SPEED:
+            return self._step >= len(self._timeline)
+        return self._clock() >= self.end_time
+
+    def progress(self):
+        """Replay position: clock, share of the recorded span done, ticks delivered so far."""
+        now = self._clock()
+        span = max(self.end_time - self.start_time, 1e-9)
+        return {
+            "time": now,
+            "done": round(min(max((now - self.start_time) / span, 0.0), 1.0), 4),
+            "ticks": sum(self._cursor.values()),
+            "speed": self.speed,
+        }
+
+    # -----------------------
+    # Prices (replacing the random walk)
+    # -----------------------
+    def _advance(self, st, now=None):
+        """Apply the recorded ticks up to `now` to the symbol's quote and materialized bars."""
+        now = self.clock() if now is None else now
+        times = self._times[st.name]
+        begin = self._cursor[st.name]
+        end = int(np.searchsorted(times, int(round(now * 1000)), side="right"))
+        if end > begin:
+            new = self._ticks[st.name][begin:end]
+            mids = (new["bid"] + new["ask"]) / 2.0
+            for tf, entry in st.bars.items():
+                self._apply_path(st, tf, entry, new["time_msc"] / 1000.0, mids)
+            st.mid = float(mids[-1])
+            st.tick_count += len(new)
+            self._cursor[st.name] = end
+            self._last_tick[st.name] = new[-1]
+        st.t_last = max(st.t_last, now)
+
+    def _quote(self, st):
+        tick = self._last_tick.get(st.name)
+        if tick is None:
+            return super()._quote(st)
+        return float(tick["bid"]), float(tick["ask"])
+
+    def _materialize(self, st, tf):
+        """Bar history up to the replay clock: stored bars if available, synthetic otherwise."""
+        entry = st.bars.get(tf)
+        if entry is not None or self.store is None:
+            return entry if entry is not None else super()._materialize(st, tf)
+        secs = timeframe_seconds(tf)
+        forming = int(st.t_last // secs) * secs
+        stored = self.store.rates(st.name, tf, date_to=forming - 1)[-self.history_bars:]
+        if len(stored) == 0:
+            return super()._materialize(st, tf)
+        n = len(stored) + 1
+        rates = np.zeros(n * 2, dtype=RATES_DTYPE)
+        rates[:n - 1] = stored
+        mid = round(st.mid, st.digits)
+        rates[n - 1] = (forming, mid, mid, mid, mid, 1, st.spread_points, 0)
+        entry = st.bars[tf] = [rates, n]
+        return entry
+
+    # -----------------------
+    # MT5 API
+    # -----------------------
+    def symbol_info_tick(self, symbol):
+        self._call("symbol_info_tick")
+        with self._lock:
+            st = self._symbol(symbol)
+            if st is None:
+                return None
+            if self.speed == MAX_SPEED:
+                self.step()
+            self._advance(st)
+            tick = self._last_tick[symbol]
+            return Tick(int(tick["time"]), float(tick["bid"]), float(tick["ask"]), float(tick["last"]),
+                        int(tick["volume"]), int(tick["time_msc"]), int(tick["flags"]), float(tick["volume_real"]))
+
+    def copy_ticks_range(self, symbol, date_from, date_to, flags=-1):
+        self._call("copy_ticks_range")
+        ticks = self._ticks.get(symbol)
+        if ticks is None:
+            return None
+        until = min(_to_timestamp(date_to), self.clock())
+        return read_ticks(self.directory, symbol, _to_timestamp(date_from) * 1000, int(round(until * 1000))).copy()
+
+    def copy_ticks_from(self, symbol, date_from, count, flags=-1):
+        self._call("copy_ticks_from")
+        ticks = self._ticks.get(symbol)
+        if ticks is None:
+            return None
+        ticks = read_ticks(self.directory, symbol, _to_timestamp(date_from) * 1000, int(round(self.clock() * 1000)))
+        return ticks[:int(count)].copy()
+
+
+def replay_crossings(replay, symbols=None, timeframe=None, window=200):
+    """
+    Run level-cross detection over a max-speed replay: every tick goes
+    through TickLoop.process_tick, levels are recomputed on each new bar.
+    Yields (replay time, symbol, side, price) per signal.
+    """
+    from levels import levels_from_rates
+    from tick_loop import TickLoop
+
+    symbols = list(symbols or replay._ticks)
+    timeframe = timeframe or replay.TIMEFRAME_M1
+    secs = timeframe_seconds(timeframe)
+    levels, bar_time = {}, {}
+
+    def levels_for(symbol):
+        forming = int(replay.clock() // secs)
+        if bar_time.get(symbol) != forming:
+            bar_time[symbol] = forming
+            rates = replay.copy_rates_from_pos(symbol, timeframe, 1, window)
+            levels[symbol] = levels_from_rates(rates) if rates is not None and len(rates) == window else None
+        return levels[symbol]
+
+    loop = TickLoop(symbols, levels_for, on_signal=None)
+    while not replay.finished:
+        for symbol in symbols:
+            tick = replay.symbol_info_tick(symbol)
+            side = loop.process_tick(symbol, tick, time.perf_counter())
+            if side is not None:
+                yield replay.clock(), symbol, side, tick.bid
+    replay.metrics = loop.metrics
+
+
+def main(argv=None):
+    import argparse
+    from datetime import datetime, timezone
+
+    parser = argparse.ArgumentParser(description="Replay recorded ticks through level-cross detection at max speed")
+    parser.add_argument("--dir", default="ticks")
+    parser.add_argument("--symbols", nargs="*")
+    parser.add_argument("--timeframe", default="M1", choices=["M1", "M5", "M15", "H1", "H4", "D1"])
+    parser.add_argument("--window", type=int, default=200)
+    parser.add_argument("--store", help="bar store for the history before the ticks")
+    args = parser.parse_args(argv)
+
+    store = None
+    if args.store:
+        from bar_store import BarStore
+        store = BarStore(args.store)
+    replay = ReplayMT5(args.dir, speed=MAX_SPEED, symbols=args.symbols, store=store)
+    started = time.perf_counter()
+    signals = 0
+    for at, symbol, side, price in replay_crossings(replay, args.symbols,
+                                                    getattr(replay, f"TIMEFRAME_{args.timeframe}"), args.window):
+        signals += 1
+        print(f"{datetime.fromtimestamp(at, tz=timezone.utc):%Y-%m-%d %H:%M:%S.%f} {symbol} {side} @ {price}")
+    elapsed = time.perf_counter() - started
+    ticks = replay.metrics.ticks
+    print(f"{ticks} ticks, {signals} signals in {elapsed:.2f}s ({ticks / max(elapsed, 1e-9):,.0f} ticks/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Multi-timeframe bars from one base-timeframe series.
+
+Instead of one ``copy_rates_from_pos`` pull and one level run per timeframe,
+a MultiTimeframeState reads the base timeframe (e.g. M1) once through the
+shared bar cache and aggregates it into every higher timeframe with
+``np.*.reduceat`` over the bucket boundaries. After the first load only the
+bars of each timeframe's forming bucket are re-aggregated, and the levels
+of every (symbol, timeframe) come out of a single ``compute_levels_batch``.
+
+Buckets are aligned on server time (``time - time % seconds``), which is
+how the terminal opens M5..D1 bars; W1 and MN1 are not derived. A
+timeframe whose `window` bars would need more than MAX_BASE_BARS base bars
+(D1 from M1 with a 200-bar window), or that the terminal's base history
+is too short for, is fetched natively instead, so every timeframe's levels
+cover the same bars as in single-timeframe mode.
+"""
+import threading
+
+import numpy as np
+
+from bar_cache import get_rates
+from bar_store import timeframe_name
+from broker import mt5, timeframe_seconds
+from levels import compute_levels_batch, levels_to_dict
+
+
+MTF_NAMES = ("M1", "M5", "M15", "H1", "H4", "D1")
+
+# Deepest base history read (the terminal's default "Max bars in chart");
+# timeframes that would need more are fetched natively
+MAX_BASE_BARS = 100000
+
+
+def mtf_timeframes(names=MTF_NAMES):
+    """MT5 timeframe constants for the names, smallest first."""
+    return sorted((getattr(mt5, f"TIMEFRAME_{name}") for name in names), key=timeframe_seconds)
+
+
+def resample(rates, seconds):
+    """
+    Aggregate MT5 rates (oldest first) into `seconds`-long bars: first open,
+    max high, min low, last close, summed volumes, widest spread. The last
+    bar is the forming one when the newest base bar is.
+    """
+    if rates is None or len(rates) == 0:
+        return rates
+    times = rates["time"].astype(np.int64)
+    buckets = times - times % seconds
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(rates)] - 1
+    out = np.empty(len(starts), dtype=rates.dtype)
+    out["time"] = buckets[starts]
+    out["open"] = rates["open"][starts]
+    out["high"] = np.maximum.reduceat(rates["high"], starts)
+    out["low"] = np.minimum.reduceat(rates["low"], starts)
+    out["close"] = rates["close"][ends]
+    for name in ("tick_volume", "real_volume"):
+        if name in rates.dtype.names:
+            out[name] = np.add.reduceat(rates[name], starts)
+    if "spread" in rates.dtype.names:
+        out["spread"] = np.maximum.reduceat(rates["spread"], starts)
+    return out
+
+
+class MultiTimeframeState:
+    """Resampled bars of several timeframes for one symbol, fed from one base series."""
+
+    def __init__(self, symbol, base_timeframe, timeframes, window, max_base_bars=MAX_BASE_BARS):
+        self.symbol = symbol
+        self.base_timeframe = int(base_timeframe)
+        self.base_seconds = timeframe_seconds(base_timeframe)
+        self.timeframes = sorted({int(tf) for tf in timeframes}, key=timeframe_seconds)
+        if timeframe_seconds(self.timeframes[0]) < self.base_seconds:
+            raise ValueError("timeframes must not be shorter than the base timeframe")
+        self.window = int(window)
+
+        def base_needed(tf):
+            return self.window * (timeframe_seconds(tf) // self.base_seconds)
+        limit = max(max_base_bars, self.window)
+        self.resampled = [tf for tf in self.timeframes if base_needed(tf) <= limit]
+        self.native = [tf for tf in self.timeframes if base_needed(tf) > limit]
+        self.base_bars = max((base_needed(tf) for tf in self.resampled), default=0)
+        self.bars_fetched = 0
+        self.lock = threading.Lock()
+        self.bars = {}     # timeframe -> last `window` resampled bars (forming bar last)
+        self._tail = None  # base bars of the oldest forming bucket onwards
+
+    def _load(self):
+        rates = get_rates(self.symbol, self.base_timeframe, 0, self.base_bars)
+        if rates is None or len(rates) == 0:
+            return False
+        self.bars_fetched += len(rates)
+        self.bars.update({tf: self._resample(rates, tf)[-self.window:] for tf in self.resampled})
+        # The terminal holds less base history than needed: fetch those timeframes natively
+        short = [tf for tf in self.resampled if tf != self.base_timeframe and len(self.bars[tf]) < self.window]
+        if short:
+            self.resampled = [tf for tf in self.resampled if tf not in short]
+            self.native = sorted(self.native + short, key=timeframe_seconds)
+            if not self.resampled:
+                return True
+        self._trim(rates)
+        return True
+
+    def _resample(self, rates, timeframe):
+        seconds = timeframe_seconds(timeframe)
+        return rates.copy() if seconds == self.base_seconds else resample(rates, seconds)
+
+    def _trim(self, rates):
+        """Keep the base bars needed to rebuild every forming bucket."""
+        oldest = min(int(self.bars[tf]["time"][-1]) for tf in self.resampled)
+        self._tail = rates[rates["time"] >= oldest]
+
+    def update(self):
+        """Fold the base bars closed/updated since the last call into every timeframe."""
+        with self.lock:
+            if self.resampled:
+                self._update_resampled()
+            for tf in self.native:
+                rates = get_rates(self.symbol, tf, 0, self.window)
+                if rates is not None:
+                    self.bars[tf] = rates
+            return self
+
+    def _update_resampled(self):
+        if self._tail is None or not len(self._tail):
+            self._load()
+            return
+        first = int(self._tail["time"][0])
+        count = len(self._tail) + 2
+        while True:
+            rates = get_rates(self.symbol, self.base_timeframe, 0, count)
+            if rates is None or len(rates) == 0:
+                return
+            if int(rates["time"][0]) <= first:
+                break
+            if count >= self.base_bars:
+                # Missed more than we keep: start over
+                self._load()
+                return
+            count = min(count * 4, self.base_bars)
+        rates = rates[rates["time"] >= first]
+        self.bars_fetched += len(rates)
+        for tf in self.resampled:
+            bars = self.bars[tf]
+            forming = int(bars["time"][-1])
+            fresh = self._resample(rates[rates["time"] >= forming], tf)
+            self.bars[tf] = np.concatenate((bars[:-1], fresh))[-self.window:]
+        self._trim(rates)
+
+    def rates(self, timeframe):
+        bars = self.bars.get(int(timeframe))
+        return bars.copy() if bars is not None else None
+
+
+_states = {}
+_states_lock = threading.Lock()
+
+
+def get_mtf_state(symbol, timeframes, window, base_timeframe=None):
+    """Process-wide MultiTimeframeState per (symbol, timeframes, window, base)."""
+    timeframes = tuple(sorted({int(tf) for tf in timeframes}, key=timeframe_seconds))
+    base = int(base_timeframe) if base_timeframe is not None else timeframes[0]
+    key = (symbol, timeframes, int(window), base)
+    with _states_lock:
+        state = _states.get(key)
+        if state is None:
+            state = _states[key] = MultiTimeframeState(symbol, base, timeframes, window)
+    return state
+
+
+def multi_timeframe_levels(symbols, timeframes, window, base_timeframe=None):
+    """
+    {symbol: {timeframe name: levels}} for every symbol and timeframe, from
+    one base series per symbol and one batched level computation.
+    """
+    states = [get_mtf_state(symbol, timeframes, window, base_timeframe).update() for symbol in symbols]
+    keys, items = [], []
+    for state in states:
+        for tf, bars in state.bars.items():
+            keys.append((state.symbol, timeframe_name(tf)))
+            items.append((state.symbol, bars))
+    batch = compute_levels_batch(items)
+    # compute_levels_batch skips empty series: match rows back by what was kept
+    keys = [key for key, (_, bars) in zip(keys, items) if bars is not None and len(bars)]
+    result = {symbol: {} for symbol in symbols}
+    for (symbol, name), row in zip(keys, batch):
+        result[symbol][name] = levels_to_dict(row)
+    return result
@@ -0,0 +1,257 @@
+"""
+Incremental bar ingestion and rolling level state.
+
+One RollingLevelState per (symbol, timeframe, window) keeps the last
+`window` bars. Each update only reads the newest bars (through the shared
+bar cache), replaces the forming bar in place and slides the window. The
+closed bars' highs and lows sit in TopTwoQueues (two-stack sliding-window
+maxima, O(1) amortized per bar) and the forming bar is folded in when the
+extremes are read, so updating it costs nothing and the levels never
+re-sort the window. The states are kept in an LRU capped at MAX_STATES.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from bar_cache import get_rates
+from levels import LEVELS_DTYPE, fill_levels, levels_to_dict
+
+
+MAX_STATES = 512  # (symbol, timeframe, window) states kept; least recently used go first
+
+
+def _suffix_top_two(values):
+    """Largest and second largest of values[i:] for every i (-inf where missing)."""
+    first = np.maximum.accumulate(values[::-1])[::-1]
+    after = np.append(first[1:], -np.inf)
+    # second of a suffix = max over j >= i of min(values[j], max(values[j+1:]))
+    second = np.maximum.accumulate(np.minimum(values, after)[::-1])[::-1]
+    return first, second
+
+
+def _merge(a1, a2, b1, b2):
+    """Top two of two (largest, second largest) pairs."""
+    if a1 >= b1:
+        return a1, max(a2, b1)
+    return b1, max(b2, a1)
+
+
+class TopTwoQueue:
+    """
+    FIFO of floats with its two largest values, O(1) amortized per push/pop.
+
+    A two-stack queue: the front holds the older values as suffix top-two
+    arrays (built with NumPy when the back is moved over, once per
+    len(queue) pops), the back a plain list with a running top two.
+    """
+
+    def __init__(self, values=()):
+        self._back = []
+        self._back1 = self._back2 = -np.inf
+        self._front1, self._front2 = _suffix_top_two(np.asarray(values, dtype=float))
+        self._pos = 0
+
+    def __len__(self):
+        return len(self._front1) - self._pos + len(self._back)
+
+    def push(self, value):
+        value = float(value)
+        self._back.append(value)
+        if value > self._back1:
+            self._back1, self._back2 = value, self._back1
+        elif value > self._back2:
+            self._back2 = value
+
+    def pop(self):
+        """Drop the oldest value."""
+        if self._pos == len(self._front1):
+            if not self._back:
+                return
+            self._front1, self._front2 = _suffix_top_two(np.array(self._back))
+            self._pos = 0
+            self._back = []
+            self._back1 = self._back2 = -np.inf
+        self._pos += 1
+
+    def top_two(self):
+        if self._pos < len(self._front1):
+            return _merge(self._front1[self._pos], self._front2[self._pos], self._back1, self._back2)
+        return self._back1, self._back2
+
+
+class RollingLevelState:
+    """Rolling bars + extremes for one (symbol, timeframe) over the last `window` bars."""
+
+    def __init__(self, symbol, timeframe, window):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.window = int(window)
+        self.fetch_count = 2  # forming bar + the one before it
+        self.bars_fetched = 0
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._buf = None
+        self._start = 0
+        self._end = 0
+        # Closed bars only; the forming bar is self._buf[self._end - 1]
+        self.highs = TopTwoQueue()        # largest highs
+        self.lows = TopTwoQueue()         # smallest lows (stored negated)
+        self.low_highs = TopTwoQueue()    # largest lows
+
+    def __len__(self):
+        return self._end - self._start
+
+    @property
+    def last_time(self):
+        return int(self._buf["time"][self._end - 1]) if len(self) else None
+
+    def rates(self, copy=True):
+        """Bars in the window, oldest first (a copy unless copy=False)."""
+        if self._buf is None:
+            return None
+        view = self._buf[self._start:self._end]
+        return view.copy() if copy else view
+
+    # -----------------------
+    # Ingestion
+    # -----------------------
+    def _append(self, bar):
+        if len(self):
+            closed = self._buf[self._end - 1]
+            self.highs.push(closed["high"])
+            self.lows.push(-closed["low"])
+            self.low_highs.push(closed["low"])
+        if len(self) == self.window:
+            self.highs.pop()
+            self.lows.pop()
+            self.low_highs.pop()
+            self._start += 1
+        if self._end == len(self._buf):
+            n = len(self)
+            self._buf[:n] = self._buf[self._start:self._end]
+            self._start, self._end = 0, n
+        self._buf[self._end] = bar
+        self._end += 1
+
+    def _replace_last(self, bar):
+        self._buf[self._end - 1] = bar
+
+    def _load(self, rates):
+        self._reset()
+        # Twice the window so sliding only compacts once every `window` bars
+        self._buf = np.zeros(self.window * 2, dtype=rates.dtype)
+        rates = rates[-self.window:]
+        n = len(rates)
+        self._buf[:n] = rates
+        self._end = n
+        closed = rates[:-1]
+        self.highs = TopTwoQueue(closed["high"])
+        self.lows = TopTwoQueue(-closed["low"])
+        self.low_highs = TopTwoQueue(closed["low"])
+
+    def ingest(self, rates):
+        """
+        Merge freshly fetched bars (oldest first). Returns False if `rates` does
+        not overlap the last known bar, i.e. bars are missing in between.
+        """
+        if rates is None or len(rates) == 0:
+            return True
+        if self._buf is None or len(rates) >= self.window:
+            self._load(rates)
+            return True
+        last_time = self.last_time
+        if int(rates["time"][0]) > last_time:
+            return False
+        for bar in rates[rates["time"] >= last_time]:
+            if int(bar["time"]) == last_time:
+                self._replace_last(bar)
+            else:
+                self._append(bar)
+                last_time = int(bar["time"])
+        return True
+
+    def update(self):
+        """Fetch only the bars newer than the last one seen and fold them in."""
+        with self.lock:
+            if self._buf is None:
+                rates = get_rates(self.symbol, self.timeframe, 0, self.window)
+                self.bars_fetched += 0 if rates is None else len(rates)
+                self.ingest(rates)
+                return self
+            count = self.fetch_count
+            while True:
+                rates = get_rates(self.symbol, self.timeframe, 0, count)
+                self.bars_fetched += 0 if rates is None else len(rates)
+                if self.ingest(rates):
+                    break
+                if count >= self.window:
+                    # Gap longer than the whole window: start over from this snapshot
+                    self._load(rates)
+                    break
+                # Missed more than one bar since the last refresh: widen the request
+                count = min(count * 4, self.window)
+            return self
+
+    # -----------------------
+    # Levels
+    # -----------------------
+    def extremes(self):
+        """(HH, PHH, LL, PLL, HL) of the current window in O(1)."""
+        if not len(self):
+            return (np.nan,) * 5
+        forming = self._buf[self._end - 1]
+        high, low = float(forming["high"]), float(forming["low"])
+        hh, phh = _merge(*self.highs.top_two(), high, -np.inf)
+        ll, pll = _merge(*self.lows.top_two(), -low, -np.inf)
+        hl = max(self.low_highs.top_two()[0], low)
+        if phh == -np.inf:
+            return hh, np.nan, -ll, np.nan, hl
+        return hh, phh, -ll, -pll, hl
+
+    def fill_row(self, row):
+        """Write this state's extremes into a LEVELS_DTYPE row."""
+        row["symbol"] = self.symbol
+        row["bars"] = len(self)
+        row["last_time"] = self.last_time or 0
+        row["last_close"] = self._buf["close"][self._end - 1] if len(self) else np.nan
+        row["HH"], row["PHH"], row["LL"], row["PLL"], row["HL"] = self.extremes()
+        row["RLL"] = row["LL"]
+
+    def levels(self):
+        """Levels dict for the current window, or None without data."""
+        if not len(self):
+            return None
+        out = np.zeros(1, dtype=LEVELS_DTYPE)
+        self.fill_row(out[0])
+        return levels_to_dict(fill_levels(out)[0])
+
+
+_states = OrderedDict()
+_states_lock = threading.Lock()
+
+
+def get_rolling_state(symbol, timeframe, window):
+    """Process-wide RollingLevelState for (symbol, timeframe, window), LRU-capped at MAX_STATES."""
+    key = (symbol, timeframe, int(window))
+    with _states_lock:
+        state = _states.get(key)
+        if state is None:
+            state = _states[key] = RollingLevelState(symbol, timeframe, window)
+            while len(_states) > MAX_STATES:
+                _states.popitem(last=False)
+        else:
+            _states.move_to_end(key)
+    return state
+
+
+def rolling_levels_batch(states):
+    """LEVELS_DTYPE array for already-updated states, arithmetic vectorized over all of them."""
+    states = [s for s in states if len(s)]
+    out = np.zeros(len(states), dtype=LEVELS_DTYPE)
+    for i, state in enumerate(states):
+        with state.lock:
+            state.fill_row(out[i])
+    return fill_levels(out)
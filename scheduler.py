@@ -0,0 +1,342 @@
+"""
+Strategy scheduler.
+
+Runs any number of registered strategies (strategies/base.py) over the
+watchlist in passes. Each pass reads the data once for all of them:
+
+- positions: one refresh_positions() (the shared snapshot)
+- levels: one analyze_symbols() batch for the scheduler's timeframe/window,
+  plus one multi_timeframe_levels() batch if a strategy asks for others
+- bars: one bar-cache read per (symbol, timeframe), deep enough for the
+  longest declared lookback
+- ticks: one symbol_info_tick() per symbol
+
+and then calls on_bar / on_tick / on_position, or on_positions once with
+the PositionBook of the whole watchlist. SL/TP proposals go to one shared
+SLTPEngine that is flushed at the end of the pass.
+
+Every strategy has a wall-time budget per pass. Python callbacks can't be
+preempted, so a strategy that has used up its budget gets no further
+callbacks in that pass (an overrun); the next pass starts with the symbols
+it skipped, so a slow strategy lags instead of starving the others. Per
+strategy the scheduler reports calls, CPU time (thread time), wall time,
+overruns, skipped callbacks and errors.
+
+Built-in strategies are registered on import; more modules can be listed
+in MT5_STRATEGY_MODULES (comma separated).
+"""
+import importlib
+import logging
+import os
+import time
+
+from broker import mt5
+from app_state import get_state
+from instrumentation import metrics
+from levels import last_close
+from mt5_helpers import analyze_symbols
+from bar_cache import get_rates
+from bar_store import timeframe_name
+from positions import positions_snapshot, refresh_positions
+from position_book import PositionBook
+from resample import multi_timeframe_levels
+from sltp_engine import SLTPEngine
+from symbol_catalog import catalog
+from strategies.base import REGISTRY, Strategy, create
+
+
+BUILTIN_MODULES = (
+    "strategies.level_cross",
+    "strategies.candle_trailer",
+    "strategies.atr_trailer",
+    "strategies.simple_autotrader",
+)
+DEFAULT_STRATEGIES = ("level_cross", "candle_trailer")
+DEFAULT_BUDGET_MS = 50.0
+
+log = logging.getLogger("scheduler")
+
+
+def load_strategies(modules=None):
+    """Import the built-in strategy modules (and MT5_STRATEGY_MODULES); returns the registry."""
+    extra = [m.strip() for m in os.environ.get("MT5_STRATEGY_MODULES", "").split(",") if m.strip()]
+    for module in list(modules or BUILTIN_MODULES) + extra:
+        importlib.import_module(module)
+    return REGISTRY
+
+
+def _timeframe(value):
+    """MT5 timeframe constant from a constant or a name like 'H1'."""
+    return int(getattr(mt5, f"TIMEFRAME_{value}") if isinstance(value, str) else value)
+
+
+def _overrides(strategy, hook):
+    return getattr(type(strategy), hook) is not getattr(Strategy, hook)
+
+
+def _per_symbol(strategy):
+    """Whether `strategy` has any per-symbol hook (on_bar / on_tick / on_position) to dispatch."""
+    return bool(
+        (strategy.lookback and _overrides(strategy, "on_bar"))
+        or (strategy.ticks and _overrides(strategy, "on_tick"))
+        or (strategy.positions and _overrides(strategy, "on_position") and not _overrides(strategy, "on_positions"))
+    )
+
+
+class StrategyStats:
+    __slots__ = ("calls", "cpu", "wall", "max_wall", "overruns", "skipped", "errors", "passes")
+
+    def __init__(self):
+        self.calls = 0
+        self.cpu = 0.0
+        self.wall = 0.0
+        self.max_wall = 0.0  # slowest single pass
+        self.overruns = 0
+        self.skipped = 0
+        self.errors = 0
+        self.passes = 0
+
+
+class PassContext:
+    """Data of one pass, fetched on first use and shared by every strategy."""
+
+    def __init__(self, scheduler, levels_by_symbol, rates_by_symbol):
+        self.scheduler = scheduler
+        self.timeframe = scheduler.timeframe
+        self.sltp = scheduler.sltp
+        self.state = scheduler.state
+        self.levels_by_symbol = levels_by_symbol
+        self.rates_by_symbol = rates_by_symbol
+        self._bars = {}
+        self._ticks = {}
+        self._mtf = None
+        self._positions = positions_snapshot()
+        self._book = None
+
+    # Scheduler-wide trading settings
+    @property
+    def lot_size(self):
+        return self.scheduler.lot_size
+
+    @property
+    def default_sl_points(self):
+        return self.scheduler.default_sl_points
+
+    @property
+    def default_tp_points(self):
+        return self.scheduler.default_tp_points
+
+    def enabled(self, symbol):
+        """The per-symbol trading toggle (state.autotrade)."""
+        return self.scheduler.enabled(symbol)
+
+    def levels(self, symbol, timeframe=None):
+        """Level dict of the scheduler's timeframe, or of another one (name or constant) via resampling."""
+        if timeframe is None or _timeframe(timeframe) == self.timeframe:
+            return self.levels_by_symbol.get(symbol)
+        if self._mtf is None:
+            self._mtf = multi_timeframe_levels(self.scheduler.symbols, self.scheduler.level_timeframes(),
+                                               self.scheduler.num_candles)
+        return self._mtf.get(symbol, {}).get(timeframe_name(_timeframe(timeframe)))
+
+    def last_close(self, symbol):
+        rates = self.rates_by_symbol.get(symbol)
+        return last_close(rates) if rates is not None and len(rates) else None
+
+    def bars(self, symbol, timeframe=None, count=None, skip=0):
+        """`count` bars of `timeframe` ending `skip` bars before the forming one (None if missing)."""
+        timeframe = self.timeframe if timeframe is None else _timeframe(timeframe)
+        need = (count or 1) + skip
+        key = (symbol, timeframe)
+        rates = self._bars.get(key)
+        if rates is None or len(rates) < need:
+            depth = max(need, self.scheduler.depth.get(timeframe, 0))
+            rates = self._bars[key] = get_rates(symbol, timeframe, 0, depth)
+            if rates is None:
+                return None
+        end = len(rates) - skip
+        return rates[max(0, end - (count or end)):end] if end > 0 else rates[:0]
+
+    def tick(self, symbol):
+        if symbol not in self._ticks:
+            self._ticks[symbol] = mt5.symbol_info_tick(symbol)
+        return self._ticks[symbol]
+
+    def point(self, symbol):
+        return catalog.point(symbol)
+
+    def positions(self, symbol):
+        return self._positions.for_symbol(symbol)
+
+    def book(self, symbols):
+        """PositionBook of `symbols` with their quotes (built once per pass)."""
+        if self._book is None:
+            self._book = PositionBook(self._positions, symbols).load_quotes(self.tick, self.point)
+        return self._book
+
+
+class StrategyScheduler:
+    def __init__(self, symbols, strategies, timeframe, num_candles=200, lot_size=0.01,
+                 default_sl_points=0, default_tp_points=0, budget_ms=DEFAULT_BUDGET_MS,
+                 symbol_filter=None, state=None, level_timeframes=()):
+        """
+        - symbols: watchlist
+        - strategies: Strategy instances or registered names
+        - timeframe / num_candles: the level table every strategy shares
+        - budget_ms: default wall-time budget per strategy and pass
+        - symbol_filter: callable(symbol) -> bool, symbols it rejects get no callbacks
+        - state: shared state for logs/orders (defaults to app_state.get_state() at flush time)
+        - level_timeframes: other timeframes ctx.levels() serves (shares the dashboard's resampling)
+        """
+        load_strategies()
+        self.symbols = list(symbols)
+        self.timeframe = int(timeframe)
+        self.num_candles = int(num_candles)
+        self.lot_size = lot_size
+        self.default_sl_points = default_sl_points
+        self.default_tp_points = default_tp_points
+        self.budget_ms = float(budget_ms)
+        self.symbol_filter = symbol_filter
+        self._state = state
+        self.extra_timeframes = [_timeframe(tf) for tf in level_timeframes]
+        self.strategies = [create(s) if isinstance(s, str) else s for s in strategies]
+        self.depth = {}  # timeframe -> bars read per symbol (longest lookback + forming bar)
+        for strategy in self.strategies:
+            if strategy.timeframe is None:
+                strategy.timeframe = self.timeframe
+            strategy.timeframe = _timeframe(strategy.timeframe)
+            if strategy.lookback:
+                self.depth[strategy.timeframe] = max(self.depth.get(strategy.timeframe, 0), strategy.lookback + 1)
+        # Per strategy instance (two instances of one plugin keep separate stats and cursors)
+        self.strategy_stats = [StrategyStats() for _ in self.strategies]
+        self.sltp = SLTPEngine()
+        self.passes = 0
+        self.last_pass_ms = 0.0
+        self.context = None
+        self._cursor = [0] * len(self.strategies)
+        self._seen_bar = {}   # (strategy index, symbol) -> open time of the newest bar seen
+        self._seen_tick = {}  # (strategy index, symbol) -> time_msc of the last tick handled
+
+    @property
+    def state(self):
+        return self._state if self._state is not None else get_state()
+
+    def enabled(self, symbol):
+        return self.symbol_filter is None or self.symbol_filter(symbol)
+
+    def level_timeframes(self):
+        """Timeframes whose levels strategies asked for, plus the scheduler's own."""
+        extra = {_timeframe(s.levels_timeframe or self.timeframe) for s in self.strategies if s.levels}
+        return sorted(extra | set(self.extra_timeframes) | {self.timeframe})
+
+    # -----------------------
+    # Dispatch
+    # -----------------------
+    def _callbacks(self, ctx, index, strategy, symbol):
+        """The hooks due for (strategy, symbol) in this pass, as (hook, args)."""
+        due = []
+        if strategy.lookback and _overrides(strategy, "on_bar"):
+            rates = ctx.bars(symbol, strategy.timeframe, strategy.lookback, skip=1)
+            if rates is not None and len(rates):
+                key = (index, symbol)
+                opened = int(rates["time"][-1])
+                if self._seen_bar.get(key) != opened:
+                    first = key not in self._seen_bar
+                    self._seen_bar[key] = opened
+                    if not first:
+                        due.append((strategy.on_bar, (ctx, symbol, rates)))
+        if strategy.ticks and _overrides(strategy, "on_tick"):
+            tick = ctx.tick(symbol)
+            if tick is not None:
+                key = (index, symbol)
+                if self._seen_tick.get(key) != tick.time_msc:
+                    self._seen_tick[key] = tick.time_msc
+                    due.append((strategy.on_tick, (ctx, symbol, tick)))
+        if strategy.positions and not _overrides(strategy, "on_positions"):
+            positions = ctx.positions(symbol)
+            if positions:
+                due.append((strategy.on_position, (ctx, symbol, positions)))
+        return due
+
+    def _run_strategy(self, ctx, index, strategy, symbols):
+        stats = self.strategy_stats[index]
+        budget = (strategy.budget_ms if strategy.budget_ms is not None else self.budget_ms) / 1000.0
+        start = self._cursor[index] % len(symbols) if symbols else 0
+        # Batch-only strategies have nothing to dispatch per symbol (no skips, no cursor)
+        order = symbols[start:] + symbols[:start] if _per_symbol(strategy) else []
+        wall_started = time.perf_counter()
+        cpu_started = time.thread_time()
+        failed = False
+        if strategy.positions and _overrides(strategy, "on_positions"):
+            # Vectorized: every position of the watchlist in one call
+            try:
+                book = ctx.book(symbols)
+                if len(book):
+                    stats.calls += 1
+                    strategy.on_positions(ctx, book)
+            except Exception:
+                log.exception("strategy %s failed", strategy.name)
+                failed = True
+                stats.errors += 1
+            if not order and time.perf_counter() - wall_started >= budget:
+                stats.overruns += 1
+        for i, symbol in enumerate(order):
+            if time.perf_counter() - wall_started >= budget:
+                # Out of budget: the rest waits, and goes first next pass
+                stats.overruns += 1
+                stats.skipped += len(order) - i
+                self._cursor[index] = start + i
+                break
+            try:
+                for hook, args in self._callbacks(ctx, index, strategy, symbol):
+                    stats.calls += 1
+                    hook(*args)
+            except Exception:
+                # One traceback per strategy and pass, the rest only counted
+                if not failed:
+                    log.exception("strategy %s failed on %s", strategy.name, symbol)
+                failed = True
+                stats.errors += 1
+        else:
+            self._cursor[index] = 0
+        wall = time.perf_counter() - wall_started
+        stats.cpu += time.thread_time() - cpu_started
+        stats.wall += wall
+        stats.max_wall = max(stats.max_wall, wall)
+        stats.passes += 1
+        metrics.observe("strategy_seconds", wall, {"strategy": strategy.name})
+
+    def run_pass(self):
+        """Fetch the shared data once, run every strategy within its budget, flush SL/TP. Returns the context."""
+        started = time.perf_counter()
+        with metrics.span("positions"):
+            refresh_positions()
+        with metrics.span("analyze"):
+            levels_by_symbol, rates_by_symbol = analyze_symbols(self.symbols, self.timeframe, self.num_candles)
+        ctx = self.context = PassContext(self, levels_by_symbol, rates_by_symbol)
+        symbols = [s for s in self.symbols if s in levels_by_symbol and self.enabled(s)]
+        for index, strategy in enumerate(self.strategies):
+            self._run_strategy(ctx, index, strategy, symbols)
+        with metrics.span("sltp_flush"):
+            self.sltp.flush(self.state)
+        self.passes += 1
+        self.last_pass_ms = (time.perf_counter() - started) * 1000.0
+        return ctx
+
+    def stats(self):
+        """One row per strategy: calls, CPU/wall time, budget overruns, skipped callbacks, errors."""
+        rows = []
+        for strategy, s in zip(self.strategies, self.strategy_stats):
+            rows.append({
+                "strategy": strategy.name,
+                "calls": s.calls,
+                "cpu_ms": round(s.cpu * 1000.0, 2),
+                "wall_ms": round(s.wall * 1000.0, 2),
+                "cpu_ms_per_pass": round(s.cpu * 1000.0 / s.passes, 3) if s.passes else None,
+                "max_pass_ms": round(s.max_wall * 1000.0, 2),
+                "budget_ms": strategy.budget_ms if strategy.budget_ms is not None else self.budget_ms,
+                "overruns": s.overruns,
+                "skipped": s.skipped,
+                "errors": s.errors,
+            })
+        return rows
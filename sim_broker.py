@@ -0,0 +1,565 @@
+"""
+In-process simulated MetaTrader5 terminal.
+
+Implements the subset of the MT5 API used by the project (see
+``broker.BROKER_CALLS``) on top of synthetic data, so the dashboard and the
+strategies can be run and profiled on any machine:
+
+  - hundreds of symbols with a random-walk mid price advanced on wall time
+  - lazily generated bar history per (symbol, timeframe), kept consistent
+    with the ticks (forming bar follows the mid price)
+  - thousands of pre-opened positions, DEAL/SLTP order handling
+  - configurable per-call latency to mimic terminal IPC cost
+
+Usage:
+    MT5_BACKEND=sim streamlit run streamlit_mt5_dashboard.py
+"""
+import os
+import time
+import threading
+import zlib
+from collections import namedtuple
+
+import numpy as np
+
+from broker import timeframe_seconds
+
+
+# -----------------------
+# MT5 constants (same values as the MetaTrader5 package)
+# -----------------------
+TIMEFRAME_M1 = 1
+TIMEFRAME_M5 = 5
+TIMEFRAME_M15 = 15
+TIMEFRAME_M30 = 30
+TIMEFRAME_H1 = 16385
+TIMEFRAME_H4 = 16388
+TIMEFRAME_D1 = 16408
+TIMEFRAME_W1 = 32769
+
+TRADE_ACTION_DEAL = 1
+TRADE_ACTION_PENDING = 5
+TRADE_ACTION_SLTP = 6
+TRADE_ACTION_MODIFY = 7
+TRADE_ACTION_REMOVE = 8
+
+ORDER_TYPE_BUY = 0
+ORDER_TYPE_SELL = 1
+POSITION_TYPE_BUY = 0
+POSITION_TYPE_SELL = 1
+
+ORDER_TIME_GTC = 0
+ORDER_FILLING_FOK = 0
+ORDER_FILLING_IOC = 1
+ORDER_FILLING_RETURN = 2
+
+TRADE_RETCODE_REQUOTE = 10004
+TRADE_RETCODE_REJECT = 10006
+TRADE_RETCODE_DONE = 10009
+TRADE_RETCODE_INVALID = 10013
+TRADE_RETCODE_INVALID_VOLUME = 10014
+TRADE_RETCODE_INVALID_PRICE = 10015
+TRADE_RETCODE_INVALID_STOPS = 10016
+TRADE_RETCODE_TRADE_DISABLED = 10017
+TRADE_RETCODE_PRICE_CHANGED = 10020
+TRADE_RETCODE_PRICE_OFF = 10021
+TRADE_RETCODE_FROZEN = 10029
+TRADE_RETCODE_POSITION_CLOSED = 10036
+
+RATES_DTYPE = np.dtype([
+    ("time", "<i8"), ("open", "<f8"), ("high", "<f8"), ("low", "<f8"),
+    ("close", "<f8"), ("tick_volume", "<u8"), ("spread", "<i4"), ("real_volume", "<u8"),
+])
+
+SymbolInfo = namedtuple("SymbolInfo", [
+    "name", "description", "path", "visible", "select", "digits", "point", "spread",
+    "trade_tick_value", "trade_tick_size", "trade_contract_size", "trade_stops_level",
+    "trade_freeze_level", "trade_allowed", "volume_min", "volume_max", "volume_step",
+    "bid", "ask", "time",
+])
+Tick = namedtuple("Tick", ["time", "bid", "ask", "last", "volume", "time_msc", "flags", "volume_real"])
+TradePosition = namedtuple("TradePosition", [
+    "ticket", "time", "time_msc", "time_update", "time_update_msc", "type", "magic",
+    "identifier", "reason", "volume", "price_open", "sl", "tp", "price_current",
+    "swap", "profit", "symbol", "comment", "external_id",
+])
+AccountInfo = namedtuple("AccountInfo", [
+    "login", "trade_mode", "leverage", "balance", "credit", "profit", "equity",
+    "margin", "margin_free", "margin_level", "name", "server", "currency", "company",
+])
+OrderSendResult = namedtuple("OrderSendResult", [
+    "retcode", "deal", "order", "volume", "price", "bid", "ask", "comment",
+    "request_id", "retcode_external", "request",
+])
+
+# name, base price, digits, tick value per lot, relative volatility per step
+CORE_SYMBOLS = [
+    ("EURUSDm", 1.0850, 5, 1.0, 2e-5),
+    ("GBPUSDm", 1.2700, 5, 1.0, 2.5e-5),
+    ("USDJPYm", 151.20, 3, 0.66, 2e-5),
+    ("GBPJPYm", 191.80, 3, 0.66, 3e-5),
+    ("AUDUSDm", 0.6550, 5, 1.0, 2.5e-5),
+    ("USDCADm", 1.3600, 5, 0.73, 2e-5),
+    ("XAUUSDm", 2350.0, 2, 1.0, 4e-5),
+    ("XAGUSDm", 28.50, 3, 5.0, 6e-5),
+    ("BTCUSDm", 65000.0, 2, 0.01, 8e-5),
+    ("ETHUSDm", 3400.0, 2, 0.01, 1e-4),
+    ("US30m", 39000.0, 1, 0.1, 4e-5),
+    ("USTECm", 18000.0, 1, 0.1, 5e-5),
+]
+
+MAGIC = 123456
+
+
+def _seed_for(*parts):
+    return zlib.crc32("|".join(str(p) for p in parts).encode())
+
+
+def _to_timestamp(value):
+    if hasattr(value, "timestamp"):
+        return int(value.timestamp())
+    return int(value)
+
+
+class _SymbolState:
+    __slots__ = ("name", "digits", "point", "tick_value", "sigma", "spread_points",
+                 "mid", "t_last", "rng", "bars", "tick_count")
+
+    def __init__(self, name, price, digits, tick_value, sigma, seed, now):
+        self.name = name
+        self.digits = digits
+        self.point = 10.0 ** -digits
+        self.tick_value = tick_value
+        self.sigma = sigma
+        self.spread_points = 10 + seed % 20
+        self.mid = price
+        self.t_last = now
+        self.rng = np.random.default_rng(seed)
+        self.bars = {}  # timeframe -> [rates array, n]
+        self.tick_count = 0
+
+
+class SimulatedMT5:
+    """Drop-in stand-in for the ``MetaTrader5`` module."""
+
+    def __init__(self, n_symbols=300, n_positions=2000, history_bars=2000, seed=7,
+                 latency=0.0, latency_jitter=0.0, tick_interval=0.25, requote_rate=0.0,
+                 balance=10000.0, clock=None):
+        """
+        - n_symbols: size of the symbol universe (core FX/metals/crypto + synthetic)
+        - n_positions: positions opened at start, spread over the universe
+        - history_bars: bars generated per (symbol, timeframe) on first access
+        - latency: seconds slept per call, or {call_name: seconds}
+        - latency_jitter: extra uniform random latency (seconds)
+        - tick_interval: seconds between simulated price steps
+        - requote_rate: probability a DEAL is answered with TRADE_RETCODE_REQUOTE
+        - clock: callable returning the current time (defaults to time.time)
+        """
+        self.clock = clock or time.time
+        self.history_bars = int(history_bars)
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.tick_interval = float(tick_interval)
+        self.requote_rate = float(requote_rate)
+        self.call_counts = {}
+        self._lock = threading.RLock()
+        self._rng = np.random.default_rng(seed)
+        self._initialized = False
+
+        now = self.clock()
+        self._symbols = {}
+        for i in range(int(n_symbols)):
+            if i < len(CORE_SYMBOLS):
+                name, price, digits, tick_value, sigma = CORE_SYMBOLS[i]
+            else:
+                name = f"SYN{i:03d}m"
+                price = float(np.round(self._rng.uniform(1.0, 500.0), 2))
+                digits = 5 if price < 10 else 3
+                tick_value = 1.0
+                sigma = float(self._rng.uniform(1e-5, 8e-5))
+            self._symbols[name] = _SymbolState(name, price, digits, tick_value, sigma,
+                                               _seed_for(seed, name), now)
+
+        self._balance = float(balance)
+        self._positions = {}
+        self._next_ticket = 100000000
+        self._open_initial_positions(int(n_positions))
+
+    @classmethod
+    def from_env(cls):
+        """Build a simulator from MT5_SIM_* environment variables."""
+        env = os.environ.get
+        return cls(
+            n_symbols=int(env("MT5_SIM_SYMBOLS", 300)),
+            n_positions=int(env("MT5_SIM_POSITIONS", 2000)),
+            history_bars=int(env("MT5_SIM_HISTORY", 2000)),
+            seed=int(env("MT5_SIM_SEED", 7)),
+            latency=float(env("MT5_SIM_LATENCY_MS", 0)) / 1000.0,
+            requote_rate=float(env("MT5_SIM_REQUOTE_RATE", 0)),
+        )
+
+    # -----------------------
+    # Internals
+    # -----------------------
+    def _call(self, name):
+        self.call_counts[name] = self.call_counts.get(name, 0) + 1
+        delay = self.latency.get(name, 0.0) if isinstance(self.latency, dict) else self.latency
+        if self.latency_jitter:
+            delay += self._rng.uniform(0, self.latency_jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _advance(self, st, now=None):
+        """Move a symbol's mid price forward to `now`, updating materialized bars."""
+        now = self.clock() if now is None else now
+        steps = int((now - st.t_last) / self.tick_interval)
+        if steps <= 0:
+            return
+        # Long idle gaps are compressed into one jump plus the most recent steps
+        max_steps = 20000
+        skipped = max(0, steps - max_steps)
+        steps = min(steps, max_steps)
+        increments = st.rng.normal(0.0, st.sigma, steps)
+        if skipped:
+            increments[0] += st.rng.normal(0.0, st.sigma * np.sqrt(skipped))
+        mids = st.mid * np.exp(np.cumsum(increments))
+        times = st.t_last + self.tick_interval * (skipped + np.arange(1, steps + 1))
+        st.mid = float(mids[-1])
+        st.t_last = float(times[-1])
+        st.tick_count += steps
+        for tf, entry in st.bars.items():
+            self._apply_path(st, tf, entry, times, mids)
+
+    def _apply_path(self, st, tf, entry, times, mids):
+        rates, n = entry
+        secs = timeframe_seconds(tf)
+        bar_times = (times // secs).astype(np.int64) * secs
+        last = rates[n - 1]
+        same = bar_times == last["time"]
+        if same.any():
+            seg = mids[same]
+            last["high"] = max(last["high"], round(float(seg.max()), st.digits))
+            last["low"] = min(last["low"], round(float(seg.min()), st.digits))
+            last["close"] = round(float(seg[-1]), st.digits)
+            last["tick_volume"] += int(same.sum())
+        newer = bar_times > last["time"]
+        if not newer.any():
+            return
+        new_times = bar_times[newer]
+        new_mids = np.round(mids[newer], st.digits)
+        starts = np.flatnonzero(np.r_[True, new_times[1:] != new_times[:-1]])
+        k = len(starts)
+        if n + k > len(rates):
+            grown = np.zeros(max(len(rates) * 2, n + k), dtype=RATES_DTYPE)
+            grown[:n] = rates[:n]
+            rates = grown
+        block = rates[n:n + k]
+        block["time"] = new_times[starts]
+        block["open"] = new_mids[starts]
+        block["high"] = np.maximum.reduceat(new_mids, starts)
+        block["low"] = np.minimum.reduceat(new_mids, starts)
+        block["close"] = new_mids[np.r_[starts[1:] - 1, len(new_mids) - 1]]
+        block["tick_volume"] = np.diff(np.r_[starts, len(new_mids)])
+        block["spread"] = st.spread_points
+        entry[0] = rates
+        entry[1] = n + k
+
+    def _materialize(self, st, tf):
+        """Generate synthetic history for (symbol, timeframe) ending at the current mid."""
+        entry = st.bars.get(tf)
+        if entry is not None:
+            return entry
+        secs = timeframe_seconds(tf)
+        n = self.history_bars
+        rng = np.random.default_rng(_seed_for(st.name, tf))
+        bar_sigma = st.sigma * np.sqrt(max(secs / self.tick_interval, 1.0))
+        # Walk backwards from the current mid so the forming bar closes at it
+        steps = rng.normal(0.0, bar_sigma, n)
+        closes = st.mid * np.exp(-np.concatenate(([0.0], np.cumsum(steps[:-1])))[::-1])
+        opens = np.empty(n)
+        opens[1:] = closes[:-1]
+        opens[0] = closes[0] * np.exp(-steps[0])
+        wick = np.abs(rng.normal(0.0, bar_sigma * 0.5, (2, n)))
+        rates = np.zeros(n * 2, dtype=RATES_DTYPE)
+        bars = rates[:n]
+        last_time = int(st.t_last // secs) * secs
+        bars["time"] = last_time - secs * np.arange(n - 1, -1, -1, dtype=np.int64)
+        bars["open"] = np.round(opens, st.digits)
+        bars["close"] = np.round(closes, st.digits)
+        bars["high"] = np.round(np.maximum(opens, closes) * (1 + wick[0]), st.digits)
+        bars["low"] = np.round(np.minimum(opens, closes) * (1 - wick[1]), st.digits)
+        bars["tick_volume"] = rng.integers(50, 500, n)
+        bars["spread"] = st.spread_points
+        entry = [rates, n]
+        st.bars[tf] = entry
+        return entry
+
+    def _quote(self, st):
+        half = st.spread_points * st.point / 2.0
+        return round(st.mid - half, st.digits), round(st.mid + half, st.digits)
+
+    def _symbol(self, symbol):
+        return self._symbols.get(symbol)
+
+    def _open_initial_positions(self, count):
+        if count <= 0:
+            return
+        names = list(self._symbols)
+        picks = self._rng.integers(0, len(names), count)
+        sides = self._rng.integers(0, 2, count)
+        offsets = self._rng.normal(0.0, 1.0, count)
+        now = int(self.clock())
+        for name_idx, side, off in zip(picks, sides, offsets):
+            st = self._symbols[names[name_idx]]
+            price_open = round(st.mid * (1 - off * st.sigma * 40), st.digits)
+            self._add_position(st, int(side), 0.01, price_open, 0.0, 0.0, now, "sim seed")
+
+    def _add_position(self, st, side, volume, price, sl, tp, now, comment):
+        ticket = self._next_ticket
+        self._next_ticket += 1
+        self._positions[ticket] = {
+            "ticket": ticket, "time": now, "type": side, "volume": float(volume),
+            "price_open": float(price), "sl": float(sl or 0.0), "tp": float(tp or 0.0),
+            "symbol": st.name, "comment": comment, "magic": MAGIC,
+        }
+        return ticket
+
+    def _position_tuple(self, p, bid, ask, tick_value, point):
+        current = bid if p["type"] == POSITION_TYPE_BUY else ask
+        direction = 1.0 if p["type"] == POSITION_TYPE_BUY else -1.0
+        profit = (current - p["price_open"]) * direction / point * tick_value * p["volume"]
+        t = p["time"]
+        return TradePosition(
+            p["ticket"], t, t * 1000, t, t * 1000, p["type"], p["magic"], p["ticket"], 0,
+            p["volume"], p["price_open"], p["sl"], p["tp"], current, 0.0, round(profit, 2),
+            p["symbol"], p["comment"], "",
+        )
+
+    def _close_hits(self, positions, quotes):
+        """Close positions whose SL or TP has been touched; returns the survivors."""
+        alive = []
+        for p in positions:
+            bid, ask = quotes[p["symbol"]][:2]
+            if p["type"] == POSITION_TYPE_BUY:
+                hit = (p["sl"] and bid <= p["sl"]) or (p["tp"] and bid >= p["tp"])
+                exit_price = bid
+            else:
+                hit = (p["sl"] and ask >= p["sl"]) or (p["tp"] and ask <= p["tp"])
+                exit_price = ask
+            if hit:
+                self._realize(p, exit_price, self._symbols[p["symbol"]])
+            else:
+                alive.append(p)
+        return alive
+
+    def _realize(self, p, exit_price, st):
+        direction = 1.0 if p["type"] == POSITION_TYPE_BUY else -1.0
+        self._balance += (exit_price - p["price_open"]) * direction / st.point * st.tick_value * p["volume"]
+        self._positions.pop(p["ticket"], None)
+
+    def _result(self, retcode, request, price=0.0, bid=0.0, ask=0.0, order=0, comment=""):
+        return OrderSendResult(retcode, order, order, request.get("volume", 0.0), price,
+                               bid, ask, comment, 0, 0, request)
+
+    # -----------------------
+    # MT5 API
+    # -----------------------
+    def initialize(self, *args, **kwargs):
+        self._call("initialize")
+        self._initialized = True
+        return True
+
+    def shutdown(self):
+        self._call("shutdown")
+        self._initialized = False
+        return True
+
+    def last_error(self):
+        return (1, "Success")
+
+    def version(self):
+        return (500, 4000, "simulated")
+
+    def symbols_total(self):
+        return len(self._symbols)
+
+    def symbols_get(self, group=None):
+        self._call("symbols_get")
+        with self._lock:
+            return tuple(self._symbol_info(st) for st in self._symbols.values())
+
+    def symbol_select(self, symbol, enable=True):
+        return symbol in self._symbols
+
+    def _symbol_info(self, st):
+        bid, ask = self._quote(st)
+        return SymbolInfo(
+            st.name, f"Simulated {st.name}", f"Sim\\{st.name}", True, True, st.digits, st.point,
+            st.spread_points, st.tick_value, st.point, st.tick_value / st.point,
+            10, 5, True, 0.01, 100.0, 0.01, bid, ask, int(st.t_last),
+        )
+
+    def symbol_info(self, symbol):
+        self._call("symbol_info")
+        with self._lock:
+            st = self._symbol(symbol)
+            if st is None:
+                return None
+            self._advance(st)
+            return self._symbol_info(st)
+
+    def symbol_info_tick(self, symbol):
+        self._call("symbol_info_tick")
+        with self._lock:
+            st = self._symbol(symbol)
+            if st is None:
+                return None
+            self._advance(st)
+            bid, ask = self._quote(st)
+            t = st.t_last
+            return Tick(int(t), bid, ask, 0.0, 0, int(t * 1000), 6, 0.0)
+
+    def copy_rates_from_pos(self, symbol, timeframe, start_pos, count):
+        self._call("copy_rates_from_pos")
+        with self._lock:
+            st = self._symbol(symbol)
+            if st is None or count <= 0:
+                return None
+            entry = self._materialize(st, timeframe)
+            self._advance(st)
+            rates, n = entry
+            stop = n - int(start_pos)
+            if stop <= 0:
+                return None
+            return rates[max(0, stop - int(count)):stop].copy()
+
+    def copy_rates_from(self, symbol, timeframe, date_from, count):
+        """Up to `count` bars ending at (and including) `date_from`."""
+        self._call("copy_rates_from")
+        with self._lock:
+            st = self._symbol(symbol)
+            if st is None or count <= 0:
+                return None
+            entry = self._materialize(st, timeframe)
+            self._advance(st)
+            rates, n = entry
+            stop = int(np.searchsorted(rates["time"][:n], _to_timestamp(date_from), side="right"))
+            return rates[max(0, stop - int(count)):stop].copy()
+
+    def copy_rates_range(self, symbol, timeframe, date_from, date_to):
+        self._call("copy_rates_range")
+        with self._lock:
+            st = self._symbol(symbol)
+            if st is None:
+                return None
+            entry = self._materialize(st, timeframe)
+            self._advance(st)
+            rates, n = entry
+            times = rates["time"][:n]
+            lo = int(np.searchsorted(times, _to_timestamp(date_from), side="left"))
+            hi = int(np.searchsorted(times, _to_timestamp(date_to), side="right"))
+            return rates[lo:hi].copy()
+
+    def positions_total(self):
+        return len(self._positions)
+
+    def positions_get(self, symbol=None, group=None, ticket=None):
+        self._call("positions_get")
+        with self._lock:
+            if ticket is not None:
+                p = self._positions.get(int(ticket))
+                selected = [p] if p else []
+            elif symbol is not None:
+                selected = [p for p in self._positions.values() if p["symbol"] == symbol]
+            else:
+                selected = list(self._positions.values())
+            quotes = {}
+            for name in {p["symbol"] for p in selected}:
+                st = self._symbols[name]
+                self._advance(st)
+                quotes[name] = self._quote(st) + (st.tick_value, st.point)
+            alive = self._close_hits(selected, quotes)
+            return tuple(self._position_tuple(p, *quotes[p["symbol"]]) for p in alive)
+
+    def account_info(self):
+        self._call("account_info")
+        with self._lock:
+            profit = 0.0
+            volume = 0.0
+            for p in self._positions.values():
+                st = self._symbols[p["symbol"]]
+                bid, ask = self._quote(st)
+                current = bid if p["type"] == POSITION_TYPE_BUY else ask
+                direction = 1.0 if p["type"] == POSITION_TYPE_BUY else -1.0
+                profit += (current - p["price_open"]) * direction / st.point * st.tick_value * p["volume"]
+                volume += p["volume"]
+            equity = self._balance + profit
+            margin = volume * 100.0
+            level = equity / margin * 100.0 if margin else 0.0
+            return AccountInfo(
+                5000001, 0, 100, round(self._balance, 2), 0.0, round(profit, 2), round(equity, 2),
+                round(margin, 2), round(equity - margin, 2), round(level, 2),
+                "Simulated Account", "Sim-Server", "USD", "Simulated Broker",
+            )
+
+    def order_send(self, request):
+        self._call("order_send")
+        with self._lock:
+            action = request.get("action")
+            st = self._symbol(request.get("symbol"))
+            if st is None:
+                return self._result(TRADE_RETCODE_INVALID, request, comment="Unknown symbol")
+            self._advance(st)
+            bid, ask = self._quote(st)
+
+            if action == TRADE_ACTION_SLTP:
+                p = self._positions.get(int(request.get("position", 0)))
+                if p is None:
+                    return self._result(TRADE_RETCODE_POSITION_CLOSED, request, bid=bid, ask=ask)
+                sl = float(request.get("sl") or 0.0)
+                tp = float(request.get("tp") or 0.0)
+                min_dist = 10 * st.point
+                ref = bid if p["type"] == POSITION_TYPE_BUY else ask
+                if p["type"] == POSITION_TYPE_BUY:
+                    bad = (sl and sl > ref - min_dist) or (tp and tp < ref + min_dist)
+                else:
+                    bad = (sl and sl < ref + min_dist) or (tp and tp > ref - min_dist)
+                if bad:
+                    return self._result(TRADE_RETCODE_INVALID_STOPS, request, bid=bid, ask=ask,
+                                        comment="Invalid stops")
+                p["sl"], p["tp"] = sl, tp
+                return self._result(TRADE_RETCODE_DONE, request, bid=bid, ask=ask,
+                                    order=p["ticket"], comment="Request executed")
+
+            if action == TRADE_ACTION_DEAL:
+                if self.requote_rate and self._rng.random() < self.requote_rate:
+                    return self._result(TRADE_RETCODE_REQUOTE, request, bid=bid, ask=ask, comment="Requote")
+                side = int(request.get("type", ORDER_TYPE_BUY))
+                price = ask if side == ORDER_TYPE_BUY else bid
+                requested = request.get("price")
+                deviation = request.get("deviation")
+                if requested and deviation is not None and abs(price - requested) > deviation * st.point:
+                    return self._result(TRADE_RETCODE_PRICE_CHANGED, request, bid=bid, ask=ask,
+                                        comment="Price changed")
+                closing = request.get("position")
+                if closing:
+                    p = self._positions.get(int(closing))
+                    if p is None:
+                        return self._result(TRADE_RETCODE_POSITION_CLOSED, request, bid=bid, ask=ask)
+                    self._realize(p, price, st)
+                    return self._result(TRADE_RETCODE_DONE, request, price, bid, ask, int(closing),
+                                        "Request executed")
+                ticket = self._add_position(st, side, request.get("volume", 0.01), price,
+                                            request.get("sl"), request.get("tp"),
+                                            int(self.clock()), request.get("comment", ""))
+                return self._result(TRADE_RETCODE_DONE, request, price, bid, ask, ticket,
+                                    "Request executed")
+
+            return self._result(TRADE_RETCODE_INVALID, request, bid=bid, ask=ask,
+                                comment="Unsupported action")
+
+
+# Expose the constants as attributes, the way the MetaTrader5 module does
+for _name, _value in list(globals().items()):
+    if _name.startswith(("TIMEFRAME_", "TRADE_", "ORDER_", "POSITION_")):
+        setattr(SimulatedMT5, _name, _value)
@@ -0,0 +1,187 @@
+"""
+Coalesced SL/TP modifications.
+
+Trailers propose stops instead of sending them. Within one cycle the last
+proposal per ticket wins (e.g. CandleTrailingStop's break-even move is
+replaced by the trailing level it computes right after), and ``flush``
+sends what is left:
+
+- changes smaller than `min_step_points` are dropped;
+- stops inside the symbol's stops level, and positions whose current SL/TP
+  is within the freeze level of the price, are skipped (the server would
+  reject them anyway);
+- sends are limited per account by a token bucket shared by the process;
+  anything over the budget is left for the trailers to propose again next
+  cycle;
+- the position object the trailer already holds is passed along, so no
+  ``positions_get`` runs before a modify.
+"""
+import threading
+import time
+from datetime import datetime
+
+from broker import mt5
+from mt5_helpers import update_order_sl_tp
+from symbol_catalog import catalog
+
+
+DEFAULT_MIN_STEP_POINTS = 1
+DEFAULT_MAX_PER_SECOND = 10.0
+DEFAULT_BURST = 20
+
+
+class RateLimiter:
+    """Token bucket: `rate` modifies per second, up to `burst` at once."""
+
+    def __init__(self, rate=DEFAULT_MAX_PER_SECOND, burst=DEFAULT_BURST, clock=None):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.clock = clock or time.monotonic
+        self._tokens = self.burst
+        self._updated = self.clock()
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens < 1.0:
+                return False
+            self._tokens -= 1.0
+            return True
+
+
+# One terminal connection (= one account) per process
+account_limiter = RateLimiter()
+
+
+class _Proposal:
+    __slots__ = ("position", "sl", "tp", "log")
+
+    def __init__(self, position, sl, tp, log):
+        self.position = position
+        self.sl = sl
+        self.tp = tp
+        self.log = log
+
+
+class SLTPEngine:
+    """Collects proposed stops for one cycle and sends the final one per ticket."""
+
+    def __init__(self, min_step_points=DEFAULT_MIN_STEP_POINTS, limiter=None):
+        self.min_step_points = min_step_points
+        self.limiter = limiter or account_limiter
+        self._pending = {}
+        self.proposed = 0
+        self.sent = 0
+        self.failed = 0
+        self.coalesced = 0
+        self.skipped_step = 0
+        self.skipped_level = 0
+        self.deferred = 0
+
+    def propose(self, position, new_sl=None, new_tp=None, log=None):
+        """
+        Intended SL/TP for a position (None keeps the current value).
+        `log` is an execution_logs entry written once the server accepted the change.
+        """
+        self.proposed += 1
+        ticket = int(position.ticket)
+        previous = self._pending.get(ticket)
+        if previous is not None:
+            self.coalesced += 1
+            # An earlier proposal's explicit value survives unless overridden
+            new_sl = previous.sl if new_sl is None else new_sl
+            new_tp = previous.tp if new_tp is None else new_tp
+        self._pending[ticket] = _Proposal(position, new_sl, new_tp, log)
+
+    def __len__(self):
+        return len(self._pending)
+
+    # -----------------------
+    # Filters
+    # -----------------------
+    def _changed_enough(self, current, new, point):
+        if new is None:
+            return False
+        return abs(float(new) - float(current or 0.0)) >= self.min_step_points * point
+
+    def _allowed(self, pos, sl, tp, info, tick):
+        """Broker-side checks: stops level for the new values, freeze level for the old ones."""
+        point = info.point
+        stops = getattr(info, "trade_stops_level", 0) * point
+        freeze = getattr(info, "trade_freeze_level", 0) * point
+        buy = pos.type == mt5.POSITION_TYPE_BUY
+        price = tick.bid if buy else tick.ask
+        if freeze:
+            for level in (pos.sl, pos.tp):
+                if level and abs(price - level) <= freeze:
+                    return False
+        if buy:
+            if sl and sl > price - stops:
+                return False
+            if tp and tp < price + stops:
+                return False
+        else:
+            if sl and sl < price + stops:
+                return False
+            if tp and tp > price - stops:
+                return False
+        return True
+
+    # -----------------------
+    # Sending
+    # -----------------------
+    def flush(self, state=None):
+        """Send the surviving modifications; returns {ticket: OrderSendResult}."""
+        pending, self._pending = self._pending, {}
+        ticks = {}
+        results = {}
+        for ticket, prop in pending.items():
+            pos = prop.position
+            info = catalog.info(pos.symbol)
+            if info is None:
+                continue
+            sl = pos.sl if prop.sl is None else float(prop.sl)
+            tp = pos.tp if prop.tp is None else float(prop.tp)
+            if not (self._changed_enough(pos.sl, prop.sl, info.point) or self._changed_enough(pos.tp, prop.tp, info.point)):
+                self.skipped_step += 1
+                continue
+            if pos.symbol not in ticks:
+                ticks[pos.symbol] = mt5.symbol_info_tick(pos.symbol)
+            tick = ticks[pos.symbol]
+            if tick is None or not self._allowed(pos, sl, tp, info, tick):
+                self.skipped_level += 1
+                continue
+            if not self.limiter.try_acquire():
+                self.deferred += 1
+                continue
+            result = update_order_sl_tp(ticket, sl, tp, position=pos)
+            results[ticket] = result
+            if result and result.retcode == mt5.TRADE_RETCODE_DONE:
+                self.sent += 1
+                if state is not None and prop.log is not None:
+                    state.execution_logs.append(prop.log)
+            else:
+                self.failed += 1
+                if state is not None:
+                    state.execution_logs.append({
+                        "time": datetime.now().strftime("%H:%M:%S"),
+                        "msg": f"❌ SL/TP update {pos.symbol} #{ticket} failed | RetCode={getattr(result, 'retcode', 'N/A')}",
+                        "color": "red",
+                        "symbol": pos.symbol,
+                        "level": "error",
+                    })
+        return results
+
+    def stats(self):
+        return {
+            "proposed": self.proposed,
+            "coalesced": self.coalesced,
+            "sent": self.sent,
+            "failed": self.failed,
+            "skipped_step": self.skipped_step,
+            "skipped_level": self.skipped_level,
+            "deferred": self.deferred,
+        }
@@ -1,88 +1,134 @@
-import MetaTrader5 as mt5
-from datetime import datetime
-import streamlit as st
-import pandas as pd
-from mt5_helpers import update_order_sl_tp
-
-
-class ATRTrailingStop:
-    def __init__(self, symbol, timeframe=mt5.TIMEFRAME_M1, atr_period=14,
-                 atr_mult=2.0, profit_trigger_pips=20, step_pips=5):
-        """
-        ATR trailing stop:
-        - symbol: trading pair (e.g., 'EURUSD')
-        - timeframe: MT5 timeframe (default M1)
-        - atr_period: ATR calculation period
-        - atr_mult: multiplier for ATR distance
-        - profit_trigger_pips: only trail if profit ≥ this threshold
-        - step_pips: only move SL if profit increased by this much since last SL
-        """
-        self.symbol = symbol
-        self.timeframe = timeframe
-        self.atr_period = atr_period
-        self.atr_mult = atr_mult
-        self.profit_trigger_pips = profit_trigger_pips
-        self.step_pips = step_pips
-
-    def calculate_atr(self, rates):
-        """Calculate ATR from OHLC rates."""
-        if rates is None or len(rates) < self.atr_period:
-            return None
-
-        df = pd.DataFrame(rates)
-        df["high_low"] = df["high"] - df["low"]
-        df["high_close"] = abs(df["high"] - df["close"].shift())
-        df["low_close"] = abs(df["low"] - df["close"].shift())
-        tr = df[["high_low", "high_close", "low_close"]].max(axis=1)
-        atr = tr.rolling(self.atr_period).mean()
-
-        return atr.iloc[-1] if not atr.empty else None
-
-    def run(self):
-        positions = mt5.positions_get(symbol=self.symbol)
-        if not positions:
-            return
-
-        # Fetch ATR
-        rates = mt5.copy_rates_from_pos(self.symbol, self.timeframe, 0, self.atr_period + 2)
-        if rates is None or len(rates) < self.atr_period:
-            return
-
-        atr_raw = self.calculate_atr(rates)
-        if atr_raw is None:
-            return
-
-        atr_val = atr_raw * self.atr_mult
-        point = mt5.symbol_info(self.symbol).point
-        tick = mt5.symbol_info_tick(self.symbol)
-
-        for pos in positions:
-            if pos.type == 0:  # BUY
-                profit_pips = (tick.bid - pos.price_open) / point
-                if profit_pips >= self.profit_trigger_pips:
-                    # Minimum SL level based on ATR
-                    new_sl = tick.bid - atr_val
-
-                    # Only move if at least `step_pips` above old SL
-                    if new_sl > (pos.sl or 0) + self.step_pips * point:
-                        update_order_sl_tp(pos.ticket, new_sl, pos.tp)
-                        st.session_state.execution_logs.append({
-                            "time": datetime.now().strftime("%H:%M:%S"),
-                            "msg": f"🔵 Trailing BUY {self.symbol}: SL → {new_sl:.5f} ({profit_pips:.1f} pips profit)",
-                            "color": "blue"
-                        })
-
-            elif pos.type == 1:  # SELL
-                profit_pips = (pos.price_open - tick.ask) / point
-                if profit_pips >= self.profit_trigger_pips:
-                    # Minimum SL level based on ATR
-                    new_sl = tick.ask + atr_val
-
-                    # Only move if at least `step_pips` below old SL
-                    if pos.sl == 0 or new_sl < pos.sl - self.step_pips * point:
-                        update_order_sl_tp(pos.ticket, new_sl, pos.tp)
-                        st.session_state.execution_logs.append({
-                            "time": datetime.now().strftime("%H:%M:%S"),
-                            "msg": f"🔴 Trailing SELL {self.symbol}: SL → {new_sl:.5f} ({profit_pips:.1f} pips profit)",
-                            "color": "red"
-                        })
+from broker import mt5
+from datetime import datetime
+from sltp_engine import SLTPEngine
+from indicators import StreamingATR, atr_for
+from app_state import get_state
+from positions import positions_snapshot
+from symbol_catalog import catalog
+from position_book import atr_trail_stops, propose_changes
+from strategies.base import Strategy, register
+
+
+def atr_trail_sl(buy, price_open, sl, price, point, atr_distance, profit_trigger_pips, step_pips):
+    """
+    New SL of the ATR trailer for one position, or None to leave it:
+    `atr_distance` (ATR * mult) behind `price` (bid for a BUY, ask for a
+    SELL) once profit reaches the trigger, moved in steps of at least
+    `step_pips`.
+    """
+    if buy:
+        if (price - price_open) / point < profit_trigger_pips:
+            return None
+        # Minimum SL level based on ATR; only move if at least `step_pips` above old SL
+        new_sl = price - atr_distance
+        return new_sl if new_sl > (sl or 0) + step_pips * point else None
+    if (price_open - price) / point < profit_trigger_pips:
+        return None
+    # Only move if at least `step_pips` below old SL
+    new_sl = price + atr_distance
+    return new_sl if sl == 0 or new_sl < sl - step_pips * point else None
+
+
+class ATRTrailingStop:
+    def __init__(self, symbol, timeframe=mt5.TIMEFRAME_M1, atr_period=14,
+                 atr_mult=2.0, profit_trigger_pips=20, step_pips=5, atr_method="simple"):
+        """
+        ATR trailing stop:
+        - symbol: trading pair (e.g., 'EURUSD')
+        - timeframe: MT5 timeframe (default M1)
+        - atr_period: ATR calculation period
+        - atr_mult: multiplier for ATR distance
+        - profit_trigger_pips: only trail if profit ≥ this threshold
+        - step_pips: only move SL if profit increased by this much since last SL
+        - atr_method: 'simple' (rolling mean) or 'wilder' smoothing
+        """
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.atr_period = atr_period
+        self.atr_mult = atr_mult
+        self.profit_trigger_pips = profit_trigger_pips
+        self.step_pips = step_pips
+        self.atr_method = atr_method
+
+    def calculate_atr(self, rates):
+        """Calculate ATR from OHLC rates."""
+        if rates is None or len(rates) < self.atr_period:
+            return None
+        return StreamingATR(self.atr_period, self.atr_method).seed(rates).value()
+
+    def run(self, sltp=None):
+        """
+        Propose new stops for this symbol's positions. With an `sltp` engine
+        the caller flushes it (coalescing across trailers); without one the
+        stops are sent at the end of this run.
+        """
+        state = get_state()
+        own = sltp is None
+        if own:
+            sltp = SLTPEngine()
+        positions = positions_snapshot().for_symbol(self.symbol)
+        if not positions:
+            return
+
+        # Shared streaming ATR (only new bars are read)
+        atr_raw = atr_for(self.symbol, self.timeframe, self.atr_period, self.atr_method)
+        if atr_raw is None:
+            return
+
+        self.propose_stops(sltp, positions, mt5.symbol_info_tick(self.symbol), catalog.point(self.symbol), atr_raw)
+
+        if own:
+            sltp.flush(state)
+
+    def propose_stops(self, sltp, positions, tick, point, atr_raw):
+        """Trailing proposals for `positions` at `atr_raw` * atr_mult behind the current price."""
+        atr_val = atr_raw * self.atr_mult
+        for pos in positions:
+            buy = pos.type == 0
+            price = tick.bid if buy else tick.ask
+            new_sl = atr_trail_sl(buy, pos.price_open, pos.sl, price, point, atr_val,
+                                  self.profit_trigger_pips, self.step_pips)
+            if new_sl is None:
+                continue
+            profit_pips = (price - pos.price_open) / point if buy else (pos.price_open - price) / point
+            side = "BUY" if buy else "SELL"
+            sltp.propose(pos, new_sl, pos.tp, log={
+                "time": datetime.now().strftime("%H:%M:%S"),
+                "msg": f"{'🔵' if buy else '🔴'} Trailing {side} {self.symbol}: SL → {new_sl:.5f} ({profit_pips:.1f} pips profit)",
+                "color": "blue" if buy else "red"
+            })
+
+
+@register("atr_trailer")
+class ATRTrailerStrategy(Strategy):
+    """ATR trailing stop as a scheduler plugin (ATR 14 x 2.0 from the shared streaming ATR, whole book at once)."""
+    positions = True
+
+    def __init__(self, timeframe=None, atr_period=14, atr_mult=2.0, profit_trigger_pips=20, step_pips=5,
+                 atr_method="simple", **params):
+        super().__init__(**params)
+        self.timeframe = timeframe
+        self.settings = dict(atr_period=atr_period, atr_mult=atr_mult, profit_trigger_pips=profit_trigger_pips,
+                             step_pips=step_pips, atr_method=atr_method)
+
+    def on_positions(self, ctx, book):
+        settings = self.settings
+        distance = {}
+        for symbol in book.symbols:
+            atr_raw = atr_for(symbol, self.timeframe, settings["atr_period"], settings["atr_method"])
+            if atr_raw is not None:
+                distance[symbol] = atr_raw * settings["atr_mult"]
+        changes = atr_trail_stops(book, book.per_symbol(distance), settings["profit_trigger_pips"],
+                                  settings["step_pips"])
+        propose_changes(ctx.sltp, book, changes, log=self._log_entry)
+
+    def _log_entry(self, pos, change, price):
+        buy = pos.type == 0
+        side = "BUY" if buy else "SELL"
+        point = catalog.point(pos.symbol)
+        profit_pips = (price - pos.price_open) / point if buy else (pos.price_open - price) / point
+        return {
+            "time": datetime.now().strftime("%H:%M:%S"),
+            "msg": f"{'🔵' if buy else '🔴'} Trailing {side} {pos.symbol}: SL → {change['sl']:.5f} ({profit_pips:.1f} pips profit)",
+            "color": "blue" if buy else "red"
+        }
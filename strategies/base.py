@@ -0,0 +1,69 @@
+"""
+Strategy plugin interface.
+
+A strategy subclasses Strategy, declares the data it reads (bars of a
+timeframe with a lookback, the level table, ticks, positions) and gets
+callbacks from scheduler.StrategyScheduler, which fetches that data once
+per pass for every strategy and symbol:
+
+- on_bar(ctx, symbol, bars): a bar of `timeframe` closed; `bars` are the
+  last `lookback` closed bars, oldest first
+- on_tick(ctx, symbol, tick): the symbol's quote changed since the last pass
+- on_position(ctx, symbol, positions): every pass while the symbol has open
+  positions
+- on_positions(ctx, book): instead of on_position, once per pass with the
+  position_book.PositionBook of every watched symbol (vectorized rules)
+
+The instance lives as long as the scheduler, so anything kept on `self`
+persists between passes. Register with ``@register("name")`` so the
+dashboard and the engine can create it by name.
+"""
+
+
+class Strategy:
+    name = None
+    timeframe = None  # bars timeframe; None: the scheduler's timeframe
+    lookback = 0      # closed bars handed to on_bar (and prefetched for ctx.bars)
+    levels = False    # reads ctx.levels()
+    levels_timeframe = None  # levels of another timeframe (resampled); None: the scheduler's
+    ticks = False     # wants on_tick
+    positions = False # wants on_position (or on_positions)
+    budget_ms = None  # wall time per pass; None: the scheduler's default
+
+    def __init__(self, **params):
+        self.params = params
+
+    def on_bar(self, ctx, symbol, bars):
+        pass
+
+    def on_tick(self, ctx, symbol, tick):
+        pass
+
+    def on_position(self, ctx, symbol, positions):
+        pass
+
+    def on_positions(self, ctx, book):
+        pass
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.name})"
+
+
+REGISTRY = {}
+
+
+def register(name):
+    """Class decorator: make a Strategy subclass available as `name`."""
+    def decorator(cls):
+        cls.name = name
+        REGISTRY[name] = cls
+        return cls
+    return decorator
+
+
+def create(name, **params):
+    try:
+        cls = REGISTRY[name]
+    except KeyError:
+        raise ValueError(f"Unknown strategy {name!r} (registered: {', '.join(sorted(REGISTRY))})")
+    return cls(**params)
@@ -1,82 +1,142 @@
-import MetaTrader5 as mt5
-from datetime import datetime
-import streamlit as st
-import pandas as pd
-from mt5_helpers import update_order_sl_tp
-
-
-class CandleTrailingStop:
-    def __init__(self, symbol, timeframe=mt5.TIMEFRAME_M1,
-                 profit_trigger_pips=20, lookback_candles=3):
-        """
-        Candle-based trailing stop:
-        - symbol: trading pair (e.g., 'EURUSD')
-        - timeframe: MT5 timeframe (default M1)
-        - profit_trigger_pips: set BE SL after this many pips
-        - lookback_candles: trailing uses last N candles high/low
-        """
-        self.symbol = symbol
-        self.timeframe = timeframe
-        self.profit_trigger_pips = profit_trigger_pips
-        self.lookback_candles = lookback_candles
-
-    def run(self):
-        positions = mt5.positions_get(symbol=self.symbol)
-        if not positions:
-            return
-
-        tick = mt5.symbol_info_tick(self.symbol)
-        point = mt5.symbol_info(self.symbol).point
-
-        # Get last N+1 candles for trailing calc
-        rates = mt5.copy_rates_from_pos(self.symbol, self.timeframe, 1, self.lookback_candles)
-        if rates is None or len(rates) < self.lookback_candles:
-            return
-        df = pd.DataFrame(rates)
-
-        for pos in positions:
-            if pos.type == 0:  # BUY
-                profit_pips = (tick.bid - pos.price_open) / point
-
-                # Step 1: Move to BE if profit ≥ trigger
-                if profit_pips >= self.profit_trigger_pips and (pos.sl == 0 or pos.sl < pos.price_open):
-                    update_order_sl_tp(pos.ticket, pos.price_open, pos.tp)
-                    st.session_state.execution_logs.append({
-                        "time": datetime.now().strftime("%H:%M:%S"),
-                        "msg": f"🔵 {self.symbol} BUY moved SL → BE @ {pos.price_open:.5f}",
-                        "color": "blue"
-                    })
-
-                # Step 2: Trail to lowest low of last N candles
-                if profit_pips >= self.profit_trigger_pips:
-                    new_sl = df["low"].min()
-                    if new_sl > (pos.sl or 0):
-                        update_order_sl_tp(pos.ticket, new_sl, pos.tp)
-                        st.session_state.execution_logs.append({
-                            "time": datetime.now().strftime("%H:%M:%S"),
-                            "msg": f"🔵 {self.symbol} BUY trailing SL → {new_sl:.5f} ({profit_pips:.1f} pips)",
-                            "color": "blue"
-                        })
-
-            elif pos.type == 1:  # SELL
-                profit_pips = (pos.price_open - tick.ask) / point
-
-                # Step 1: Move to BE if profit ≥ trigger
-                if profit_pips >= self.profit_trigger_pips and (pos.sl == 0 or pos.sl > pos.price_open):
-                    update_order_sl_tp(pos.ticket, pos.price_open, pos.tp)
-                    st.session_state.execution_logs.append({
-                        "time": datetime.now().strftime("%H:%M:%S"),
-                        "msg": f"🔴 {self.symbol} SELL moved SL → BE @ {pos.price_open:.5f}",
-                        "color": "red"
-                    })
-
-                # Step 2: Trail to highest high of last N candles
-                if profit_pips >= self.profit_trigger_pips:
-                    new_sl = df["high"].max()
-                    if new_sl < (pos.sl or 999999):  # if SL is higher, move it down
-                        update_order_sl_tp(pos.ticket, new_sl, pos.tp)
-                        st.session_state.execution_logs.append({
-                            "time": datetime.now().strftime("%H:%M:%S"),
-                            "msg": f"🔴 {self.symbol} SELL trailing SL → {new_sl:.5f} ({profit_pips:.1f} pips)",
-                            "color": "red"
-                        })
+from broker import mt5
+from datetime import datetime
+from sltp_engine import SLTPEngine
+from bar_cache import get_rates
+from app_state import get_state
+from positions import positions_snapshot
+from symbol_catalog import catalog
+from position_book import candle_trail_stops, propose_changes
+from strategies.base import Strategy, register
+
+
+def candle_trail_sl(buy, price_open, sl, price, point, profit_trigger_pips, low_min, high_max):
+    """
+    Stop proposals of the candle trailer for one position, in order (the
+    last one wins once coalesced): break-even when profit reaches the
+    trigger and SL is not there yet, then the lowest low (BUY) / highest
+    high (SELL) of the lookback candles when that improves on the current SL.
+    `price` is the bid for a BUY and the ask for a SELL.
+    Returns [("be" | "trail", new_sl), ...].
+    """
+    proposals = []
+    if buy:
+        if (price - price_open) / point < profit_trigger_pips:
+            return proposals
+        # Step 1: Move to BE if profit ≥ trigger
+        if sl == 0 or sl < price_open:
+            proposals.append(("be", price_open))
+        # Step 2: Trail to lowest low of last N candles
+        if low_min > (sl or 0):
+            proposals.append(("trail", low_min))
+    else:
+        if (price_open - price) / point < profit_trigger_pips:
+            return proposals
+        if sl == 0 or sl > price_open:
+            proposals.append(("be", price_open))
+        # Trail to highest high of last N candles (if SL is higher, move it down)
+        if high_max < (sl or 999999):
+            proposals.append(("trail", high_max))
+    return proposals
+
+
+class CandleTrailingStop:
+    def __init__(self, symbol, timeframe=mt5.TIMEFRAME_M1,
+                 profit_trigger_pips=20, lookback_candles=3):
+        """
+        Candle-based trailing stop:
+        - symbol: trading pair (e.g., 'EURUSD')
+        - timeframe: MT5 timeframe (default M1)
+        - profit_trigger_pips: set BE SL after this many pips
+        - lookback_candles: trailing uses last N candles high/low
+        """
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.profit_trigger_pips = profit_trigger_pips
+        self.lookback_candles = lookback_candles
+
+    def run(self, sltp=None):
+        """
+        Propose new stops for this symbol's positions. With an `sltp` engine
+        the caller flushes it (coalescing across trailers); without one the
+        stops are sent at the end of this run.
+        """
+        state = get_state()
+        own = sltp is None
+        if own:
+            sltp = SLTPEngine()
+        positions = positions_snapshot().for_symbol(self.symbol)
+        if not positions:
+            return
+
+        tick = mt5.symbol_info_tick(self.symbol)
+        point = catalog.point(self.symbol)
+
+        # Get last N+1 candles for trailing calc
+        rates = get_rates(self.symbol, self.timeframe, 1, self.lookback_candles)
+        if rates is None or len(rates) < self.lookback_candles:
+            return
+
+        self.propose_stops(sltp, positions, tick, point, rates)
+
+        if own:
+            sltp.flush(state)
+
+    def propose_stops(self, sltp, positions, tick, point, rates):
+        """Break-even / trailing proposals for `positions` from the lookback candles in `rates`."""
+        low_min = float(rates["low"].min())
+        high_max = float(rates["high"].max())
+        for pos in positions:
+            buy = pos.type == 0
+            price = tick.bid if buy else tick.ask
+            profit_pips = (price - pos.price_open) / point if buy else (pos.price_open - price) / point
+            side = "BUY" if buy else "SELL"
+            for kind, new_sl in candle_trail_sl(buy, pos.price_open, pos.sl, price, point,
+                                                self.profit_trigger_pips, low_min, high_max):
+                if kind == "be":
+                    msg = f"{self.symbol} {side} moved SL → BE @ {pos.price_open:.5f}"
+                else:
+                    msg = f"{self.symbol} {side} trailing SL → {new_sl:.5f} ({profit_pips:.1f} pips)"
+                sltp.propose(pos, new_sl, pos.tp, log={
+                    "time": datetime.now().strftime("%H:%M:%S"),
+                    "msg": f"{'🔵' if buy else '🔴'} {msg}",
+                    "color": "blue" if buy else "red"
+                })
+
+
+@register("candle_trailer")
+class CandleTrailerStrategy(Strategy):
+    """Candle trailing stop as a scheduler plugin: BE after 20 pips, trail on the last 3 closed candles, whole book at once."""
+    positions = True
+
+    def __init__(self, timeframe=None, profit_trigger_pips=20, lookback_candles=3, **params):
+        super().__init__(**params)
+        self.timeframe = timeframe
+        self.lookback = lookback_candles
+        self.profit_trigger_pips = profit_trigger_pips
+
+    def on_positions(self, ctx, book):
+        # Lookback extremes per symbol (NaN: not enough closed bars, no change)
+        low_min, high_max = {}, {}
+        for symbol in book.symbols:
+            rates = ctx.bars(symbol, self.timeframe, self.lookback, skip=1)
+            if rates is not None and len(rates) >= self.lookback:
+                low_min[symbol] = float(rates["low"].min())
+                high_max[symbol] = float(rates["high"].max())
+        changes = candle_trail_stops(book, self.profit_trigger_pips,
+                                     book.per_symbol(low_min), book.per_symbol(high_max))
+        propose_changes(ctx.sltp, book, changes, log=self._log_entry)
+
+    def _log_entry(self, pos, change, price):
+        buy = pos.type == 0
+        side = "BUY" if buy else "SELL"
+        point = catalog.point(pos.symbol)
+        profit_pips = (price - pos.price_open) / point if buy else (pos.price_open - price) / point
+        if change["kind"] == "be":
+            msg = f"{pos.symbol} {side} moved SL → BE @ {pos.price_open:.5f}"
+        else:
+            msg = f"{pos.symbol} {side} trailing SL → {change['sl']:.5f} ({profit_pips:.1f} pips)"
+        return {
+            "time": datetime.now().strftime("%H:%M:%S"),
+            "msg": f"{'🔵' if buy else '🔴'} {msg}",
+            "color": "blue" if buy else "red"
+        }
@@ -0,0 +1,29 @@
+from autotrade import run_autotrade, suggest_tp_points
+from strategies.base import Strategy, register
+
+
+@register("level_cross")
+class LevelCrossStrategy(Strategy):
+    """
+    The dashboard's auto-trade rule as a scheduler plugin: BUY when price
+    crosses Buy1 upward, SELL when it crosses PHH (or HH) downward, checked
+    whenever the symbol's quote changed. `levels_timeframe` trades the
+    levels of another timeframe (resampled from the scheduler's bars).
+    """
+    levels = True
+    ticks = True
+
+    def __init__(self, levels_timeframe=None, **params):
+        super().__init__(**params)
+        self.levels_timeframe = levels_timeframe
+
+    def on_tick(self, ctx, symbol, tick):
+        levels = ctx.levels(symbol, self.levels_timeframe)
+        last_price = ctx.last_close(symbol)
+        point = ctx.point(symbol)
+        if levels is None or last_price is None or not point:
+            return
+        run_autotrade(
+            symbol, last_price, levels, ctx.lot_size, suggest_tp_points(levels, point), point,
+            ctx.default_tp_points, ctx.default_sl_points,
+        )
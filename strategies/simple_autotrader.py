@@ -1,66 +1,98 @@
-import pandas as pd
-import streamlit as st
-from mt5_helpers import place_order_safe
-
-
-class SimpleAutoTrader:
-    """
-    Auto-trader that executes trades at Buy1 / PHH / HH levels.
-    - Places orders with lot size + stop-loss only (no TP).
-    - ATR trailing stop is handled separately by atr_trailer.py.
-    """
-
-    def __init__(self, symbol, lot_size, default_sl_points):
-        self.symbol = symbol
-        self.lot_size = lot_size
-        self.default_sl_points = default_sl_points
-
-    def run(self, last_close, levels):
-        """
-        Run auto-trading checks and execute trades if levels are hit.
-        Args:
-            last_close (float): latest close price.
-            levels (dict): dictionary with Buy1, PHH, HH levels.
-        """
-        now = pd.Timestamp.now().strftime("%H:%M:%S")
-
-        # ---------------- BUY condition ----------------
-        if "Buy1" in levels and last_close <= levels["Buy1"]:
-            st.session_state.autotrade_logs.append({
-                "time": now,
-                "msg": f"📈 BUY signal at {self.symbol} (last_close={last_close:.5f} <= Buy1={levels['Buy1']:.5f})",
-                "color": "cyan"
-            })
-            place_order_safe(
-                self.symbol,
-                self.lot_size,
-                "BUY",
-                sl_points=self.default_sl_points
-            )
-
-        # ---------------- SELL condition ----------------
-        elif "PHH" in levels and last_close >= levels["PHH"]:
-            st.session_state.autotrade_logs.append({
-                "time": now,
-                "msg": f"📉 SELL signal at {self.symbol} (last_close={last_close:.5f} >= PHH={levels['PHH']:.5f})",
-                "color": "magenta"
-            })
-            place_order_safe(
-                self.symbol,
-                self.lot_size,
-                "SELL",
-                sl_points=self.default_sl_points
-            )
-
-        elif "HH" in levels and last_close >= levels["HH"]:
-            st.session_state.autotrade_logs.append({
-                "time": now,
-                "msg": f"📉 SELL signal at {self.symbol} (last_close={last_close:.5f} >= HH={levels['HH']:.5f})",
-                "color": "red"
-            })
-            place_order_safe(
-                self.symbol,
-                self.lot_size,
-                "SELL",
-                sl_points=self.default_sl_points
-            )
+import pandas as pd
+from app_state import get_state
+from order_pipeline import submit_order
+from strategies.base import Strategy, register
+
+
+class SimpleAutoTrader:
+    """
+    Auto-trader that executes trades at Buy1 / PHH / HH levels.
+    - Places orders with lot size + stop-loss only (no TP), through the order
+      pipeline; each level triggers at most one order per dedupe window.
+    - ATR trailing stop is handled separately by atr_trailer.py.
+    """
+
+    def __init__(self, symbol, lot_size, default_sl_points):
+        self.symbol = symbol
+        self.lot_size = lot_size
+        self.default_sl_points = default_sl_points
+
+    def run(self, last_close, levels):
+        """
+        Run auto-trading checks and execute trades if levels are hit.
+        Args:
+            last_close (float): latest close price.
+            levels (dict): dictionary with Buy1, PHH, HH levels.
+        """
+        state = get_state()
+        now = pd.Timestamp.now().strftime("%H:%M:%S")
+
+        # ---------------- BUY condition ----------------
+        if "Buy1" in levels and last_close <= levels["Buy1"]:
+            state.autotrade_logs.append({
+                "time": now,
+                "msg": f"📈 BUY signal at {self.symbol} (last_close={last_close:.5f} <= Buy1={levels['Buy1']:.5f})",
+                "color": "cyan"
+            })
+            submit_order(
+                state,
+                self.symbol,
+                "BUY",
+                self.lot_size,
+                sl_points=self.default_sl_points,
+                key=f"simple:{self.symbol}:BUY:{levels['Buy1']:.10g}"
+            )
+
+        # ---------------- SELL condition ----------------
+        elif "PHH" in levels and last_close >= levels["PHH"]:
+            state.autotrade_logs.append({
+                "time": now,
+                "msg": f"📉 SELL signal at {self.symbol} (last_close={last_close:.5f} >= PHH={levels['PHH']:.5f})",
+                "color": "magenta"
+            })
+            submit_order(
+                state,
+                self.symbol,
+                "SELL",
+                self.lot_size,
+                sl_points=self.default_sl_points,
+                key=f"simple:{self.symbol}:SELL:{levels['PHH']:.10g}"
+            )
+
+        elif "HH" in levels and last_close >= levels["HH"]:
+            state.autotrade_logs.append({
+                "time": now,
+                "msg": f"📉 SELL signal at {self.symbol} (last_close={last_close:.5f} >= HH={levels['HH']:.5f})",
+                "color": "red"
+            })
+            submit_order(
+                state,
+                self.symbol,
+                "SELL",
+                self.lot_size,
+                sl_points=self.default_sl_points,
+                key=f"simple:{self.symbol}:SELL:{levels['HH']:.10g}"
+            )
+
+
+@register("simple_autotrader")
+class SimpleAutoTraderStrategy(Strategy):
+    """SimpleAutoTrader as a scheduler plugin: checks the last close against the levels on every new quote."""
+    levels = True
+    ticks = True
+
+    def __init__(self, **params):
+        super().__init__(**params)
+        self.traders = {}
+
+    def on_tick(self, ctx, symbol, tick):
+        levels = ctx.levels(symbol, self.levels_timeframe)
+        last_close = ctx.last_close(symbol)
+        if levels is None or last_close is None:
+            return
+        trader = self.traders.get(symbol)
+        if trader is None:
+            trader = self.traders[symbol] = SimpleAutoTrader(symbol, ctx.lot_size, ctx.default_sl_points)
+        trader.lot_size, trader.default_sl_points = ctx.lot_size, ctx.default_sl_points
+        # Missing levels (NaN -> None) never trigger
+        trader.run(last_close, {k: v for k, v in levels.items() if v is not None})
@@ -1,317 +1,365 @@
-import streamlit as st
-from streamlit_autorefresh import st_autorefresh
-from datetime import datetime
-
-from mt5_init import initialize_mt5
-from config import setup_page, sidebar_controls, top_controls
-from mt5_helpers import get_positions_df, analyze_symbol
-from ui import display_symbol_tab
-from autotrade import run_autotrade
-from strategies.simple_autotrader import SimpleAutoTrader
-#from strategies.atr_trailer import ATRTrailingStop
-from strategies.candle_trailer import CandleTrailingStop
-
-
-
-def main():
-    # -----------------------
-    # MT5 init and page setup
-    # -----------------------
-    mt5 = initialize_mt5()
-    setup_page()
-
-    all_symbols = [s.name for s in mt5.symbols_get()]
-    if not all_symbols:
-        st.error("⚠️ No symbols returned from MT5. Check the terminal and Market Watch.")
-        st.stop()
-
-    # -----------------------
-    # Sidebar controls
-    # -----------------------
-    refresh_seconds, lot_size, default_sl_points, default_tp_points = sidebar_controls()
-    timeframe, timeframe_choice, num_candles, selected_symbols = top_controls(all_symbols)
-
-    # -----------------------
-    # Auto-refresh
-    # -----------------------
-    st_autorefresh(interval=refresh_seconds * 1000, key="auto_refresher")
-
-    # -----------------------
-    # Session state initialization
-    # -----------------------
-
-    if "last_trade" not in st.session_state:
-        st.session_state.last_trade = {}
-    if "autotrade" not in st.session_state:
-        st.session_state.autotrade = {}
-    if "execution_logs" not in st.session_state:
-        st.session_state.execution_logs = []
-    if "autotrade_logs" not in st.session_state:
-        st.session_state.autotrade_logs = []
-
-    for s in selected_symbols:
-        st.session_state.last_trade.setdefault(s, None)
-        st.session_state.autotrade.setdefault(s, True)
-
-    # -----------------------
-    # Symbol tabs
-    # -----------------------
-    if not selected_symbols:
-        st.info("Select symbols above to create tabs for each symbol.")
-    else:
-        tabs = st.tabs(selected_symbols)
-        for i, symbol in enumerate(selected_symbols):
-            with tabs[i]:
-                levels, df = analyze_symbol(symbol, timeframe, num_candles)
-                if levels is None:
-                    st.warning("No candle data for this symbol (open in Market Watch & try again).")
-                    continue
-
-                # Display chart, calculation table, positions, and trade controls
-                suggested_tp_points, point = display_symbol_tab(
-                    symbol, levels, df, timeframe_choice,
-                    lot_size, default_tp_points, default_sl_points
-                )
-
-                # -----------------------
-                # Auto-trade logic
-                # -----------------------
-                if st.session_state.autotrade.get(symbol, False):
-                    run_autotrade(
-                        symbol,
-                        float(df["close"].iloc[-1]),
-                        levels,
-                        lot_size,
-                        suggested_tp_points,
-                        point,
-                        default_tp_points,
-                        default_sl_points
-                    )
-                   
-                    # ✅ ATR trailing stop-loss only
-                    #atr_trailer = ATRTrailingStop(symbol, timeframe, atr_period=14, atr_mult=2.0)
-                    #atr_trailer.run()
-                    # ✅ Candle-based trailing stop (BE after 20 pips, trail after 3 candles)
-                    candle_trailer = CandleTrailingStop(
-                        symbol=symbol,
-                        timeframe=timeframe,
-                        profit_trigger_pips=20,
-                        lookback_candles=3
-                    )
-                    candle_trailer.run()
-
-                   
-
-    # -----------------------
-    # Global positions
-    # -----------------------
-    df_pos_all = get_positions_df()
-    st.markdown("---")
-    st.subheader("All Open Positions (global)")
-    if df_pos_all.empty:
-        st.info("No open positions.")
-    else:
-        cols_to_show = [
-            c for c in
-            ["ticket", "symbol", "volume", "type", "price_open", "sl", "tp", "price_current", "profit"]
-            if c in df_pos_all.columns
-        ]
-        df_show = df_pos_all[cols_to_show].copy()
-        if "type" in df_show.columns:
-            df_show["type"] = df_show["type"].map({0: "BUY", 1: "SELL"}).fillna(df_show["type"])
-        st.dataframe(df_show.style.format(precision=2), use_container_width=True)
-
-    # -----------------------
-    # Build logs HTML
-    # -----------------------
-    logs_html = ""
-    checks_html = ""
-
-    # Execution logs (max 10, with spacing)
-    if st.session_state.get("execution_logs"):
-        for log in reversed(st.session_state.execution_logs[-50:]):
-            logs_html += f"<div style='margin-bottom:10px; color:{log.get('color','white')};'>[{log['time']}] {log['msg']}</div>"
-    else:
-        logs_html = "<p style='color:#22db22'>No executed trades yet.</p>"
-
-    # Auto-trade checks (with separators, more entries allowed)
-    if st.session_state.get("autotrade_logs"):
-        for log in reversed(st.session_state.autotrade_logs[-50:]):
-            if log.get("msg") == "----------------":
-                checks_html += "<div style='color:gray; margin:8px 0;'>----------------</div>"
-            else:
-                checks_html += f"<div style='margin-bottom:4px; color:{log.get('color','yellow')};border-bottom: 1px dotted #888; padding-bottom:5px;'>[{log['time']}] {log['msg']}</div>"
-    else:
-        checks_html = "<p style='color:#999'>No checks yet.</p>"
-
-    # -----------------------
-    # Account info (for embedding into same block)
-    # -----------------------
-    account_info = mt5.account_info()
-    if account_info:
-        balance_str = f"{account_info.balance:,.2f}"
-        equity_str = f"{account_info.equity:,.2f}"
-        margin_str = f"{account_info.margin:,.2f}"
-        total_pnl_val = account_info.profit
-        total_pnl_str = f"{total_pnl_val:,.2f}"
-        pnl_color = "blue" if total_pnl_val >= 0 else "red"
-        pnl_label = "📈 Profit" if total_pnl_val >= 0 else "📉 Loss"
-    else:
-        balance_str = equity_str = margin_str = total_pnl_str = "N/A"
-        pnl_color = "gray"
-        pnl_label = "Account"
-
-    # -----------------------
-    # Single HTML block: checkbox + toolbar + toggle label + account bar
-    # (CSS-only toggle using hidden checkbox, very fast)
-    # -----------------------
-    st.markdown(
-        f"""
-        <style>
-        /* toolbar container */
-        #toolbar-toggle-checkbox {{ display: none; }}
-
-        .right-toolbar {{
-            position: fixed;
-            top: 70px;
-            right: 0;
-            width: 350px;
-            height: calc(100% - 70px);
-            background-color: #1e1e1e;
-            border-left: 2px solid #333;
-            display: flex;
-            flex-direction: column;
-            padding: 10px;
-            z-index: 999;
-            transition: width 0.20s ease, padding 0.20s ease;
-            box-sizing: border-box;
-        }}
-        /* collapsed state when checkbox checked */
-        #toolbar-toggle-checkbox:checked + .right-toolbar {{
-            width: 0;
-            padding: 0;
-            border-left: none;
-            overflow: hidden;
-        }}
-
-        .terminal-box {{
-            background-color: #111111;
-            padding: 8px;
-            border-radius: 6px;
-            font-family: monospace;
-            font-size: 13px;
-            color: #00ff00;
-            overflow-y: auto;
-            box-sizing: border-box;
-        }}
-        .execution-log {{ flex: 1; margin-bottom: 8px; }}
-        .check-log {{ flex: 1; }}
-
-        /* the visible toggle label */
-        .toolbar-toggle {{
-            position: fixed;
-            top: 50%;
-            right: 320px;
-            transform: translateY(-50%);
-            background-color: #333;
-            color: white;
-            padding: 6px 10px;
-            border-radius: 4px 0 0 4px;
-            cursor: pointer;
-            z-index: 1000;
-            font-size: 16px;
-            font-weight: bold;
-            display: inline-block;
-            user-select: none;
-        }}
-        /* default symbol « for hide */
-        .toolbar-toggle::after {{ content: '«'; }}
-
-        /* when checked (collapsed) change to » */
-        #toolbar-toggle-checkbox:checked + .right-toolbar + .toolbar-toggle::after {{ content: '»'; }}
-
-        /* account bar positioning adjusts based on checkbox */
-        #account-bar {{
-            position: fixed;
-            bottom: 0;
-            left: 0;
-            right: 320px;
-            background-color: #f9f9f9;
-            border-top: 2px solid #ddd;
-            padding: 10px 20px;
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            font-family: sans-serif;
-            z-index: 998;
-            transition: right 0.20s ease;
-            box-sizing: border-box;
-        }}
-        #toolbar-toggle-checkbox:checked ~ #account-bar {{
-            right: 0;
-        }}
-
-        /* small responsiveness for narrow screens */
-        @media (max-width: 900px) {{
-            .right-toolbar {{ width: 260px; }}
-            .toolbar-toggle {{ right: 260px; }}
-            #account-bar {{ right: 260px; }}
-            #toolbar-toggle-checkbox:checked + .right-toolbar + .toolbar-toggle::after {{ content: '»'; }}
-            #toolbar-toggle-checkbox:checked ~ #account-bar {{ right: 0; }}
-        }}
-        </style>
-
-        <!-- hidden checkbox controls state -->
-        <input id="toolbar-toggle-checkbox" type="checkbox">
-
-        <!-- the toolbar itself (immediately after checkbox for adjacent selector) -->
-        <div class="right-toolbar">
-            <div class="terminal-box execution-log">
-                <h4 style='margin:0; color:white;'>📜 Execution Log</h4>
-                <hr style='border:1px solid gray;'>
-                {logs_html}
-            </div>
-            <div class="terminal-box check-log">
-                <h4 style='margin:0; color:white;'>🔍 Auto-Trade Checks</h4>
-                <hr style='border:1px solid gray;'>
-                {checks_html}
-            </div>
-        </div>
-
-        <!-- label toggles the checkbox (sits after the toolbar so CSS selectors match) -->
-        <label class="toolbar-toggle" for="toolbar-toggle-checkbox"></label>
-
-        <!-- account bar (sibling of checkbox so CSS can move it) -->
-        <div id="account-bar">
-            <div style="display:flex; gap:18px; align-items:center;">
-                <div style="text-align:center;">
-                    <div style="font-size:14px;color:gray;">💰 Balance</div>
-                    <div style="font-size:18px;font-weight:bold;">{balance_str}</div>
-                </div>
-                <div style="text-align:center;">
-                    <div style="font-size:14px;color:gray;">📊 Equity</div>
-                    <div style="font-size:18px;font-weight:bold;">{equity_str}</div>
-                </div>
-                <div style="text-align:center;">
-                    <div style="font-size:14px;color:gray;">📉 Margin</div>
-                    <div style="font-size:18px;font-weight:bold;">{margin_str}</div>
-                </div>
-                <div style="text-align:center;">
-                    <div style="font-size:14px;color:gray;">{pnl_label}</div>
-                    <div style="font-size:18px;font-weight:bold;color:{pnl_color};">{total_pnl_str}</div>
-                </div>
-            </div>
-            <div style="font-size:13px;color:gray;white-space:nowrap;">
-                © Umer Farid ™ | All Rights Reserved
-            </div>
-        </div>
-        """,
-        unsafe_allow_html=True,
-    )
-
-    # -----------------------
-    # done
-    # -----------------------
-
-if __name__ == "__main__":
-    main()
+import os
+import time
+from types import SimpleNamespace
+
+import pandas as pd
+import streamlit as st
+from streamlit_autorefresh import st_autorefresh
+from datetime import datetime
+
+from mt5_init import initialize_mt5
+from broker import mt5
+from config import setup_page, sidebar_controls, top_controls, multi_timeframe_controls, strategy_controls
+from mt5_helpers import get_positions_df, analyze_symbol, analyze_symbols, positions_view
+from charts import chart_cache
+from bar_cache import bar_cache
+from positions import refresh_positions
+from symbol_catalog import catalog
+from order_pipeline import apply_order_results, pipeline
+from log_store import init_log_channels
+from ui import (display_symbol_tab, display_engine_symbol_tab, render_terminals, fragment, watchlist_table,
+                render_terminal_css, log_toolbar_html, account_bar_html, diagnostics_panel,
+                worker_health_table)
+from engine import read_state
+from instrumentation import metrics, serve_from_env
+from resample import multi_timeframe_levels
+from bar_store import timeframe_name
+from scheduler import StrategyScheduler
+from strategies.base import create
+
+# Set to the engine's snapshot path to run the dashboard as a read-only viewer
+ENGINE_STATE_PATH = os.environ.get("MT5_ENGINE_STATE")
+# Set to the coordinator's accounts.json for the consolidated multi-account view
+ACCOUNTS_STATE_PATH = os.environ.get("MT5_ACCOUNTS_STATE")
+# How often the log toolbar looks for new entries (seconds)
+LOG_REFRESH_SECONDS = 2
+
+
+def run_viewer(state_path):
+    """Render the headless engine's published state; never talks to the terminal."""
+    setup_page()
+    refresh_seconds, _, _, _ = sidebar_controls()
+    st_autorefresh(interval=refresh_seconds * 1000, key="auto_refresher")
+
+    snapshot = read_state(state_path)
+    if snapshot is None:
+        st.warning(f"Waiting for the trading engine to publish state at {state_path} ...")
+        return
+
+    age = time.time() - snapshot["updated"]
+    st.caption(
+        f"Viewer mode — engine pid {snapshot['pid']}, cycle {snapshot['cycle']} "
+        f"({snapshot['cycle_ms']:.0f} ms), updated {age:.1f}s ago"
+    )
+    ticks = snapshot.get("ticks")
+    if ticks:
+        p99 = ticks["signal_latency_p99_ms"]
+        st.caption(
+            f"Tick loop — {ticks['ticks_per_sec']:.1f} ticks/s, {ticks['signals']} signals, "
+            f"tick→signal p99 {p99:.1f} ms" if p99 is not None else
+            f"Tick loop — {ticks['ticks_per_sec']:.1f} ticks/s, {ticks['signals']} signals"
+        )
+    if age > 3 * snapshot.get("interval", 2) + 5:
+        st.warning("Engine state is stale — is the engine still running?")
+
+    df_pos_all = pd.DataFrame(snapshot["positions"])
+    symbols = list(snapshot["symbols"])
+    if symbols:
+        tabs = st.tabs(symbols)
+        for i, symbol in enumerate(symbols):
+            with tabs[i]:
+                display_engine_symbol_tab(symbol, snapshot["symbols"][symbol], df_pos_all, snapshot["timeframe"])
+
+    st.markdown("---")
+    st.subheader("All Open Positions (global)")
+    if df_pos_all.empty:
+        st.info("No open positions.")
+    else:
+        st.dataframe(positions_view(df_pos_all).style.format(precision=2), use_container_width=True)
+
+    if snapshot.get("metrics"):
+        with st.expander("Diagnostics (engine)", expanded=False):
+            diagnostics_panel(snapshot["metrics"])
+    if snapshot.get("strategies"):
+        with st.expander("Strategy CPU time (engine)", expanded=False):
+            st.dataframe(pd.DataFrame(snapshot["strategies"]), hide_index=True)
+
+    account = snapshot.get("account")
+    render_terminals(
+        snapshot["logs"].get("execution_logs"),
+        snapshot["logs"].get("autotrade_logs"),
+        SimpleNamespace(**account) if account else None,
+    )
+
+
+def run_accounts_viewer(state_path):
+    """Consolidated view of every account run by the coordinator (read-only)."""
+    setup_page()
+    refresh_seconds, _, _, _ = sidebar_controls()
+    st_autorefresh(interval=refresh_seconds * 1000, key="auto_refresher")
+
+    snapshot = read_state(state_path)
+    if snapshot is None:
+        st.warning(f"Waiting for the coordinator to publish state at {state_path} ...")
+        return
+
+    age = time.time() - snapshot["updated"]
+    st.caption(f"Accounts view — coordinator pid {snapshot['pid']}, "
+               f"{len(snapshot['workers'])} workers, updated {age:.1f}s ago")
+    if age > 3 * snapshot.get("interval", 2) + 5:
+        st.warning("Coordinator state is stale — is the coordinator still running?")
+
+    totals = snapshot["totals"]
+    cols = st.columns(5)
+    cols[0].metric("Accounts", f"{totals['accounts']}/{len(snapshot['workers'])}")
+    cols[1].metric("Balance", f"{totals['balance']:,.2f}")
+    cols[2].metric("Equity", f"{totals['equity']:,.2f}")
+    cols[3].metric("Floating P/L", f"{totals['profit']:,.2f}")
+    cols[4].metric("Open Positions", totals["positions"])
+
+    st.subheader("Workers")
+    worker_health_table(snapshot["workers"])
+
+    st.subheader("Accounts")
+    df_accounts = pd.DataFrame(snapshot["accounts"])
+    if not df_accounts.empty:
+        cols_of_interest = [c for c in ["account", "login", "server", "balance", "equity", "profit", "margin",
+                                        "margin_free", "margin_level"] if c in df_accounts.columns]
+        st.dataframe(df_accounts[cols_of_interest].style.format(precision=2), use_container_width=True,
+                     hide_index=True)
+
+    st.subheader("All Open Positions (all accounts)")
+    df_pos_all = pd.DataFrame(snapshot["positions"])
+    if df_pos_all.empty:
+        st.info("No open positions.")
+    else:
+        st.dataframe(positions_view(df_pos_all).style.format(precision=2), use_container_width=True)
+
+    render_terminals(
+        snapshot["logs"].get("execution_logs"),
+        snapshot["logs"].get("autotrade_logs"),
+        SimpleNamespace(**totals),
+    )
+
+
+# -----------------------
+# Live regions (fragments rerun on their own timers, not the whole page)
+# -----------------------
+def bar_times(rates_by_symbol):
+    return {s: int(r["time"][-1]) for s, r in rates_by_symbol.items() if r is not None and len(r)}
+
+
+def strategy_scheduler(selected_symbols, timeframe, num_candles, lot_size, default_tp_points, default_sl_points,
+                       strategy_names, budget_ms, level_timeframes=(), autotrade_timeframe=None):
+    """
+    The session's StrategyScheduler, kept across reruns (strategies keep their
+    state) and rebuilt only when the watchlist or the strategy setup changes.
+    """
+    config = (tuple(selected_symbols), timeframe, num_candles, tuple(strategy_names),
+              tuple(level_timeframes), autotrade_timeframe)
+    cached = st.session_state.get("scheduler")
+    if cached is not None and cached[0] == config:
+        scheduler = cached[1]
+    else:
+        levels_timeframe = autotrade_timeframe if autotrade_timeframe != timeframe_name(timeframe) else None
+        strategies = [create(name, levels_timeframe=levels_timeframe) if name == "level_cross" else create(name)
+                      for name in strategy_names]
+        scheduler = StrategyScheduler(
+            selected_symbols, strategies, timeframe, num_candles,
+            symbol_filter=lambda s: st.session_state.autotrade.get(s, False),
+            level_timeframes=level_timeframes,
+        )
+        st.session_state["scheduler"] = (config, scheduler)
+    # Trade settings apply from the next pass without losing strategy state
+    scheduler.lot_size = lot_size
+    scheduler.default_sl_points = default_sl_points
+    scheduler.default_tp_points = default_tp_points
+    scheduler.budget_ms = float(budget_ms)
+    return scheduler
+
+
+def live_trading(scheduler):
+    """
+    One scheduler pass over the watchlist (auto-trade checks, trailing
+    stops, one SL/TP flush). Asks for a full rerun (charts, level tables)
+    only when a new bar has opened.
+    """
+    # Log lines of orders the pipeline finished since the last refresh
+    apply_order_results(st.session_state)
+    ctx = scheduler.run_pass()
+    rates_by_symbol = ctx.rates_by_symbol
+
+    st.caption(f"Auto-trade checked at {datetime.now().strftime('%H:%M:%S')}")
+    if bar_times(rates_by_symbol) != st.session_state.get("shown_bars"):
+        st.rerun(scope="app")
+
+
+def live_positions():
+    """Global positions table and the account bar."""
+    with metrics.span("positions_table"):
+        df_pos_all = get_positions_df()
+        st.subheader("All Open Positions (global)")
+        if df_pos_all.empty:
+            st.info("No open positions.")
+        else:
+            st.dataframe(positions_view(df_pos_all).style.format(precision=2), use_container_width=True)
+        st.markdown(account_bar_html(mt5.account_info()), unsafe_allow_html=True)
+
+
+def live_logs():
+    """Logs toolbar; the HTML is only rebuilt when a channel got new entries."""
+    execution_logs = st.session_state.execution_logs
+    autotrade_logs = st.session_state.autotrade_logs
+    version = (execution_logs.total, autotrade_logs.total)
+    cached = st.session_state.get("toolbar_html")
+    if cached is None or cached[0] != version:
+        with metrics.span("log_html"):
+            cached = st.session_state["toolbar_html"] = (version, log_toolbar_html(execution_logs, autotrade_logs))
+    st.markdown(cached[1], unsafe_allow_html=True)
+
+
+def live_diagnostics():
+    """Latency histograms and counters from the instrumentation."""
+    with st.expander("Diagnostics", expanded=False):
+        diagnostics_panel(metrics.snapshot())
+
+
+def main():
+    if ACCOUNTS_STATE_PATH:
+        return run_accounts_viewer(ACCOUNTS_STATE_PATH)
+    if ENGINE_STATE_PATH:
+        return run_viewer(ENGINE_STATE_PATH)
+
+    # -----------------------
+    # MT5 init and page setup
+    # -----------------------
+    started = time.perf_counter()
+    initialize_mt5()
+    setup_page()
+    serve_from_env()
+
+    catalog.start_refresher()
+    all_symbols = catalog.names()
+    if not all_symbols:
+        st.error("⚠️ No symbols returned from MT5. Check the terminal and Market Watch.")
+        st.stop()
+
+    # -----------------------
+    # Sidebar controls
+    # -----------------------
+    refresh_seconds, lot_size, default_sl_points, default_tp_points = sidebar_controls()
+    strategy_names, budget_ms = strategy_controls()
+    lazy_tabs = st.sidebar.checkbox("Render only the active symbol", value=True,
+                                    help="Other symbols keep trading; their chart and tables are built when selected.")
+    metrics.set_enabled(st.sidebar.checkbox("Instrumentation", value=metrics.enabled,
+                                            help="Time broker calls and refresh stages (Diagnostics panel, /metrics)."))
+    # One positions_get per refresh; counter, tables and trailers read this snapshot
+    refresh_positions()
+    timeframe, timeframe_choice, num_candles, selected_symbols = top_controls(all_symbols)
+    level_timeframes, autotrade_timeframe = multi_timeframe_controls(timeframe_choice)
+
+    # -----------------------
+    # Session state initialization
+    # -----------------------
+
+    if "last_trade" not in st.session_state:
+        st.session_state.last_trade = {}
+    if "autotrade" not in st.session_state:
+        st.session_state.autotrade = {}
+    # Bounded log channels (restored from the on-disk log on first run)
+    init_log_channels(st.session_state)
+
+    for s in selected_symbols:
+        st.session_state.last_trade.setdefault(s, None)
+        st.session_state.autotrade.setdefault(s, True)
+
+    # -----------------------
+    # Symbol tabs (full runs only: start, user input, new bar)
+    # -----------------------
+    if not selected_symbols:
+        st.info("Select symbols above to create tabs for each symbol.")
+        st.session_state["shown_bars"] = {}
+    else:
+        # Levels for the whole watchlist in one vectorized pass
+        with metrics.span("analyze"):
+            levels_by_symbol, rates_by_symbol = analyze_symbols(selected_symbols, timeframe, num_candles)
+            mtf_levels = multi_timeframe_levels(selected_symbols, level_timeframes, num_candles) if level_timeframes else {}
+        st.session_state["shown_bars"] = bar_times(rates_by_symbol)
+
+        def show(symbol):
+            levels = levels_by_symbol.get(symbol)
+            rates = rates_by_symbol.get(symbol)
+            if levels is None:
+                st.warning("No candle data for this symbol (open in Market Watch & try again).")
+                return
+
+            # Display chart, calculation table, positions, and trade controls
+            with metrics.span("symbol_view", symbol=symbol):
+                display_symbol_tab(
+                    symbol, levels, rates, timeframe_choice,
+                    lot_size, default_tp_points, default_sl_points,
+                    refresh_seconds=refresh_seconds,
+                    chart_source=lambda: analyze_symbol(symbol, timeframe, num_candles, as_frame=False),
+                    mtf_levels=mtf_levels.get(symbol)
+                )
+
+        if lazy_tabs:
+            # Only the symbol being looked at gets its chart and tables; the
+            # rest are one summary row each, built into a full view when picked
+            active = st.radio("Symbol", selected_symbols, horizontal=True, key="active_symbol")
+            if len(selected_symbols) > 1:
+                watchlist_table(selected_symbols, levels_by_symbol, rates_by_symbol)
+            show(active)
+        else:
+            tabs = st.tabs(selected_symbols)
+            for i, symbol in enumerate(selected_symbols):
+                with tabs[i]:
+                    show(symbol)
+
+    # -----------------------
+    # Auto-trade logic (every refresh interval)
+    # -----------------------
+    scheduler = strategy_scheduler(
+        selected_symbols, timeframe, num_candles, lot_size, default_tp_points, default_sl_points,
+        strategy_names, budget_ms, level_timeframes, autotrade_timeframe
+    )
+    fragment(run_every=refresh_seconds)(live_trading)(scheduler)
+
+    # -----------------------
+    # Shared bar cache stats
+    # -----------------------
+    with st.sidebar.expander("Bar cache"):
+        st.json(bar_cache.stats())
+    with st.sidebar.expander("Symbol catalog"):
+        st.json(catalog.stats())
+    with st.sidebar.expander("Order pipeline"):
+        st.json(pipeline.stats())
+    with st.sidebar.expander("Charts"):
+        st.json(chart_cache.stats())
+    with st.sidebar.expander("Strategy CPU time"):
+        st.dataframe(pd.DataFrame(scheduler.stats()), hide_index=True)
+
+    # -----------------------
+    # Global positions + account bar
+    # -----------------------
+    st.markdown("---")
+    fragment(run_every=refresh_seconds)(live_positions)()
+
+    # -----------------------
+    # Logs toolbar (CSS once, entries refreshed when they change)
+    # -----------------------
+    render_terminal_css()
+    fragment(run_every=LOG_REFRESH_SECONDS)(live_logs)()
+
+    # -----------------------
+    # Diagnostics (instrumentation)
+    # -----------------------
+    fragment(run_every=refresh_seconds)(live_diagnostics)()
+    metrics.observe("stage_seconds", time.perf_counter() - started, {"stage": "full_run"})
+
+    # -----------------------
+    # done
+    # -----------------------
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+"""
+Parallel parameter sweep over the strategy constants.
+
+Runs ``backtest.run_backtest`` for every combination of a grid (or for
+random samples of a search space) on several symbols, spread over a process
+pool:
+
+- bars are loaded once and placed in shared memory; workers map them as
+  NumPy views instead of unpickling a copy per task;
+- tasks are ordered so that runs sharing the same levels (window, idm_ratio,
+  factor) land next to each other, and each worker keeps the last few
+  rolling_levels results;
+- every finished run is appended to a JSONL file as it arrives, and a new
+  run with the same file skips what is already in it, so an interrupted
+  sweep resumes where it stopped;
+- the table ranked by the chosen metrics is printed as results come in.
+
+    python sweep.py --symbols EURUSDm BTCUSDm --bars 100000 \
+        --param factor=1.2,1.4,1.6 --param idm_ratio=0.6,0.7,0.8 --param trailer=candle,atr \
+        --rank net_profit,-max_drawdown --out sweep.jsonl
+    python sweep.py --symbols EURUSDm --random 2000 --param factor=1.0:2.0 --param atr_mult=1.0:4.0
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from bar_store import BarStore
+from broker import mt5
+from levels import IDM_RATIO, FACTOR, rolling_levels
+from autotrade import TP_RATIO
+from backtest import TRADES_DTYPE, BacktestResult, load_history, run_backtest, symbol_costs
+from strategies.candle_trailer import CandleTrailingStop
+from strategies.atr_trailer import ATRTrailingStop
+
+
+# Sweepable settings and their live values
+DEFAULTS = {
+    "window": 200,
+    "idm_ratio": IDM_RATIO,
+    "factor": FACTOR,
+    "tp_ratio": TP_RATIO,
+    "trailer": "candle",
+    "profit_trigger_pips": 20,
+    "lookback_candles": 3,
+    "atr_period": 14,
+    "atr_mult": 2.0,
+    "atr_method": "simple",
+    "step_pips": 5,
+}
+LEVEL_PARAMS = ("window", "idm_ratio", "factor")
+DEFAULT_RANK = ("net_profit", "-max_drawdown")
+LEVELS_CACHE_SIZE = 4
+
+
+# -----------------------
+# Search space
+# -----------------------
+def parse_param(text):
+    """'name=a,b,c' -> (name, [a, b, c]); 'name=lo:hi' -> (name, (lo, hi)) for random search."""
+    name, _, values = text.partition("=")
+    name = name.strip()
+    if name not in DEFAULTS:
+        raise ValueError(f"Unknown parameter: {name!r} (expected one of {', '.join(DEFAULTS)})")
+    kind = type(DEFAULTS[name])
+    if ":" in values:
+        lo, hi = values.split(":", 1)
+        return name, (kind(lo), kind(hi))
+    return name, [kind(v) for v in values.split(",") if v.strip()]
+
+
+def grid(space):
+    """Every combination of the listed values, levels settings varying slowest."""
+    names = sorted(space, key=lambda n: (n not in LEVEL_PARAMS, n))
+    for values in itertools.product(*(space[n] for n in names)):
+        yield dict(zip(names, values))
+
+
+def random_search(space, count, seed=0):
+    """`count` random combinations: lists are sampled, (lo, hi) ranges drawn uniformly."""
+    rng = random.Random(seed)
+    for _ in range(count):
+        params = {}
+        for name, values in space.items():
+            if isinstance(values, tuple):
+                lo, hi = values
+                params[name] = rng.randint(lo, hi) if isinstance(lo, int) else round(rng.uniform(lo, hi), 4)
+            else:
+                params[name] = rng.choice(values)
+        yield params
+
+
+def task_key(symbol, params):
+    return json.dumps({"symbol": symbol, "params": params}, sort_keys=True)
+
+
+# -----------------------
+# Shared bars
+# -----------------------
+class SharedBars:
+    """Rates arrays copied once into shared memory, described by picklable specs."""
+
+    def __init__(self, rates_by_symbol):
+        self.blocks = []
+        self.specs = {}
+        for symbol, rates in rates_by_symbol.items():
+            block = shared_memory.SharedMemory(create=True, size=max(rates.nbytes, 1))
+            np.ndarray(rates.shape, dtype=rates.dtype, buffer=block.buf)[:] = rates
+            self.blocks.append(block)
+            self.specs[symbol] = (block.name, rates.dtype.descr, len(rates))
+
+    def close(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+
+_bars = {}
+_blocks = []
+_levels_cache = OrderedDict()
+
+
+def _attach(specs):
+    """Pool initializer: map every symbol's bars from shared memory (no copy)."""
+    for symbol, (name, descr, length) in specs.items():
+        try:
+            block = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:  # Python < 3.13: the owner process does the cleanup
+            block = shared_memory.SharedMemory(name=name)
+        _blocks.append(block)
+        _bars[symbol] = np.ndarray((length,), dtype=np.dtype(descr), buffer=block.buf)
+
+
+def _levels_for(symbol, rates, params):
+    key = (symbol,) + tuple(params[n] for n in LEVEL_PARAMS)
+    levels = _levels_cache.get(key)
+    if levels is None:
+        levels = rolling_levels(rates, params["window"], params["idm_ratio"], params["factor"])
+        _levels_cache[key] = levels
+        if len(_levels_cache) > LEVELS_CACHE_SIZE:
+            _levels_cache.popitem(last=False)
+    else:
+        _levels_cache.move_to_end(key)
+    return levels
+
+
+def _trailer(symbol, params):
+    if params["trailer"] == "candle":
+        return CandleTrailingStop(symbol, profit_trigger_pips=params["profit_trigger_pips"],
+                                  lookback_candles=params["lookback_candles"])
+    if params["trailer"] == "atr":
+        return ATRTrailingStop(symbol, atr_period=params["atr_period"], atr_mult=params["atr_mult"],
+                               profit_trigger_pips=params["profit_trigger_pips"], step_pips=params["step_pips"],
+                               atr_method=params["atr_method"])
+    return None
+
+
+def run_one(symbol, params, options):
+    """Worker: one backtest on the shared bars; returns the JSONL record."""
+    full = dict(DEFAULTS, **params)
+    rates = _bars[symbol]
+    started = time.process_time()
+    result = run_backtest(
+        rates, options["strategy"], full["window"], lot=options["lot"], spread_points=options["spread_points"],
+        trailer=_trailer(symbol, full), idm_ratio=full["idm_ratio"], factor=full["factor"],
+        tp_ratio=full["tp_ratio"], levels=_levels_for(symbol, rates, full), **options["costs"][symbol],
+    )
+    record = {"key": task_key(symbol, params), "symbol": symbol, "params": params}
+    record.update(result.stats())
+    record["cpu_ms"] = round((time.process_time() - started) * 1000.0, 1)
+    record["pid"] = os.getpid()
+    return record
+
+
+# -----------------------
+# Results
+# -----------------------
+def load_results(path):
+    """Records already in the results file (a cut-off last line is ignored)."""
+    records = []
+    if not os.path.exists(path):
+        return records
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+
+def _end_line(path):
+    """Terminate a last line cut off by an interrupted run, so appends start on a fresh line."""
+    if not os.path.exists(path) or not os.path.getsize(path):
+        return
+    with open(path, "rb+") as fh:
+        fh.seek(-1, os.SEEK_END)
+        if fh.read(1) != b"\n":
+            fh.write(b"\n")
+
+
+def rank(records, metrics=DEFAULT_RANK, top=None):
+    """DataFrame of results sorted by `metrics` ('-name' ranks lower values first)."""
+    if not records:
+        return pd.DataFrame()
+    df = pd.json_normalize(records).drop(columns=["key", "pid"], errors="ignore")
+    df.columns = [c.replace("params.", "") for c in df.columns]
+    names = [m.lstrip("-") for m in metrics]
+    df = df.sort_values(names, ascending=[m.startswith("-") for m in metrics], na_position="last")
+    return df.head(top) if top else df
+
+
+def rank_columns(params=()):
+    """Names `rank` can sort on: the backtest statistics, symbol, cpu_ms and the swept `params`."""
+    empty = BacktestResult(np.zeros(0, dtype=TRADES_DTYPE), np.zeros(0), np.zeros(0), 0.0, 0, 0.0)
+    return set(empty.stats()) | {"symbol", "cpu_ms"} | set(params)
+
+
+def run_sweep(symbols, combinations, out_path, bars=100000, timeframe=None, strategy="cross",
+              workers=None, lot=0.01, spread_points=None, metrics=DEFAULT_RANK, top=10,
+              report_every=50, rates_by_symbol=None, costs=None, store=None):
+    """
+    Backtest every (symbol, params) not yet in `out_path` on a process pool.
+    Bars come from `rates_by_symbol` (+ `costs`) if given, else from the
+    BarStore `store`, else from the terminal.
+    Returns the ranked DataFrame of all results, old and new.
+    """
+    done = {r["key"] for r in load_results(out_path)}
+    tasks = [(s, p) for p in combinations for s in symbols if task_key(s, p) not in done]
+    # Runs sharing levels next to each other (each worker caches the latest ones)
+    tasks.sort(key=lambda t: (t[0],) + tuple(str(dict(DEFAULTS, **t[1])[n]) for n in LEVEL_PARAMS))
+    print(f"{len(tasks)} runs to go ({len(done)} already in {out_path})", flush=True)
+
+    if rates_by_symbol is None and store is not None:
+        timeframe = timeframe or mt5.TIMEFRAME_M1
+        rates_by_symbol = {s: load_history(s, timeframe, bars, store=store) for s in symbols}
+        costs = {s: symbol_costs(s, store=store) for s in symbols}
+    elif rates_by_symbol is None:
+        if not mt5.initialize():
+            raise SystemExit("MT5 initialization failed. Make sure the terminal is running and logged in.")
+        try:
+            rates_by_symbol = {s: load_history(s, timeframe or mt5.TIMEFRAME_M1, bars) for s in symbols}
+            costs = {s: symbol_costs(s) for s in symbols}
+        finally:
+            mt5.shutdown()
+    missing = [s for s in symbols if rates_by_symbol.get(s) is None or not len(rates_by_symbol[s])]
+    if missing:
+        raise SystemExit(f"No history for {', '.join(missing)}")
+
+    if tasks:
+        options = {"strategy": strategy, "lot": lot, "spread_points": spread_points, "costs": costs}
+        _end_line(out_path)
+        shared = SharedBars({s: rates_by_symbol[s] for s in symbols})
+        started = time.monotonic()
+        finished = 0
+        new = []
+        try:
+            with ProcessPoolExecutor(workers or os.cpu_count(), initializer=_attach,
+                                     initargs=(shared.specs,)) as pool, \
+                    open(out_path, "a", encoding="utf-8") as out:
+                futures = [pool.submit(run_one, s, p, options) for s, p in tasks]
+                for future in as_completed(futures):
+                    record = future.result()
+                    out.write(json.dumps(record) + "\n")
+                    out.flush()
+                    new.append(record)
+                    finished += 1
+                    if finished % report_every == 0 or finished == len(tasks):
+                        rate = finished / max(time.monotonic() - started, 1e-9)
+                        print(f"\n[{finished}/{len(tasks)}] {rate:.1f} runs/s", flush=True)
+                        print(rank(new, metrics, top).to_string(index=False), flush=True)
+        finally:
+            shared.close()
+    return rank(load_results(out_path), metrics)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parallel parameter sweep of the level strategy")
+    parser.add_argument("--symbols", nargs="+", required=True)
+    parser.add_argument("--timeframe", default="M1", choices=["M1", "M5", "M15", "H1", "H4", "D1"])
+    parser.add_argument("--bars", type=int, default=100000)
+    parser.add_argument("--strategy", default="cross", choices=["cross", "simple"])
+    parser.add_argument("--param", action="append", default=[],
+                        help="name=v1,v2,... (grid values) or name=lo:hi (random range); repeatable")
+    parser.add_argument("--random", type=int, default=0, help="random combinations instead of the full grid")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--lot", type=float, default=0.01)
+    parser.add_argument("--spread-points", type=float, default=None)
+    parser.add_argument("--rank", default=",".join(DEFAULT_RANK), help="metrics, '-name' for lower is better")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--out", default="sweep.jsonl")
+    parser.add_argument("--store", help="read bars from this bar store directory instead of the terminal")
+    args = parser.parse_args(argv)
+
+    space = dict(parse_param(p) for p in args.param)
+    if args.random:
+        combinations = list(random_search(space, args.random, args.seed))
+    else:
+        ranges = [n for n, v in space.items() if isinstance(v, tuple)]
+        if ranges:
+            raise SystemExit(f"Ranges need --random: {', '.join(ranges)}")
+        combinations = list(grid(space))
+
+    metrics = [m.strip() for m in args.rank.split(",") if m.strip()]
+    known = rank_columns(space)
+    unknown = [m for m in metrics if m.lstrip("-") not in known]
+    if unknown:
+        parser.error(f"unknown --rank metric(s): {', '.join(unknown)} (choose from {', '.join(sorted(known))})")
+    table = run_sweep(args.symbols, combinations, args.out, args.bars, getattr(mt5, f"TIMEFRAME_{args.timeframe}"),
+                      args.strategy, args.workers, args.lot, args.spread_points, metrics, args.top,
+                      store=BarStore(args.store) if args.store else None)
+    print("\nBest overall:")
+    print(table.head(args.top).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Process-wide symbol metadata catalog.
+
+Point, digits, stop/freeze levels and the other contract details hardly
+ever change, yet they were re-read with ``mt5.symbol_info`` several times
+per symbol per refresh. The catalog loads each symbol's SymbolInfo once and
+serves it from memory; a background thread reloads everything on a slow
+cadence (and records which symbols actually changed), and ``invalidate``
+forces a reload after an event such as a trade being rejected.
+
+Tick value moves with the quote currency, so it has its own short TTL.
+The symbol name list from ``symbols_get`` is cached the same way as the
+static metadata.
+"""
+import logging
+import threading
+import time
+
+from broker import mt5
+
+
+STATIC_TTL = 300.0     # seconds: point, digits, stops level, ...
+VOLATILE_TTL = 5.0     # seconds: trade_tick_value
+REFRESH_INTERVAL = 60.0
+
+# Fields compared to decide whether a reload actually changed a symbol
+STATIC_FIELDS = ("point", "digits", "trade_stops_level", "trade_freeze_level", "trade_contract_size",
+                 "volume_min", "volume_max", "volume_step", "trade_mode")
+
+log = logging.getLogger("symbol_catalog")
+
+
+def _static_key(info):
+    return tuple(getattr(info, f, None) for f in STATIC_FIELDS)
+
+
+class _Entry:
+    __slots__ = ("info", "loaded_at", "volatile_at")
+
+    def __init__(self, info, now):
+        self.info = info
+        self.loaded_at = now
+        self.volatile_at = now
+
+
+class SymbolCatalog:
+    """symbol -> SymbolInfo, loaded once and refreshed in the background."""
+
+    def __init__(self, static_ttl=STATIC_TTL, volatile_ttl=VOLATILE_TTL, clock=None):
+        self.static_ttl = float(static_ttl)
+        self.volatile_ttl = float(volatile_ttl)
+        self.clock = clock or time.monotonic
+        self._entries = {}
+        self._names = None
+        self._names_at = 0.0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.hits = 0
+        self.loads = 0
+        self.volatile_refreshes = 0
+        self.changes = 0
+        self.errors = 0
+
+    # -----------------------
+    # Internals
+    # -----------------------
+    def _load(self, symbol):
+        info = mt5.symbol_info(symbol)
+        now = self.clock()
+        with self._lock:
+            self.loads += 1
+            old = self._entries.get(symbol)
+            if info is None:
+                self._entries.pop(symbol, None)
+                return None
+            if old is not None and _static_key(old.info) != _static_key(info):
+                self.changes += 1
+            self._entries[symbol] = _Entry(info, now)
+        return info
+
+    # -----------------------
+    # Lookups
+    # -----------------------
+    def info(self, symbol):
+        """Cached SymbolInfo (None if the symbol doesn't exist)."""
+        entry = self._entries.get(symbol)
+        if entry is None or self.clock() - entry.loaded_at > self.static_ttl:
+            return self._load(symbol)
+        self.hits += 1
+        return entry.info
+
+    def tick_value(self, symbol):
+        """trade_tick_value, re-read once it is older than volatile_ttl."""
+        entry = self._entries.get(symbol)
+        now = self.clock()
+        if entry is None or now - entry.loaded_at > self.static_ttl:
+            info = self._load(symbol)
+        elif now - entry.volatile_at > self.volatile_ttl:
+            self.volatile_refreshes += 1
+            info = mt5.symbol_info(symbol)
+            if info is not None:
+                with self._lock:
+                    entry.info = info
+                    entry.volatile_at = now
+        else:
+            self.hits += 1
+            info = entry.info
+        return getattr(info, "trade_tick_value", None) if info is not None else None
+
+    def point(self, symbol):
+        info = self.info(symbol)
+        return info.point if info is not None else None
+
+    def names(self):
+        """Names of every symbol the terminal offers (cached like the static metadata)."""
+        if self._names is None or self.clock() - self._names_at > self.static_ttl:
+            symbols = mt5.symbols_get()
+            self._names = [s.name for s in symbols] if symbols else []
+            self._names_at = self.clock()
+        return self._names
+
+    # -----------------------
+    # Refresh / invalidation
+    # -----------------------
+    def invalidate(self, symbol=None):
+        """Forget one symbol (or everything); the next lookup reloads it."""
+        with self._lock:
+            if symbol is None:
+                self._entries.clear()
+                self._names = None
+            else:
+                self._entries.pop(symbol, None)
+
+    def refresh(self):
+        """Reload every known symbol and the name list now."""
+        for symbol in list(self._entries):
+            self._load(symbol)
+        self._names = None
+        self.names()
+
+    def start_refresher(self, interval=REFRESH_INTERVAL):
+        """Reload the catalog every `interval` seconds on a daemon thread (idempotent)."""
+        if self._thread is not None and self._thread.is_alive():
+            return self._thread
+
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.refresh()
+                except Exception:
+                    # Keep serving the last values, but say so
+                    self.errors += 1
+                    log.exception("symbol catalog refresh failed")
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=loop, name="symbol-catalog", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop_refresher(self):
+        self._stop.set()
+
+    def stats(self):
+        return {
+            "symbols": len(self._entries),
+            "names": len(self._names) if self._names is not None else 0,
+            "hits": self.hits,
+            "loads": self.loads,
+            "volatile_refreshes": self.volatile_refreshes,
+            "changes": self.changes,
+            "errors": self.errors,
+        }
+
+
+catalog = SymbolCatalog()
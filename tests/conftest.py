@@ -0,0 +1,45 @@
+"""
+Test setup: everything runs against the simulated terminal.
+
+The backend, log dir and bar store are read at import time, so they are set
+here before any project module is imported.
+"""
+import os
+import sys
+
+os.environ["MT5_BACKEND"] = "sim"
+os.environ["MT5_LOG_DIR"] = ""
+os.environ["MT5_BAR_STORE"] = ""
+os.environ["MT5_METRICS_PORT"] = ""
+os.environ.setdefault("MT5_SIM_SYMBOLS", "20")
+os.environ.setdefault("MT5_SIM_POSITIONS", "50")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+
+RATES_DTYPE = np.dtype([
+    ("time", "<i8"), ("open", "<f8"), ("high", "<f8"), ("low", "<f8"), ("close", "<f8"),
+    ("tick_volume", "<u8"), ("spread", "<i4"), ("real_volume", "<u8"),
+])
+
+
+def make_rates(n, seed=0, start=1_600_000_000, step=60, digits=4):
+    """Random-walk M1 bars; prices are rounded so equal highs/lows (ties) do occur."""
+    rng = np.random.default_rng(seed)
+    rates = np.zeros(n, dtype=RATES_DTYPE)
+    rates["time"] = start + step * np.arange(n)
+    close = np.round(1.1 + np.cumsum(rng.normal(0, 0.0003, n)), digits)
+    open_ = np.concatenate([[1.1], close[:-1]])
+    wick = np.round(np.abs(rng.normal(0, 0.0002, (2, n))), digits)
+    rates["open"], rates["close"] = open_, close
+    rates["high"] = np.maximum(open_, close) + wick[0]
+    rates["low"] = np.minimum(open_, close) - wick[1]
+    rates["spread"] = 10
+    return rates
+
+
+@pytest.fixture
+def rates():
+    return make_rates(600, seed=1)
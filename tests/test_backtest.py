@@ -0,0 +1,104 @@
+"""The backtester's vectorized exit scans against the per-step _exit_fill and the scalar trailing rules."""
+import numpy as np
+import pytest
+
+from backtest import _exit_fill, _first_exit, _steps, _trailing_inputs, run_backtest
+from conftest import make_rates
+from sltp_engine import DEFAULT_MIN_STEP_POINTS
+from strategies.atr_trailer import ATRTrailingStop, atr_trail_sl
+from strategies.candle_trailer import CandleTrailingStop, candle_trail_sl
+
+POINT = 1e-5
+
+
+def first_fill(start, direction, sl, tp, opens, highs, lows, spreads):
+    for i in range(start, len(highs)):
+        fill = _exit_fill(direction, sl, tp, opens[i], highs[i], lows[i], spreads[i])
+        if fill is not None:
+            return i, fill
+    return None, None
+
+
+@pytest.mark.parametrize("direction", [1, -1])
+def test_first_exit_agrees_with_exit_fill(direction):
+    rates = make_rates(3000, seed=7)
+    _, opens, highs, lows, closes, spreads, _ = _steps(rates, None, POINT, None)
+    rng = np.random.default_rng(direction + 2)
+    for _ in range(300):
+        start = int(rng.integers(1, len(rates)))
+        price = closes[start - 1]
+        sl = price - direction * rng.uniform(0.0005, 0.02) if rng.random() < 0.8 else 0.0
+        tp = price + direction * rng.uniform(0.0005, 0.02) if rng.random() < 0.8 else 0.0
+        step = _first_exit(start, direction, sl, tp, highs, lows, spreads)
+        expected, fill = first_fill(start, direction, sl, tp, opens, highs, lows, spreads)
+        assert step == expected
+        if step is not None:
+            assert fill[1] in ("sl", "tp")
+
+
+def test_exit_fill_prefers_gaps_and_sl():
+    # BUY: gap above TP fills at the open; both inside one bar: SL first
+    assert _exit_fill(1, 1.0, 1.2, 1.25, 1.3, 1.24, 0.0) == (1.25, "tp")
+    assert _exit_fill(1, 1.0, 1.2, 1.1, 1.3, 0.9, 0.0) == (1.0, "sl")
+    assert _exit_fill(1, 1.0, 1.2, 0.95, 1.0, 0.9, 0.0) == (0.95, "sl")
+    # SELL closes on the ask
+    assert _exit_fill(-1, 1.2, 1.0, 1.1, 1.15, 0.95, 0.01) == (1.0, "tp")
+    assert _exit_fill(-1, 1.2, 1.0, 1.1, 1.195, 1.05, 0.01) == (1.2, "sl")
+    assert _exit_fill(1, 0.0, 0.0, 1.0, 2.0, 0.0, 0.0) is None
+
+
+def reference_trailing_exit(trailer, entry_step, direction, entry, sl, tp, steps, trail):
+    """The per-step loop: exit check with the current SL, then the trailing rule at the close."""
+    _, opens, highs, lows, closes, spreads, _ = steps
+    buy = direction > 0
+    min_step = DEFAULT_MIN_STEP_POINTS * POINT
+    for i in range(entry_step + 1, len(closes)):
+        fill = _exit_fill(direction, sl, tp, opens[i], highs[i], lows[i], spreads[i])
+        if fill is not None:
+            return i, fill, sl
+        if np.isnan(trail[0][i]):
+            continue
+        price = closes[i] if buy else closes[i] + spreads[i]
+        if isinstance(trailer, CandleTrailingStop):
+            proposals = candle_trail_sl(buy, entry, sl, price, POINT, trailer.profit_trigger_pips,
+                                        trail[0][i], trail[1][i])
+            new_sl = proposals[-1][1] if proposals else None
+        else:
+            new_sl = atr_trail_sl(buy, entry, sl, price, POINT, trail[0][i], trailer.profit_trigger_pips,
+                                  trailer.step_pips)
+        if new_sl is not None and abs(new_sl - sl) >= min_step:
+            sl = new_sl
+    return None, None, sl
+
+
+@pytest.mark.parametrize("strategy", ["cross", "simple"])
+@pytest.mark.parametrize("trailer", [
+    CandleTrailingStop("X", profit_trigger_pips=5, lookback_candles=3),
+    ATRTrailingStop("X", profit_trigger_pips=5, step_pips=1),
+], ids=["candle", "atr"])
+def test_trailing_exits_match_per_step_rules(strategy, trailer):
+    rates = make_rates(10000, seed=11, digits=5)
+    result = run_backtest(rates, strategy, 100, point=POINT, trailer=trailer, sl_points=300)
+    steps = _steps(rates, None, POINT, None)
+    trail = _trailing_inputs(trailer, rates, steps[6])
+    trades = result.trades[result.trades["reason"] != "end"]
+    assert len(trades) > 20
+    moved = 0
+    for trade in trades:
+        entry_step = int(np.searchsorted(steps[0], trade["entry_time"]))
+        direction = int(trade["side"])
+        initial_sl = trade["entry"] - direction * 300 * POINT
+        step, fill, sl = reference_trailing_exit(trailer, entry_step, direction, trade["entry"],
+                                                 initial_sl, trade["tp"], steps, trail)
+        assert steps[0][step] == trade["exit_time"]
+        assert (fill[0], fill[1], sl) == (trade["exit"], trade["reason"], trade["sl"])
+        moved += sl != initial_sl
+    assert moved
+
+
+def test_unreachable_trigger_trails_nothing(rates):
+    plain = run_backtest(rates, "simple", 50, point=POINT, sl_points=300)
+    trailed = run_backtest(rates, "simple", 50, point=POINT, sl_points=300,
+                           trailer=CandleTrailingStop("X", profit_trigger_pips=10 ** 9))
+    assert np.array_equal(plain.trades, trailed.trades)
+    assert np.array_equal(plain.equity, trailed.equity)
@@ -0,0 +1,32 @@
+"""RingBuffer bulk appends against record-by-record appends."""
+import numpy as np
+import pytest
+
+from bar_cache import RingBuffer
+from conftest import make_rates
+
+
+@pytest.mark.parametrize("capacity", [1, 7, 64])
+def test_extend_matches_append(capacity):
+    rates = make_rates(500, seed=capacity)
+    rng = np.random.default_rng(capacity)
+    bulk, single = RingBuffer(capacity, rates.dtype), RingBuffer(capacity, rates.dtype)
+    pos = 0
+    while pos < len(rates):
+        chunk = rates[pos:pos + int(rng.integers(0, 3 * capacity + 2))]
+        pos += max(len(chunk), 1)
+        bulk.extend(chunk)
+        for record in chunk[-capacity:]:
+            single.append(record)
+        assert (bulk.head, bulk.size) == (single.head, single.size)
+        assert np.array_equal(bulk.tail(capacity), single.tail(capacity))
+
+
+def test_extend_keeps_the_newest_records():
+    rates = make_rates(250, seed=3)
+    ring = RingBuffer(100, rates.dtype)
+    ring.extend(rates[:30])
+    ring.extend(rates[30:])
+    assert ring.size == 100
+    assert np.array_equal(ring.tail(100), rates[-100:])
+    assert ring.last() == rates[-1]
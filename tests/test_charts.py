@@ -0,0 +1,35 @@
+"""ChartCache: builds once per closed bar, patches in between, sends nothing from update."""
+import plotly.io as pio
+
+from charts import ChartCache
+from conftest import make_rates
+
+LEVELS = {"Buy1": 1.09, "Resistance1": 1.12, "Sell1": 1.11}
+
+
+def test_update_reports_builds_and_patches_only():
+    cache = ChartCache()
+    rates = make_rates(300, seed=3)
+    assert cache.update("X", rates, LEVELS, 1.1, "M1")
+    assert not cache.update("X", rates, LEVELS, 1.1, "M1")
+    forming = rates.copy()
+    forming["close"][-1] += 0.001
+    assert cache.update("X", forming, LEVELS, 1.1, "M1")
+    assert cache.update("X", forming, dict(LEVELS, Buy1=1.08), 1.1, "M1")
+    assert cache.update("X", make_rates(301, seed=3), LEVELS, 1.1, "M1")
+    assert (cache.builds, cache.patches, cache.reuses, cache.emits) == (2, 2, 1, 0)
+    assert not cache.update("X", rates[:0], LEVELS, 1.1, "M1")
+
+
+def test_every_emit_records_its_payload():
+    cache = ChartCache()
+    rates = make_rates(300, seed=3)
+    cache.render("X", rates, LEVELS, 1.1, "M1", key="chart_X")
+    first = cache.emit_payload_bytes
+    fig = cache._entries[("X", "M1")].fig
+    assert first == len(pio.to_json(fig, validate=False))
+    cache.render("X", rates, LEVELS, 1.2, "M1", key="chart_X")
+    stats = cache.stats()
+    assert (stats["builds"], stats["patches"], cache.emits) == (1, 1, 2)
+    assert stats["last_emit_payload_bytes"] == len(pio.to_json(fig, validate=False))
+    assert stats["emitted_payload_bytes"] == first + stats["last_emit_payload_bytes"]
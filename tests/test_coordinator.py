@@ -0,0 +1,193 @@
+import json
+import time
+
+import pytest
+
+import coordinator
+from coordinator import RESTART_BACKOFF, Coordinator, Worker, sim_accounts
+
+
+class FakeProcess:
+    """Stands in for a worker process: alive until the test kills it."""
+
+    pids = iter(range(1000, 2000))
+
+    def __init__(self, target=None, args=(), name=None, daemon=None):
+        self.pid = next(self.pids)
+        self.exitcode = None
+        self.started = False
+
+    def start(self):
+        self.started = True
+
+    def is_alive(self):
+        return self.started and self.exitcode is None
+
+    def die(self, exitcode=1):
+        self.exitcode = exitcode
+
+    def terminate(self):
+        self.die(-15)
+
+    def join(self, timeout=None):
+        pass
+
+    kill = terminate
+
+
+class FakeContext:
+    Process = FakeProcess
+
+
+@pytest.fixture
+def coord(tmp_path):
+    c = Coordinator(sim_accounts(2, ["EURUSDm"]), state_dir=str(tmp_path), interval=1.0)
+    c.context = FakeContext()
+    c.start()
+    return c
+
+
+def write_snapshot(worker, updated, cycle, positions=(), account=None, logs=None, ticks=0):
+    snapshot = {
+        "updated": updated, "cycle": cycle, "cycle_ms": 1.0,
+        "positions": list(positions), "account": account, "logs": logs or {},
+        "ticks": {"ticks": ticks}, "orders": {"done": 1, "failed": 0, "pending": 0},
+    }
+    with open(worker.state_path, "w", encoding="utf-8") as fh:
+        json.dump(snapshot, fh)
+
+
+# -----------------------
+# Supervision
+# -----------------------
+def test_supervise_restarts_after_backoff(coord):
+    worker = coord.workers[0]
+    first = worker.process
+    first.die(3)
+
+    coord.supervise(now=100.0)
+    assert worker.exit_code == 3
+    assert worker.failures == 1
+    assert worker.next_start == 100.0 + RESTART_BACKOFF[0]
+    assert worker.process is first and worker.restarts == 0
+
+    coord.supervise(now=100.0 + RESTART_BACKOFF[0] - 0.01)
+    assert worker.process is first
+
+    coord.supervise(now=100.0 + RESTART_BACKOFF[0])
+    assert worker.restarts == 1
+    assert worker.process is not first and worker.alive
+    assert worker.exit_code is None
+    assert coord.workers[1].restarts == 0
+
+
+def test_supervise_backoff_grows_and_caps(coord):
+    worker = coord.workers[0]
+    now = 0.0
+    delays = []
+    for _ in range(len(RESTART_BACKOFF) + 2):
+        worker.process.die()
+        coord.supervise(now=now)
+        delays.append(worker.next_start - now)
+        now = worker.next_start
+        coord.supervise(now=now)
+        assert worker.alive
+    assert delays == list(RESTART_BACKOFF) + [RESTART_BACKOFF[-1]] * 2
+    assert worker.restarts == len(delays)
+
+
+def test_supervise_leaves_stopping_workers(coord):
+    worker = coord.workers[0]
+    worker.stop()
+    coord.supervise(now=1e12)
+    assert worker.restarts == 0 and not worker.alive
+
+
+def test_fresh_snapshot_resets_failures(coord):
+    worker = coord.workers[0]
+    worker.process.die()
+    coord.supervise(now=0.0)
+    coord.supervise(now=RESTART_BACKOFF[0])
+    assert worker.failures == 1
+    write_snapshot(worker, updated=worker.started_at - 1, cycle=1)
+    coord.aggregate()
+    assert worker.failures == 1  # written by the dead process
+    write_snapshot(worker, updated=worker.started_at + 1, cycle=1)
+    coord.aggregate()
+    assert worker.failures == 0
+
+
+# -----------------------
+# Aggregation
+# -----------------------
+def test_aggregate_totals_and_logs(coord):
+    a, b = coord.workers
+    now = time.time()
+    write_snapshot(
+        a, now, 10,
+        positions=[{"ticket": 1, "symbol": "EURUSDm"}, {"ticket": 2, "symbol": "EURUSDm"}],
+        account={"balance": 1000.0, "equity": 1010.5, "profit": 10.5, "margin": 5.0, "margin_free": 1005.5},
+        logs={"trade_logs": [{"ts": 1, "msg": "a1"}, {"ts": 3, "msg": "a3"}]},
+    )
+    write_snapshot(
+        b, now, 20,
+        positions=[{"ticket": 3, "symbol": "EURUSDm"}],
+        account={"balance": 2000.0, "equity": 1990.25, "profit": -9.75, "margin": 1.0, "margin_free": 1989.25},
+        logs={"trade_logs": [{"ts": 2, "msg": "b2"}], "errors": [{"ts": 5, "msg": "boom"}]},
+    )
+
+    snapshot = coord.aggregate(now=now)
+
+    assert snapshot["totals"] == {
+        "balance": 3000.0, "equity": 3000.75, "profit": 0.75, "margin": 6.0, "margin_free": 2994.75,
+        "positions": 3, "accounts": 2,
+    }
+    assert [p["account"] for p in snapshot["positions"]] == ["sim-1", "sim-1", "sim-2"]
+    assert [e["msg"] for e in snapshot["logs"]["trade_logs"]] == ["[sim-1] a1", "[sim-2] b2", "[sim-1] a3"]
+    assert snapshot["logs"]["errors"] == [{"ts": 5, "msg": "[sim-2] boom", "account": "sim-2"}]
+    assert [w["status"] for w in snapshot["workers"]] == ["running", "running"]
+
+
+def test_aggregate_keeps_newest_log_entries(coord, monkeypatch):
+    monkeypatch.setattr(coordinator, "LOG_KEEP", 3)
+    a, b = coord.workers
+    now = time.time()
+    write_snapshot(a, now, 1, logs={"trade_logs": [{"ts": t, "msg": str(t)} for t in (1, 4, 5)]})
+    write_snapshot(b, now, 1, logs={"trade_logs": [{"ts": t, "msg": str(t)} for t in (2, 3, 6)]})
+    logs = coord.aggregate(now=now)["logs"]["trade_logs"]
+    assert [e["ts"] for e in logs] == [4, 5, 6]
+
+
+def test_aggregate_without_snapshots(coord):
+    snapshot = coord.aggregate()
+    assert snapshot["totals"]["accounts"] == 0
+    assert [w["status"] for w in snapshot["workers"]] == ["starting", "starting"]
+
+
+# -----------------------
+# Throughput
+# -----------------------
+def snapshot_at(updated, cycle, ticks=0, calls=0):
+    return {
+        "updated": updated, "cycle": cycle, "ticks": {"ticks": ticks},
+        "metrics": {"histograms": [{"name": "broker_call_seconds", "count": calls},
+                                   {"name": "cycle_seconds", "count": 999}]},
+    }
+
+
+def test_update_rates_resets_on_restart():
+    worker = Worker({"name": "w", "symbols": ["EURUSDm"]}, "unused.json")
+    worker.update_rates(snapshot_at(10.0, 5, ticks=100, calls=50))
+    assert worker.rates == {}
+
+    worker.update_rates(snapshot_at(12.0, 9, ticks=140, calls=70))
+    assert worker.rates == {"cycles_per_sec": 2.0, "ticks_per_sec": 20.0, "broker_calls_per_sec": 10.0}
+
+    worker.update_rates(snapshot_at(12.0, 9, ticks=140, calls=70))  # same snapshot again
+    assert worker.rates["cycles_per_sec"] == 2.0
+
+    worker.update_rates(snapshot_at(14.0, 1, ticks=3, calls=2))  # the worker restarted
+    assert worker.rates == {}
+
+    worker.update_rates(snapshot_at(16.0, 3, ticks=13, calls=6))
+    assert worker.rates == {"cycles_per_sec": 1.0, "ticks_per_sec": 5.0, "broker_calls_per_sec": 2.0}
@@ -0,0 +1,71 @@
+"""StreamingATR against the original pandas ATR (rolling mean of the true range)."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from broker import mt5
+from indicators import StreamingATR, atr_for, atr_series
+
+
+def pandas_atr(rates, period=14):
+    """The first calculate_atr's DataFrame arithmetic, for every bar."""
+    df = pd.DataFrame(rates)
+    df["high_low"] = df["high"] - df["low"]
+    df["high_close"] = abs(df["high"] - df["close"].shift())
+    df["low_close"] = abs(df["low"] - df["close"].shift())
+    df["tr"] = df[["high_low", "high_close", "low_close"]].max(axis=1)
+    return df["tr"].rolling(window=period).mean().to_numpy()
+
+
+def streamed(atr, rates):
+    values = []
+    for bar in rates:
+        atr.update(bar["time"], bar["high"], bar["low"], bar["close"])
+        values.append(np.nan if atr.value() is None else atr.value())
+    return np.array(values)
+
+
+@pytest.mark.parametrize("period", [1, 2, 14])
+def test_streaming_atr_matches_pandas(rates, period):
+    expected = pandas_atr(rates, period)
+    np.testing.assert_allclose(streamed(StreamingATR(period), rates), expected, rtol=1e-9)
+    np.testing.assert_allclose(atr_series(rates, period), expected, rtol=1e-9)
+
+
+def test_forming_bar_is_replaced(rates):
+    atr = StreamingATR(14).seed(rates[:100])
+    forming = rates[99:100].copy()
+    forming["high"] += 0.002
+    forming["close"] += 0.001
+    atr.seed(forming)
+    modified = np.concatenate([rates[:99], forming])
+    assert atr.value() == pytest.approx(pandas_atr(modified)[-1], rel=1e-9)
+    atr.seed(rates[50:60])  # older bars are ignored
+    assert atr.value() == pytest.approx(pandas_atr(modified)[-1], rel=1e-9)
+
+
+def test_wilder_streaming_matches_series(rates):
+    np.testing.assert_allclose(streamed(StreamingATR(14, "wilder"), rates), atr_series(rates, 14, "wilder"),
+                               rtol=1e-9)
+
+
+def test_reset_forgets_bars(rates):
+    atr = StreamingATR(14).seed(rates[:50])
+    atr.reset()
+    assert atr.value() is None and atr.last_time is None
+    atr.seed(rates[100:115])
+    assert atr.value() == pytest.approx(pandas_atr(rates[100:115])[-1], rel=1e-9)
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        StreamingATR(14, "ema")
+
+
+def test_atr_on_sim_terminal():
+    value = atr_for("XAUUSDm", mt5.TIMEFRAME_M5, 14)
+    history = mt5.copy_rates_from_pos("XAUUSDm", mt5.TIMEFRAME_M5, 0, 15)
+    # The forming bar may have ticked in between; every closed bar is the same
+    atr = StreamingATR(14).seed(history)
+    assert value == pytest.approx(atr.value(), rel=0.05)
+    assert atr.value() == pytest.approx(pandas_atr(history)[-1], rel=1e-9)
@@ -0,0 +1,159 @@
+"""levels_from_rates / rolling_levels / RollingLevelState against the original DataFrame analyze_symbol."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import rolling_levels
+from broker import mt5
+from conftest import make_rates
+from levels import compute_levels_batch, levels_from_rates, rolling_levels as rolling_levels_array, levels_to_dict
+from rolling_levels import RollingLevelState, TopTwoQueue, get_rolling_state
+
+
+def original_levels(rates, idm_ratio=0.7, factor=1.4):
+    """The levels part of the first analyze_symbol (DataFrame + full sorts), verbatim but for idm_ratio."""
+    df = pd.DataFrame(rates)
+    HH = df["high"].max()
+    LL = df["low"].min()
+    HL = df["low"].max()
+    sorted_highs = df["high"].sort_values(ascending=False).values
+    sorted_lows = df["low"].sort_values().values
+    PHH = sorted_highs[1] if len(sorted_highs) > 1 else None
+    PLL = sorted_lows[1] if len(sorted_lows) > 1 else None
+    RLL = sorted_lows[0] if len(sorted_lows) > 0 else None
+
+    dif = HH - LL
+    idm = dif * idm_ratio
+    Buy1 = HH - (factor * idm)
+    Buy2 = Buy1 - (factor * idm)
+    Buy3 = Buy2 - (factor * idm)
+    Resistance1 = HH + (factor * idm)
+    Resistance2 = Resistance1 + (factor * idm)
+    Resistance3 = Resistance2 + (factor * idm)
+
+    if (PLL is not None) and (RLL is not None):
+        dif_sell = PLL - RLL
+        Sell1 = HH + dif_sell
+        Sell2 = Sell1 + dif_sell
+        Sell3 = Sell2 + dif_sell
+    else:
+        Sell1 = Sell2 = Sell3 = None
+
+    if PHH is not None and PLL is not None and RLL is not None:
+        SellBreakout = PHH + (PLL - RLL) + (HH - PHH)
+    else:
+        SellBreakout = Resistance1
+
+    return {
+        "HH": HH, "LL": LL, "HL": HL, "PHH": PHH, "PLL": PLL, "RLL": RLL,
+        "Buy1": Buy1, "Buy2": Buy2, "Buy3": Buy3,
+        "Resistance1": Resistance1, "Resistance2": Resistance2, "Resistance3": Resistance3,
+        "Sell1": Sell1, "Sell2": Sell2, "Sell3": Sell3, "SellBreakout": SellBreakout,
+    }
+
+
+def assert_same_levels(got, expected, keys=None):
+    for key in keys or expected:
+        if expected[key] is None:
+            assert got[key] is None, key
+        else:
+            assert got[key] == pytest.approx(float(expected[key]), rel=1e-12, abs=1e-12), key
+
+
+@pytest.mark.parametrize("n", [1, 2, 3, 200])
+def test_levels_from_rates_matches_original(n):
+    rates = make_rates(n, seed=n)
+    assert_same_levels(levels_from_rates(rates), original_levels(rates))
+
+
+def test_levels_from_rates_matches_commented_original(rates):
+    # The commented-out version in mt5_helpers used idm = dif / 2 and had no SellBreakout
+    expected = original_levels(rates, idm_ratio=0.5)
+    expected.pop("SellBreakout")
+    assert_same_levels(levels_from_rates(rates, idm_ratio=0.5), expected)
+
+
+def test_batch_matches_original_per_symbol():
+    # Equal lengths are stacked into one partition; odd lengths and empty series mixed in
+    items = [(f"S{i}", make_rates(200 if i % 3 else 1 + i, seed=i)) for i in range(12)] + [("EMPTY", None)]
+    batch = compute_levels_batch(items)
+    assert list(batch["symbol"]) == [symbol for symbol, _ in items[:-1]]
+    for row, (_, rates) in zip(batch, items):
+        assert row["bars"] == len(rates) and row["last_close"] == rates["close"][-1]
+        assert_same_levels(levels_to_dict(row), original_levels(rates))
+
+
+def test_levels_from_rates_without_bars(rates):
+    assert levels_from_rates(rates[:0]) is None
+
+
+@pytest.mark.parametrize("window", [2, 3, 50, 200])
+def test_rolling_levels_match_original(rates, window):
+    out = rolling_levels_array(rates, window)
+    assert np.isnan(out["HH"][:window - 1]).all()
+    for i in range(window - 1, len(rates)):
+        assert_same_levels(levels_to_dict(out[i]), original_levels(rates[i - window + 1:i + 1]))
+
+
+def test_rolling_state_matches_original_while_streaming():
+    rng = np.random.default_rng(4)
+    source = make_rates(1500, seed=4)
+    for window in (1, 2, 3, 7, 60):
+        state = RollingLevelState("X", mt5.TIMEFRAME_M1, window)
+        state.ingest(source[:window + 2])
+        i = window + 2
+        while i < len(source) and i < window + 400:
+            # A repeat of the forming bar with new prices, then one or more new bars
+            forming = source[i - 1:i].copy()
+            forming["high"] += rng.integers(0, 3) * 0.0001
+            forming["low"] -= rng.integers(0, 3) * 0.0001
+            assert state.ingest(forming)
+            expected = original_levels(state.rates())
+            assert_same_levels(state.levels(), expected)
+            step = int(rng.integers(1, 3))
+            assert state.ingest(source[i - 1:i + step])
+            i += step
+            window_rates = state.rates()
+            assert len(window_rates) == min(window, i)
+            assert window_rates["time"][-1] == source["time"][i - 1]
+            assert_same_levels(state.levels(), original_levels(window_rates))
+
+
+def test_rolling_state_reports_gaps(rates):
+    state = RollingLevelState("X", mt5.TIMEFRAME_M1, 50)
+    state.ingest(rates[:100])
+    assert not state.ingest(rates[105:107])
+    assert state.ingest(rates[99:101])
+    assert state.last_time == rates["time"][100]
+
+
+def test_rolling_state_on_sim_terminal():
+    state = get_rolling_state("EURUSDm", mt5.TIMEFRAME_M1, 120).update()
+    state.update()
+    window_rates = state.rates()
+    assert len(window_rates) == 120
+    assert_same_levels(state.levels(), original_levels(window_rates))
+
+
+def test_rolling_states_are_lru_capped(monkeypatch):
+    monkeypatch.setattr(rolling_levels, "MAX_STATES", 2)
+    monkeypatch.setattr(rolling_levels, "_states", type(rolling_levels._states)())
+    a = get_rolling_state("A", mt5.TIMEFRAME_M1, 10)
+    get_rolling_state("B", mt5.TIMEFRAME_M1, 10)
+    assert get_rolling_state("A", mt5.TIMEFRAME_M1, 10) is a
+    get_rolling_state("C", mt5.TIMEFRAME_M1, 10)
+    assert [key[0] for key in rolling_levels._states] == ["A", "C"]
+
+
+def test_top_two_queue_is_a_sliding_window():
+    rng = np.random.default_rng(9)
+    values = list(np.round(rng.normal(size=500), 1))
+    queue, window = TopTwoQueue(values[:5]), values[:5]
+    for value in values[5:]:
+        queue.push(value)
+        window.append(value)
+        if rng.random() < 0.5:
+            queue.pop()
+            window.pop(0)
+        best = sorted(window, reverse=True)
+        assert queue.top_two() == (best[0], best[1] if len(best) > 1 else -np.inf)
@@ -0,0 +1,71 @@
+"""OrderPipeline dedupe, retries and owner expiry against the simulated terminal."""
+import pytest
+
+from broker import get_backend, mt5
+from order_pipeline import OrderPipeline
+
+SYMBOL = "EURUSDm"
+
+
+@pytest.fixture
+def pipeline():
+    return OrderPipeline(retry_delay=0.0, max_retries=2)
+
+
+def test_duplicate_key_returns_first_ticket(pipeline):
+    first, is_new = pipeline.submit(SYMBOL, "BUY", 0.01, key="cross:EURUSDm:Buy1", owner="a")
+    again, again_new = pipeline.submit(SYMBOL, "BUY", 0.01, key="cross:EURUSDm:Buy1", owner="b")
+    assert is_new and not again_new
+    assert again is first
+    assert first.wait(5)
+    assert first.status == "done" and first.retcode == mt5.TRADE_RETCODE_DONE
+    other, other_new = pipeline.submit(SYMBOL, "BUY", 0.01, key="cross:EURUSDm:Buy2", owner="a")
+    assert other_new and other.wait(5)
+    stats = pipeline.stats()
+    assert (stats["submitted"], stats["duplicates"], stats["done"]) == (2, 1, 2)
+
+
+def test_key_is_released_after_dedupe_window():
+    pipeline = OrderPipeline(dedupe_window=0.0)
+    first, _ = pipeline.submit(SYMBOL, "SELL", 0.01, key="k")
+    second, is_new = pipeline.submit(SYMBOL, "SELL", 0.01, key="k")
+    assert is_new and second is not first
+    assert first.wait(5) and second.wait(5)
+
+
+def test_requotes_are_retried_then_fail(pipeline, monkeypatch):
+    monkeypatch.setattr(get_backend(), "requote_rate", 1.0)
+    ticket, _ = pipeline.submit(SYMBOL, "BUY", 0.01, owner="a")
+    assert ticket.wait(5)
+    assert ticket.status == "failed"
+    assert ticket.retcode == mt5.TRADE_RETCODE_REQUOTE
+    assert ticket.attempts == pipeline.max_retries + 1
+    assert pipeline.stats()["retries"] == pipeline.max_retries
+    assert sum("Retry" in entry["msg"] for entry in ticket.logs) == pipeline.max_retries
+    assert ticket.logs[-1]["level"] == "error"
+
+
+def test_unknown_symbol_fails_without_retry(pipeline):
+    ticket, _ = pipeline.submit("NOPEm", "BUY", 0.01, owner="a")
+    assert ticket.wait(5)
+    assert ticket.status == "failed" and ticket.attempts == 1
+    assert ticket.error == "no symbol info"
+
+
+def test_drain_routes_results_to_owners(pipeline):
+    a, _ = pipeline.submit(SYMBOL, "BUY", 0.01, owner="a")
+    b, _ = pipeline.submit(SYMBOL, "SELL", 0.01, owner="b")
+    assert a.wait(5) and b.wait(5)
+    assert pipeline.drain("a") == [a]
+    assert pipeline.drain("a") == []
+    assert pipeline.drain("b") == [b]
+
+
+def test_undrained_owner_is_dropped_after_ttl():
+    pipeline = OrderPipeline(owner_ttl=0.0)
+    first, _ = pipeline.submit(SYMBOL, "BUY", 0.01, owner="gone")
+    assert first.wait(5)
+    second, _ = pipeline.submit(SYMBOL, "BUY", 0.01, owner="alive")
+    assert second.wait(5)
+    assert pipeline.stats()["abandoned"] == 1
+    assert pipeline.drain("gone") == []
@@ -0,0 +1,81 @@
+"""candle_trail_stops / atr_trail_stops against the per-position candle_trail_sl / atr_trail_sl."""
+from collections import namedtuple
+
+import numpy as np
+import pytest
+
+from broker import mt5
+from position_book import PositionBook, atr_trail_stops, candle_trail_stops
+from positions import PositionSnapshot
+from strategies.atr_trailer import atr_trail_sl
+from strategies.candle_trailer import candle_trail_sl
+
+Position = namedtuple("Position", "ticket symbol type price_open sl tp volume")
+Quote = namedtuple("Quote", "bid ask time_msc")
+POINT = 0.0001
+
+
+@pytest.fixture
+def book():
+    rng = np.random.default_rng(1)
+    symbols = [f"S{i}" for i in range(20)]
+    positions = []
+    for ticket in range(1, 2001):
+        price_open = 1.0 + rng.random() * 0.1
+        sl = 0.0 if rng.random() < 0.3 else price_open + rng.normal(0, 0.003)
+        side = mt5.POSITION_TYPE_BUY if rng.random() < 0.5 else mt5.POSITION_TYPE_SELL
+        positions.append(Position(ticket, symbols[rng.integers(len(symbols))], side, price_open, sl, 0.0, 0.1))
+    quotes = {}
+    for symbol in symbols[1:]:  # S0 has no tick
+        bid = 1.0 + rng.random() * 0.1
+        quotes[symbol] = Quote(bid, bid + 0.0002, 0)
+    book = PositionBook(PositionSnapshot(positions)).load_quotes(quotes.get, lambda symbol: POINT)
+    low = {s: q.bid - rng.random() * 0.005 for s, q in quotes.items() if s != "S1"}
+    high = {s: q.ask + rng.random() * 0.005 for s, q in quotes.items() if s != "S1"}
+    distance = {s: rng.random() * 0.003 for s in quotes if s != "S2"}
+    return book, positions, quotes, low, high, distance
+
+
+def scalar_inputs(positions, quotes, per_symbol):
+    for p in positions:
+        quote = quotes.get(p.symbol)
+        if quote is None or p.symbol not in per_symbol:
+            continue
+        buy = p.type == mt5.POSITION_TYPE_BUY
+        yield p, buy, quote.bid if buy else quote.ask
+
+
+@pytest.mark.parametrize("trigger", [0, 20, 200])
+def test_candle_trail_stops_match_scalar(book, trigger):
+    book, positions, quotes, low, high, _ = book
+    changes = candle_trail_stops(book, trigger, book.per_symbol(low), book.per_symbol(high))
+    got = {int(c["ticket"]): (str(c["kind"]), float(c["sl"])) for c in changes}
+    expected = {}
+    for p, buy, price in scalar_inputs(positions, quotes, low):
+        proposals = candle_trail_sl(buy, p.price_open, p.sl, price, POINT, trigger, low[p.symbol], high[p.symbol])
+        if proposals:
+            expected[p.ticket] = proposals[-1]
+    assert got == expected
+    assert expected
+
+
+@pytest.mark.parametrize("trigger, step", [(0, 0), (20, 5), (50, 30)])
+def test_atr_trail_stops_match_scalar(book, trigger, step):
+    book, positions, quotes, _, _, distance = book
+    changes = atr_trail_stops(book, book.per_symbol(distance), trigger, step)
+    got = {int(c["ticket"]): float(c["sl"]) for c in changes}
+    expected = {}
+    for p, buy, price in scalar_inputs(positions, quotes, distance):
+        new_sl = atr_trail_sl(buy, p.price_open, p.sl, price, POINT, distance[p.symbol], trigger, step)
+        if new_sl is not None:
+            expected[p.ticket] = new_sl
+    assert got == expected
+    assert expected
+
+
+def test_book_subset_and_empty(book):
+    book, positions, *_ = book
+    subset = PositionBook(book.snapshot, ["S3", "S4"])
+    assert set(subset.symbols) == {"S3", "S4"}
+    assert len(subset) == sum(p.symbol in ("S3", "S4") for p in positions)
+    assert len(PositionBook(PositionSnapshot([]))) == 0
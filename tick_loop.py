@@ -0,0 +1,176 @@
+"""
+Tick-driven level-cross detection.
+
+An asyncio loop polls ``symbol_info_tick`` for every active symbol with a
+bounded number of requests in flight. Each symbol has its own poll
+interval: it drops to `min_interval` as soon as the price moves and backs
+off towards `max_interval` while the symbol is quiet. Crossing detection
+runs on every new tick (same rule as autotrade.run_autotrade), and signals
+are handed to the order path on a worker thread right away, so a price that
+crosses and comes back between dashboard refreshes is no longer missed.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+
+from broker import mt5
+from autotrade import detect_cross
+
+
+class TickMetrics:
+    """Tick throughput and tick-to-signal latency."""
+
+    def __init__(self, window=1000):
+        self.ticks = 0
+        self.polls = 0
+        self.signals = 0
+        self.errors = 0
+        self.started = time.monotonic()
+        self._tick_times = deque(maxlen=window)
+        self._latencies = deque(maxlen=window)  # seconds, tick received -> order path entered
+
+    def on_poll(self):
+        self.polls += 1
+
+    def on_tick(self, received):
+        self.ticks += 1
+        self._tick_times.append(received)
+
+    def on_signal(self, received):
+        self.signals += 1
+        self._latencies.append(time.perf_counter() - received)
+
+    def ticks_per_sec(self):
+        if len(self._tick_times) < 2:
+            return 0.0
+        span = self._tick_times[-1] - self._tick_times[0]
+        return (len(self._tick_times) - 1) / span if span > 0 else 0.0
+
+    def latency_ms(self, q):
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000.0
+
+    def snapshot(self):
+        return {
+            "ticks": self.ticks,
+            "polls": self.polls,
+            "signals": self.signals,
+            "errors": self.errors,
+            "ticks_per_sec": round(self.ticks_per_sec(), 2),
+            "signal_latency_p50_ms": self.latency_ms(0.5),
+            "signal_latency_p99_ms": self.latency_ms(0.99),
+            "uptime_s": round(time.monotonic() - self.started, 1),
+        }
+
+
+class TickLoop:
+    def __init__(self, symbols, levels_provider, on_signal, max_concurrency=8,
+                 min_interval=0.05, max_interval=1.0, backoff=1.5):
+        """
+        - symbols: symbols to watch (the list can be replaced with set_symbols)
+        - levels_provider: callable symbol -> levels dict (or None while unknown)
+        - on_signal: callable (symbol, side, price, tick) run on a worker thread
+        - max_concurrency: symbol_info_tick calls in flight at once
+        - min_interval / max_interval: poll interval bounds per symbol (seconds)
+        - backoff: interval multiplier while a symbol's tick is unchanged
+        """
+        self.symbols = list(symbols)
+        self.levels_provider = levels_provider
+        self.on_signal = on_signal
+        self.max_concurrency = int(max_concurrency)
+        self.min_interval = float(min_interval)
+        self.max_interval = float(max_interval)
+        self.backoff = float(backoff)
+        self.metrics = TickMetrics()
+        self.intervals = {}
+        self._last_msc = {}
+        self._prev_price = {}
+        self._stop = None
+        self._loop = None
+        self._thread = None
+
+    def set_symbols(self, symbols):
+        """Change the watched symbols; pollers are started/stopped on the next check."""
+        self.symbols = list(symbols)
+
+    # -----------------------
+    # Per-tick processing
+    # -----------------------
+    def process_tick(self, symbol, tick, received):
+        """Update interval/metrics for one tick and return the signal side, if any."""
+        if tick is None:
+            self.metrics.errors += 1
+            return None
+        interval = self.intervals.get(symbol, self.min_interval)
+        if tick.time_msc == self._last_msc.get(symbol):
+            self.intervals[symbol] = min(interval * self.backoff, self.max_interval)
+            return None
+        self._last_msc[symbol] = tick.time_msc
+        self.intervals[symbol] = self.min_interval
+        self.metrics.on_tick(received)
+
+        price = tick.bid
+        prev = self._prev_price.get(symbol)
+        self._prev_price[symbol] = price
+        levels = self.levels_provider(symbol)
+        if not levels:
+            return None
+        return detect_cross(prev, price, levels)
+
+    def _dispatch(self, symbol, side, tick, received):
+        self.metrics.on_signal(received)
+        try:
+            self.on_signal(symbol, side, tick.bid, tick)
+        except Exception:
+            self.metrics.errors += 1
+
+    async def _poll_symbol(self, symbol, semaphore):
+        loop = asyncio.get_running_loop()
+        while not self._stop.is_set() and symbol in self.symbols:
+            async with semaphore:
+                try:
+                    tick = await asyncio.to_thread(mt5.symbol_info_tick, symbol)
+                except Exception:
+                    tick = None
+                received = time.perf_counter()
+                self.metrics.on_poll()
+            side = self.process_tick(symbol, tick, received)
+            if side is not None:
+                loop.run_in_executor(None, self._dispatch, symbol, side, tick, received)
+            try:
+                await asyncio.wait_for(self._stop.wait(), self.intervals.get(symbol, self.min_interval))
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self, duration=None):
+        """Poll until stop() is called (or for `duration` seconds)."""
+        self._stop = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        tasks = {}
+        deadline = None if duration is None else time.monotonic() + duration
+        while not self._stop.is_set():
+            for symbol in self.symbols:
+                if symbol not in tasks or tasks[symbol].done():
+                    tasks[symbol] = asyncio.create_task(self._poll_symbol(symbol, semaphore))
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            try:
+                await asyncio.wait_for(self._stop.wait(), 0.5)
+            except asyncio.TimeoutError:
+                pass
+        self._stop.set()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+    def stop(self):
+        if self._loop is not None and self._stop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+
+    def start_in_thread(self):
+        """Run the loop on a daemon thread (for the engine); returns the thread."""
+        self._thread = threading.Thread(target=asyncio.run, args=(self.run(),), name="tick-loop", daemon=True)
+        self._thread.start()
+        return self._thread
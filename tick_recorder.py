@@ -0,0 +1,303 @@
+"""
+Tick recorder.
+
+Captures the ticks of selected symbols into one append-only binary file per
+symbol, so a fast market can be replayed later (see replay_broker.py):
+
+- records are fixed-size, in the layout ``copy_ticks_range`` returns
+  (TICK_DTYPE), so a file is read back with one ``np.memmap`` and fed
+  straight to ``backtest.run_backtest(ticks=...)``;
+- ticks are buffered in memory and written in batches (one ``write`` per
+  symbol per flush), so recording costs next to nothing per tick;
+- with ``copy_ticks_range`` available (the real terminal) every tick since
+  the last poll is fetched; otherwise ``symbol_info_tick`` is polled and
+  changed quotes are kept;
+- a record cut short by a crash is ignored on read and dropped on the next
+  append.
+
+The symbol's contract details are saved next to the ticks:
+
+    <dir>/EURUSDm.ticks  EURUSDm.json
+
+    python tick_recorder.py --symbols EURUSDm XAUUSDm --dir ticks --interval 0.05
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from broker import mt5
+
+
+TICK_DTYPE = np.dtype([
+    ("time", "<i8"), ("bid", "<f8"), ("ask", "<f8"), ("last", "<f8"), ("volume", "<u8"),
+    ("time_msc", "<i8"), ("flags", "<u4"), ("volume_real", "<f8"),
+])
+TICK_EXT = ".ticks"
+INFO_FIELDS = ("point", "digits", "trade_tick_value", "trade_tick_size", "trade_contract_size",
+               "trade_stops_level", "trade_freeze_level", "spread")
+DEFAULT_INTERVAL = 0.05   # seconds between polls
+FLUSH_INTERVAL = 1.0      # seconds between writes
+COPY_TICKS_ALL = -1       # mt5.COPY_TICKS_ALL
+
+
+def tick_path(directory, symbol):
+    return os.path.join(directory, f"{symbol}{TICK_EXT}")
+
+
+def recorded_symbols(directory):
+    """Symbols with a tick file in `directory`."""
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+    return sorted(n[:-len(TICK_EXT)] for n in names if n.endswith(TICK_EXT))
+
+
+def read_ticks(directory, symbol, msc_from=None, msc_to=None):
+    """Read-only memmap of a symbol's ticks with msc_from <= time_msc <= msc_to (no copy)."""
+    path = tick_path(directory, symbol)
+    count = os.path.getsize(path) // TICK_DTYPE.itemsize if os.path.exists(path) else 0
+    if count == 0:
+        return np.zeros(0, dtype=TICK_DTYPE)
+    ticks = np.memmap(path, dtype=TICK_DTYPE, mode="r", shape=(count,))
+    start = 0 if msc_from is None else int(np.searchsorted(ticks["time_msc"], int(msc_from), side="left"))
+    stop = count if msc_to is None else int(np.searchsorted(ticks["time_msc"], int(msc_to), side="right"))
+    return ticks[start:max(start, stop)]
+
+
+def read_symbol_info(directory, symbol):
+    """Contract details saved when the symbol was recorded ({} if missing)."""
+    try:
+        with open(os.path.join(directory, f"{symbol}.json"), encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+class TickWriter:
+    """Buffered appender for one symbol's tick file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._buffer = []
+        self.pending = 0
+        self.written = 0
+        self.last_msc = None
+        self.at_last_msc = 0  # ticks kept with time_msc == last_msc (several can share a millisecond)
+        if os.path.exists(path):
+            size = os.path.getsize(path)
+            whole = size - size % TICK_DTYPE.itemsize
+            if whole != size:
+                with open(path, "r+b") as fh:
+                    fh.truncate(whole)
+            if whole:
+                times = np.memmap(path, dtype=TICK_DTYPE, mode="r", shape=(whole // TICK_DTYPE.itemsize,))["time_msc"]
+                self.last_msc = int(times[-1])
+                self.at_last_msc = len(times) - int(np.searchsorted(times, self.last_msc, side="left"))
+                del times
+
+    def add(self, ticks, overlaps=True):
+        """
+        Queue ticks (TICK_DTYPE-compatible array) not kept yet.
+        - overlaps: `ticks` is a re-read that repeats every tick already kept
+          at last_msc (copy_ticks_range from that second), so only those
+          are skipped and later ticks of the same millisecond are kept;
+          False for ticks known to be new (a changed symbol_info_tick quote)
+        """
+        if self.last_msc is not None:
+            times = ticks["time_msc"]
+            if overlaps:
+                at_last = np.flatnonzero(times == self.last_msc)
+                keep = times > self.last_msc
+                keep[at_last[self.at_last_msc:]] = True
+                ticks = ticks[keep]
+            else:
+                ticks = ticks[times >= self.last_msc]
+        if len(ticks) == 0:
+            return 0
+        block = np.zeros(len(ticks), dtype=TICK_DTYPE)
+        for field in TICK_DTYPE.names:
+            if field in ticks.dtype.names:
+                block[field] = ticks[field]
+        self._buffer.append(block)
+        self.pending += len(block)
+        newest = int(block["time_msc"][-1])
+        same = int(np.count_nonzero(block["time_msc"] == newest))
+        self.at_last_msc = self.at_last_msc + same if newest == self.last_msc else same
+        self.last_msc = newest
+        return len(block)
+
+    def flush(self):
+        if not self._buffer:
+            return 0
+        data = np.concatenate(self._buffer) if len(self._buffer) > 1 else self._buffer[0]
+        with open(self.path, "ab") as fh:
+            fh.write(data.tobytes())
+        self._buffer = []
+        self.pending = 0
+        self.written += len(data)
+        return len(data)
+
+
+def _tick_record(tick):
+    """One symbol_info_tick result as a 1-element TICK_DTYPE array."""
+    record = np.zeros(1, dtype=TICK_DTYPE)
+    for field in TICK_DTYPE.names:
+        record[field] = getattr(tick, field, 0) or 0
+    return record
+
+
+class TickRecorder:
+    """Polls the terminal for new ticks of `symbols` and appends them to `directory`."""
+
+    def __init__(self, symbols, directory, interval=DEFAULT_INTERVAL, flush_interval=FLUSH_INTERVAL,
+                 use_copy_ticks=None):
+        """
+        - interval: seconds between polls of all symbols
+        - flush_interval: seconds between file writes
+        - use_copy_ticks: fetch every tick with copy_ticks_range (default: when the backend has it)
+        """
+        self.symbols = list(symbols)
+        self.directory = directory
+        self.interval = float(interval)
+        self.flush_interval = float(flush_interval)
+        if use_copy_ticks is None:
+            use_copy_ticks = callable(getattr(mt5, "copy_ticks_range", None))
+        self.use_copy_ticks = bool(use_copy_ticks)
+        self._writers = {}
+        self._last_quote = {}
+        self._flushed_at = time.monotonic()
+        self._stop = threading.Event()
+        self._thread = None
+        self.polls = 0
+        self.ticks = 0
+        self.flushes = 0
+        self.errors = 0
+        self.write_ms = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    def _writer(self, symbol):
+        writer = self._writers.get(symbol)
+        if writer is None:
+            writer = self._writers[symbol] = TickWriter(tick_path(self.directory, symbol))
+            info = mt5.symbol_info(symbol)
+            if info is not None:
+                with open(os.path.join(self.directory, f"{symbol}.json"), "w", encoding="utf-8") as fh:
+                    json.dump({f: getattr(info, f, None) for f in INFO_FIELDS}, fh)
+        return writer
+
+    # -----------------------
+    # Polling
+    # -----------------------
+    def _new_ticks(self, symbol, writer):
+        if self.use_copy_ticks:
+            if writer.last_msc is None:
+                # First poll of a new file: every tick of the current second
+                tick = mt5.symbol_info_tick(symbol)
+                if tick is None:
+                    return None
+                since = tick.time_msc // 1000
+            else:
+                since = writer.last_msc // 1000
+            date_from = datetime.fromtimestamp(since, tz=timezone.utc)
+            # Server time can run ahead of UTC; ask a day past now
+            date_to = datetime.fromtimestamp(time.time() + 86400, tz=timezone.utc)
+            return mt5.copy_ticks_range(symbol, date_from, date_to, getattr(mt5, "COPY_TICKS_ALL", COPY_TICKS_ALL))
+        tick = mt5.symbol_info_tick(symbol)
+        if tick is None:
+            return None
+        quote = (tick.time_msc, tick.bid, tick.ask, tick.last)
+        if quote == self._last_quote.get(symbol):
+            return None
+        self._last_quote[symbol] = quote
+        return _tick_record(tick)
+
+    def poll_once(self):
+        """Fetch new ticks for every symbol; writes them out every flush_interval."""
+        self.polls += 1
+        for symbol in self.symbols:
+            writer = self._writer(symbol)
+            try:
+                ticks = self._new_ticks(symbol, writer)
+            except Exception:
+                self.errors += 1
+                continue
+            if ticks is not None and len(ticks):
+                self.ticks += writer.add(ticks, overlaps=self.use_copy_ticks)
+        if time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        started = time.perf_counter()
+        for writer in self._writers.values():
+            writer.flush()
+        self.write_ms += (time.perf_counter() - started) * 1000.0
+        self.flushes += 1
+        self._flushed_at = time.monotonic()
+
+    def run(self, duration=None):
+        """Poll until stop() is called (or for `duration` seconds), then flush."""
+        self._stop.clear()
+        deadline = None if duration is None else time.monotonic() + duration
+        try:
+            while not self._stop.is_set():
+                started = time.monotonic()
+                self.poll_once()
+                if deadline is not None and started >= deadline:
+                    break
+                self._stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+        finally:
+            self.flush()
+
+    def start_in_thread(self):
+        """Record on a daemon thread (e.g. next to the engine); returns the thread."""
+        self._thread = threading.Thread(target=self.run, name="tick-recorder", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def stats(self):
+        return {
+            "symbols": len(self.symbols),
+            "mode": "copy_ticks_range" if self.use_copy_ticks else "symbol_info_tick",
+            "polls": self.polls,
+            "ticks": self.ticks,
+            "flushes": self.flushes,
+            "errors": self.errors,
+            "write_ms": round(self.write_ms, 2),
+            "bytes": sum(w.written for w in self._writers.values()) * TICK_DTYPE.itemsize,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record ticks into append-only binary files")
+    parser.add_argument("--symbols", nargs="+", required=True)
+    parser.add_argument("--dir", default="ticks")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL)
+    parser.add_argument("--duration", type=float, default=None, help="seconds (default: until Ctrl+C)")
+    parser.add_argument("--poll", action="store_true", help="poll symbol_info_tick even if copy_ticks_range exists")
+    args = parser.parse_args(argv)
+
+    if not mt5.initialize():
+        raise SystemExit("MT5 initialization failed. Make sure the terminal is running and logged in.")
+    recorder = TickRecorder(args.symbols, args.dir, args.interval, use_copy_ticks=False if args.poll else None)
+    try:
+        recorder.run(args.duration)
+    except KeyboardInterrupt:
+        pass  # run() flushes on the way out
+    finally:
+        mt5.shutdown()
+        print(json.dumps(recorder.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,98 +1,431 @@
-import streamlit as st
-import pandas as pd
-from charts import plot_candlestick
-from mt5_helpers import get_positions_for_symbol, estimate_profit_usd, safe_symbol_info, pip_and_point, place_order_safe
-from autotrade import run_autotrade
-
-def display_symbol_tab(symbol, levels, df, timeframe_choice, lot_size, default_tp_points, default_sl_points):
-    """
-    Display a symbol tab including chart, calculation table, positions,
-    and trade controls (manual + auto-trade toggle).
-    """
-    last_price = float(df["close"].iloc[-1])
-
-    # -----------------------
-    # Chart
-    # -----------------------
-    plot_candlestick(symbol, df, levels, last_price, timeframe_choice, key=f"chart_{symbol}")
-
-    # -----------------------
-    # Calculation table
-    # -----------------------
-    st.subheader("Calculation Table")
-    st.dataframe(pd.DataFrame({k:[v] for k,v in levels.items()}).style.format(precision=5), use_container_width=True)
-
-    # -----------------------
-    # Symbol-specific open positions
-    # -----------------------
-    st.subheader("Open Positions (this symbol)")
-    df_sym_pos = get_positions_for_symbol(symbol)
-    if df_sym_pos.empty:
-        st.info("No open positions for this symbol.")
-    else:
-        st.dataframe(df_sym_pos.style.format(precision=2), use_container_width=True)
-
-    # -----------------------
-    # TP calculation
-    # -----------------------
-    info = safe_symbol_info(symbol)
-    point, pip = pip_and_point(symbol)
-
-    suggested_tp_points = None
-    tp_pips = None
-    est_profit = None
-    if levels["Resistance1"] is not None:
-        suggested_tp_points = abs(levels["Resistance1"] - levels["Buy1"]) / point
-        
-        tp_pips = suggested_tp_points
-        est_profit = estimate_profit_usd(symbol, suggested_tp_points, lot_size)
-
-    # -----------------------
-    # Trade Controls & Info
-    # -----------------------
-    st.subheader("Trade Controls & Info")
-    colA, colB, colC = st.columns([1,1,1])
-    with colA:
-        st.write(f"Last Price: {last_price:.5f}")
-        if tp_pips is not None:
-         st.markdown(f"""
-        **Full TP (calc):** {suggested_tp_points:.1f} points  
-        **Applied TP (½ of full):** {tp_pips:.1f} points (≈ {tp_pips * pip:.5f} price units)  
-        **Est. Profit (approx):** ${est_profit:.2f} (lot={lot_size})
-        """)
-        else:
-            st.write("Suggested TP: N/A")
-
-
-    # --- Column B: Auto-trade toggle & manual trade buttons
-    with colB:
-        autotrade_toggle = st.checkbox(
-            "Enable Auto-Trade for this symbol",
-            value=st.session_state.autotrade.get(symbol, True),
-            key=f"autotrade_{symbol}"
-        )
-        st.session_state.autotrade[symbol] = autotrade_toggle
-
-        # Manual BUY
-        if st.button(f"Place BUY {symbol}", key=f"manual_buy_{symbol}"):
-            tp_points_use = int(suggested_tp_points) if suggested_tp_points and suggested_tp_points > 0 else int(default_tp_points or 50)
-            tp_price = last_price + tp_points_use * point
-            res = place_order_safe(symbol, lot_size, "BUY", default_sl_points, tp_price)
-            st.write("Order result:", res)
-            st.session_state.last_trade[symbol] = f"BUY @{last_price:.5f} TP={tp_points_use} pts"
-
-        # Manual SELL
-        if st.button(f"Place SELL {symbol}", key=f"manual_sell_{symbol}"):
-            tp_points_use = int(suggested_tp_points) if suggested_tp_points and suggested_tp_points > 0 else int(default_tp_points or 50)
-            tp_price = last_price - tp_points_use * point
-            res = place_order_safe(symbol, lot_size, "SELL", default_sl_points, tp_price)
-            st.write("Order result:", res)
-            st.session_state.last_trade[symbol] = f"SELL @{last_price:.5f} TP={tp_points_use} pts"
-
-    # --- Column C: Last executed trade
-    with colC:
-        last_trade = st.session_state.last_trade.get(symbol)
-        st.write("Last executed trade (session):")
-        st.info(last_trade if last_trade else "No trade executed this session for symbol")
-
-    return suggested_tp_points, point
+import streamlit as st
+import pandas as pd
+from charts import chart_cache, plot_candlestick
+from mt5_helpers import get_positions_for_symbol, estimate_profit_usd, safe_symbol_info, pip_and_point, positions_view
+from order_pipeline import submit_order
+from autotrade import run_autotrade, suggest_tp_points, detect_cross
+from levels import last_close
+from positions import positions_snapshot
+
+def fragment(run_every=None):
+    """st.fragment decorator (st.experimental_fragment on older Streamlit)."""
+    decorator = getattr(st, "fragment", None) or st.experimental_fragment
+    return decorator(run_every=run_every)
+
+
+def symbol_positions_table(symbol):
+    df_sym_pos = get_positions_for_symbol(symbol)
+    if df_sym_pos.empty:
+        st.info("No open positions for this symbol.")
+    else:
+        st.dataframe(df_sym_pos.style.format(precision=2), use_container_width=True)
+
+
+def watch_chart(symbol, chart_source, timeframe_choice):
+    """
+    Patch the cached chart between full reruns. The chart itself is drawn
+    with the tab, so a refresh that changed nothing sends nothing; a full
+    rerun is asked for only when a build or patch ran.
+    """
+    levels, rates = chart_source()
+    if levels is None or rates is None:
+        return
+    if chart_cache.update(symbol, rates, levels, last_close(rates), timeframe_choice):
+        st.rerun(scope="app")
+
+
+def display_symbol_tab(symbol, levels, df, timeframe_choice, lot_size, default_tp_points, default_sl_points,
+                       refresh_seconds=None, chart_source=None, mtf_levels=None):
+    """
+    Display a symbol tab including chart, calculation table, positions,
+    and trade controls (manual + auto-trade toggle).
+    `df` may be a DataFrame or the raw MT5 rates array.
+    With `refresh_seconds` the positions table is a fragment refreshing on
+    its own at that interval; with `chart_source` (callable -> (levels, rates))
+    as well, the chart is watched at that interval and redrawn by a full rerun
+    when it moved. The rest only changes on a full rerun.
+    `mtf_levels` ({timeframe name: levels}) adds one calculation column per timeframe.
+    """
+    last_price = last_close(df)
+
+    # -----------------------
+    # Chart
+    # -----------------------
+    plot_candlestick(symbol, df, levels, last_price, timeframe_choice, key=f"chart_{symbol}")
+    if refresh_seconds and chart_source is not None:
+        # Forming candle / last price patched into the cached figure between bars
+        fragment(run_every=refresh_seconds)(watch_chart)(symbol, chart_source, timeframe_choice)
+
+    # -----------------------
+    # Calculation table
+    # -----------------------
+    st.subheader("Calculation Table")
+    st.dataframe(pd.DataFrame({k:[v] for k,v in levels.items()}).style.format(precision=5), use_container_width=True)
+    if mtf_levels:
+        st.caption("Levels per timeframe (resampled from one base fetch; timeframes it can't cover are fetched natively)")
+        st.dataframe(pd.DataFrame(mtf_levels).style.format(precision=5), use_container_width=True)
+
+    # -----------------------
+    # Symbol-specific open positions
+    # -----------------------
+    st.subheader("Open Positions (this symbol)")
+    if refresh_seconds:
+        fragment(run_every=refresh_seconds)(symbol_positions_table)(symbol)
+    else:
+        symbol_positions_table(symbol)
+
+    # -----------------------
+    # TP calculation
+    # -----------------------
+    info = safe_symbol_info(symbol)
+    point, pip = pip_and_point(symbol)
+
+    tp_pips = None
+    est_profit = None
+    suggested_tp_points = suggest_tp_points(levels, point)
+    if suggested_tp_points is not None:
+        tp_pips = suggested_tp_points
+        est_profit = estimate_profit_usd(symbol, suggested_tp_points, lot_size)
+
+    # -----------------------
+    # Trade Controls & Info
+    # -----------------------
+    st.subheader("Trade Controls & Info")
+    colA, colB, colC = st.columns([1,1,1])
+    with colA:
+        st.write(f"Last Price: {last_price:.5f}")
+        if tp_pips is not None:
+         st.markdown(f"""
+        **Full TP (calc):** {suggested_tp_points:.1f} points  
+        **Applied TP (½ of full):** {tp_pips:.1f} points (≈ {tp_pips * pip:.5f} price units)  
+        **Est. Profit (approx):** ${est_profit:.2f} (lot={lot_size})
+        """)
+        else:
+            st.write("Suggested TP: N/A")
+
+
+    # --- Column B: Auto-trade toggle & manual trade buttons
+    with colB:
+        autotrade_toggle = st.checkbox(
+            "Enable Auto-Trade for this symbol",
+            value=st.session_state.autotrade.get(symbol, True),
+            key=f"autotrade_{symbol}"
+        )
+        st.session_state.autotrade[symbol] = autotrade_toggle
+
+        # Manual BUY
+        if st.button(f"Place BUY {symbol}", key=f"manual_buy_{symbol}"):
+            tp_points_use = int(suggested_tp_points) if suggested_tp_points and suggested_tp_points > 0 else int(default_tp_points or 50)
+            tp_price = last_price + tp_points_use * point
+            ticket, _ = submit_order(st.session_state, symbol, "BUY", lot_size, default_sl_points, tp_price,
+                                     comment=f"Streamlit Manual BUY")
+            st.write("Order queued:", ticket.summary())
+            st.session_state.last_trade[symbol] = f"BUY @{last_price:.5f} TP={tp_points_use} pts"
+
+        # Manual SELL
+        if st.button(f"Place SELL {symbol}", key=f"manual_sell_{symbol}"):
+            tp_points_use = int(suggested_tp_points) if suggested_tp_points and suggested_tp_points > 0 else int(default_tp_points or 50)
+            tp_price = last_price - tp_points_use * point
+            ticket, _ = submit_order(st.session_state, symbol, "SELL", lot_size, default_sl_points, tp_price,
+                                     comment=f"Streamlit Manual SELL")
+            st.write("Order queued:", ticket.summary())
+            st.session_state.last_trade[symbol] = f"SELL @{last_price:.5f} TP={tp_points_use} pts"
+
+    # --- Column C: Last executed trade
+    with colC:
+        last_trade = st.session_state.last_trade.get(symbol)
+        st.write("Last executed trade (session):")
+        st.info(last_trade if last_trade else "No trade executed this session for symbol")
+
+    return suggested_tp_points, point
+
+
+def watchlist_table(symbols, levels_by_symbol, rates_by_symbol):
+    """
+    One cheap row per symbol (last price, trade levels, pending crossing,
+    positions) from data the auto-trader computed anyway; no chart, no
+    per-symbol tables.
+    """
+    snapshot = positions_snapshot()
+    rows = []
+    for symbol in symbols:
+        levels = levels_by_symbol.get(symbol)
+        rates = rates_by_symbol.get(symbol)
+        if levels is None or rates is None:
+            rows.append({"Symbol": symbol, "Last": None})
+            continue
+        last_price = last_close(rates)
+        rows.append({
+            "Symbol": symbol,
+            "Last": last_price,
+            "Buy1": levels["Buy1"],
+            "Sell": levels["PHH"] or levels["HH"],
+            "Cross": detect_cross(st.session_state.get(f"prev_price_{symbol}"), last_price, levels) or "",
+            "Positions": len(snapshot.rows(symbol)),
+            "Auto": st.session_state.autotrade.get(symbol, False),
+            "Last trade": st.session_state.last_trade.get(symbol) or "",
+        })
+    st.dataframe(pd.DataFrame(rows).style.format(precision=5, subset=["Last", "Buy1", "Sell"]),
+                 use_container_width=True, hide_index=True)
+
+
+def diagnostics_panel(snapshot):
+    """Latency histograms (slowest total first) and counters from instrumentation.metrics.snapshot()."""
+    if not snapshot.get("enabled", True):
+        st.caption("Instrumentation is off; the numbers stop where it was switched off.")
+    histograms = pd.DataFrame(snapshot.get("histograms", []))
+    if histograms.empty:
+        st.caption("Nothing timed yet.")
+    else:
+        columns = ["name", "stage", "call", "phase", "symbol", "count", "total_ms", "mean_ms",
+                   "p50_ms", "p95_ms", "p99_ms", "max_ms"]
+        histograms = histograms[[c for c in columns if c in histograms.columns]].fillna("")
+        st.dataframe(histograms, use_container_width=True, hide_index=True)
+    counters = pd.DataFrame(snapshot.get("counters", []))
+    if not counters.empty:
+        st.dataframe(counters.fillna(""), use_container_width=True, hide_index=True)
+
+
+def worker_health_table(workers):
+    """One row per account worker from the coordinator: status, restarts, staleness, throughput."""
+    df = pd.DataFrame(workers)
+    if df.empty:
+        st.info("No workers configured.")
+        return
+    colors = {"running": "#22db22", "starting": "#dbb922", "stale": "#db8422", "restarting": "#db2222"}
+    st.dataframe(
+        df.style.map(lambda v: f"color: {colors.get(v, 'gray')}", subset=["status"]),
+        use_container_width=True, hide_index=True,
+    )
+
+
+def display_engine_symbol_tab(symbol, data, df_pos, timeframe_choice):
+    """
+    Read-only symbol tab fed from a headless engine snapshot: chart,
+    calculation table, positions and the engine's last trade.
+    """
+    levels = data.get("levels")
+    bars = data.get("bars")
+    if not levels or not bars:
+        st.warning("No candle data for this symbol yet.")
+        return
+    df = pd.DataFrame(bars)
+    df["time"] = pd.to_datetime(df["time"], unit="s")
+
+    plot_candlestick(symbol, df, levels, data["last_close"], timeframe_choice, key=f"chart_{symbol}")
+
+    st.subheader("Calculation Table")
+    st.dataframe(pd.DataFrame({k:[v] for k,v in levels.items()}).style.format(precision=5), use_container_width=True)
+
+    st.subheader("Open Positions (this symbol)")
+    df_sym_pos = positions_view(df_pos, symbol)
+    if df_sym_pos.empty:
+        st.info("No open positions for this symbol.")
+    else:
+        st.dataframe(df_sym_pos.style.format(precision=2), use_container_width=True)
+
+    st.write("Last executed trade (engine):")
+    st.info(data.get("last_trade") or "No trade executed by the engine for symbol")
+
+
+# -----------------------
+# Logs toolbar + account bar
+# -----------------------
+# Static part: emitted once per full run. The toolbar and account bar are
+# rendered separately (and refreshed by fragments); collapsing is a CSS-only
+# toggle on the hidden checkbox, matched with :has() so the pieces don't
+# have to be siblings in one HTML block.
+TERMINAL_CSS = """
+<style>
+/* toolbar container */
+#toolbar-toggle-checkbox { display: none; }
+
+.right-toolbar {
+    position: fixed;
+    top: 70px;
+    right: 0;
+    width: 350px;
+    height: calc(100% - 70px);
+    background-color: #1e1e1e;
+    border-left: 2px solid #333;
+    display: flex;
+    flex-direction: column;
+    padding: 10px;
+    z-index: 999;
+    transition: width 0.20s ease, padding 0.20s ease;
+    box-sizing: border-box;
+}
+/* collapsed state when checkbox checked */
+body:has(#toolbar-toggle-checkbox:checked) .right-toolbar {
+    width: 0;
+    padding: 0;
+    border-left: none;
+    overflow: hidden;
+}
+
+.terminal-box {
+    background-color: #111111;
+    padding: 8px;
+    border-radius: 6px;
+    font-family: monospace;
+    font-size: 13px;
+    color: #00ff00;
+    overflow-y: auto;
+    box-sizing: border-box;
+}
+.execution-log { flex: 1; margin-bottom: 8px; }
+.check-log { flex: 1; }
+
+/* the visible toggle label */
+.toolbar-toggle {
+    position: fixed;
+    top: 50%;
+    right: 320px;
+    transform: translateY(-50%);
+    background-color: #333;
+    color: white;
+    padding: 6px 10px;
+    border-radius: 4px 0 0 4px;
+    cursor: pointer;
+    z-index: 1000;
+    font-size: 16px;
+    font-weight: bold;
+    display: inline-block;
+    user-select: none;
+}
+/* default symbol « for hide */
+.toolbar-toggle::after { content: '«'; }
+
+/* when checked (collapsed) change to » */
+body:has(#toolbar-toggle-checkbox:checked) .toolbar-toggle::after { content: '»'; }
+
+/* account bar positioning adjusts based on checkbox */
+#account-bar {
+    position: fixed;
+    bottom: 0;
+    left: 0;
+    right: 320px;
+    background-color: #f9f9f9;
+    border-top: 2px solid #ddd;
+    padding: 10px 20px;
+    display: flex;
+    justify-content: space-between;
+    align-items: center;
+    font-family: sans-serif;
+    z-index: 998;
+    transition: right 0.20s ease;
+    box-sizing: border-box;
+}
+body:has(#toolbar-toggle-checkbox:checked) #account-bar {
+    right: 0;
+}
+
+/* small responsiveness for narrow screens */
+@media (max-width: 900px) {
+    .right-toolbar { width: 260px; }
+    .toolbar-toggle { right: 260px; }
+    #account-bar { right: 260px; }
+    body:has(#toolbar-toggle-checkbox:checked) #account-bar { right: 0; }
+}
+</style>
+
+<!-- hidden checkbox controls state; the label toggles it -->
+<input id="toolbar-toggle-checkbox" type="checkbox">
+<label class="toolbar-toggle" for="toolbar-toggle-checkbox"></label>
+"""
+
+
+def render_terminal_css():
+    """Styles and the collapse toggle for the toolbar/account bar (once per full run)."""
+    st.markdown(TERMINAL_CSS, unsafe_allow_html=True)
+
+
+def log_toolbar_html(execution_logs, autotrade_logs):
+    """Right-hand toolbar: execution log + auto-trade checks (newest first)."""
+    logs_html = ""
+    checks_html = ""
+
+    # Execution logs (max 10, with spacing)
+    if execution_logs:
+        for log in reversed(execution_logs[-50:]):
+            logs_html += f"<div style='margin-bottom:10px; color:{log.get('color','white')};'>[{log['time']}] {log['msg']}</div>"
+    else:
+        logs_html = "<p style='color:#22db22'>No executed trades yet.</p>"
+
+    # Auto-trade checks (with separators, more entries allowed)
+    if autotrade_logs:
+        for log in reversed(autotrade_logs[-50:]):
+            if log.get("msg") == "----------------":
+                checks_html += "<div style='color:gray; margin:8px 0;'>----------------</div>"
+            else:
+                checks_html += f"<div style='margin-bottom:4px; color:{log.get('color','yellow')};border-bottom: 1px dotted #888; padding-bottom:5px;'>[{log['time']}] {log['msg']}</div>"
+    else:
+        checks_html = "<p style='color:#999'>No checks yet.</p>"
+
+    return f"""
+        <div class="right-toolbar">
+            <div class="terminal-box execution-log">
+                <h4 style='margin:0; color:white;'>📜 Execution Log</h4>
+                <hr style='border:1px solid gray;'>
+                {logs_html}
+            </div>
+            <div class="terminal-box check-log">
+                <h4 style='margin:0; color:white;'>🔍 Auto-Trade Checks</h4>
+                <hr style='border:1px solid gray;'>
+                {checks_html}
+            </div>
+        </div>
+        """
+
+
+def account_bar_html(account_info):
+    """Bottom account bar. `account_info` is the MT5 AccountInfo (or any object
+    with balance/equity/margin/profit) or None."""
+    if account_info:
+        balance_str = f"{account_info.balance:,.2f}"
+        equity_str = f"{account_info.equity:,.2f}"
+        margin_str = f"{account_info.margin:,.2f}"
+        total_pnl_val = account_info.profit
+        total_pnl_str = f"{total_pnl_val:,.2f}"
+        pnl_color = "blue" if total_pnl_val >= 0 else "red"
+        pnl_label = "📈 Profit" if total_pnl_val >= 0 else "📉 Loss"
+    else:
+        balance_str = equity_str = margin_str = total_pnl_str = "N/A"
+        pnl_color = "gray"
+        pnl_label = "Account"
+
+    return f"""
+        <div id="account-bar">
+            <div style="display:flex; gap:18px; align-items:center;">
+                <div style="text-align:center;">
+                    <div style="font-size:14px;color:gray;">💰 Balance</div>
+                    <div style="font-size:18px;font-weight:bold;">{balance_str}</div>
+                </div>
+                <div style="text-align:center;">
+                    <div style="font-size:14px;color:gray;">📊 Equity</div>
+                    <div style="font-size:18px;font-weight:bold;">{equity_str}</div>
+                </div>
+                <div style="text-align:center;">
+                    <div style="font-size:14px;color:gray;">📉 Margin</div>
+                    <div style="font-size:18px;font-weight:bold;">{margin_str}</div>
+                </div>
+                <div style="text-align:center;">
+                    <div style="font-size:14px;color:gray;">{pnl_label}</div>
+                    <div style="font-size:18px;font-weight:bold;color:{pnl_color};">{total_pnl_str}</div>
+                </div>
+            </div>
+            <div style="font-size:13px;color:gray;white-space:nowrap;">
+                © Umer Farid ™ | All Rights Reserved
+            </div>
+        </div>
+        """
+
+
+def render_terminals(execution_logs, autotrade_logs, account_info):
+    """
+    Fixed right-hand toolbar (execution log + auto-trade checks) and the
+    account bar in one go (used by the viewer, which reruns as a whole).
+    """
+    render_terminal_css()
+    st.markdown(log_toolbar_html(execution_logs, autotrade_logs) + account_bar_html(account_info),
+                unsafe_allow_html=True)